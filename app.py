@@ -2,9 +2,12 @@ import os
 
 from flask import Flask, redirect, url_for
 
-from samosval.db import init_app as init_db_app, init_db_if_needed
+from samosval.audit import archive_command
+from samosval.db import check_query_plans_command, init_app as init_db_app, init_db_if_needed
 from samosval.auth import login_manager
+from samosval.simulator import clock, logstore, state, stateservice, tsstore, wakeup
 from samosval.simulator.engine import SimulationEngine
+from samosval.simulator.worker import engine_command, runtime_command
 from samosval.routes.auth_routes import auth_bp
 from samosval.routes.dashboard_routes import dashboard_bp
 from samosval.routes.request_routes import requests_bp
@@ -27,6 +30,38 @@ def create_app() -> Flask:
     app.config.from_mapping(
         SECRET_KEY="dev-secret-change-me",
         DATABASE=os.path.join(app.instance_path, "samosval.sqlite3"),
+        BUILD_WORKERS=int(os.environ.get("SAMOSVAL_BUILD_WORKERS", "4")),
+        # inline: this process runs the full engine; runtime: only runtime
+        # logs/metrics (lifecycle handled by `flask engine` workers); off: none
+        ENGINE_MODE=os.environ.get("SAMOSVAL_ENGINE", "inline"),
+        ENGINE_WAKEUP_DIR=os.path.join(app.instance_path, "engine-wakeup"),
+        # wall: real time; warp: virtual clock, ticks run back-to-back
+        SIMULATOR_CLOCK=os.environ.get("SAMOSVAL_CLOCK", "wall"),
+        SIMULATOR_SEED=(
+            int(os.environ["SAMOSVAL_SEED"]) if os.environ.get("SAMOSVAL_SEED") else None
+        ),
+        # on-disk metrics history (separate SQLite file); empty to disable
+        METRICS_DB=os.environ.get(
+            "SAMOSVAL_METRICS_DB", os.path.join(app.instance_path, "metrics.sqlite3")
+        ),
+        METRICS_RAW_RETENTION_HOURS=24,
+        METRICS_ROLLUP_RETENTION_DAYS=30,
+        # runtime log history in size-rotated segment files; empty to disable
+        LOG_DIR=os.environ.get("SAMOSVAL_LOG_DIR", os.path.join(app.instance_path, "logs")),
+        LOG_SEGMENT_BYTES=1024 * 1024,
+        LOG_MAX_SEGMENTS=32,
+        # in-memory buffers: shrink those idle this long, evict LRU past the budget
+        STATE_IDLE_COMPACT_MINUTES=15,
+        STATE_MEMORY_BUDGET_MB=int(os.environ.get("SAMOSVAL_STATE_MEMORY_MB", "256")),
+        # Unix socket of the `flask runtime` process owning runtime logs and
+        # metrics; when set, this process reads and writes them through it
+        STATE_SOCKET=os.environ.get("SAMOSVAL_STATE_SOCKET", ""),
+        # audit rows older than this move to gzip'd monthly NDJSON archives
+        # (empty dir: keep everything in the table)
+        AUDIT_RETENTION_DAYS=int(os.environ.get("SAMOSVAL_AUDIT_RETENTION_DAYS", "90")),
+        AUDIT_ARCHIVE_DIR=os.environ.get(
+            "SAMOSVAL_AUDIT_ARCHIVE_DIR", os.path.join(app.instance_path, "audit-archive")
+        ),
     )
 
     os.makedirs(app.instance_path, exist_ok=True)
@@ -54,9 +89,37 @@ def create_app() -> Flask:
     with app.app_context():
         init_db_if_needed()
 
-    # Start simulation engine
-    engine = SimulationEngine(app)
-    engine.start()
+    # Simulation engine
+    wakeup.configure(app.config["ENGINE_WAKEUP_DIR"])
+    tsstore.configure(
+        app.config["METRICS_DB"] or None,
+        raw_retention_hours=app.config["METRICS_RAW_RETENTION_HOURS"],
+        rollup_retention_days=app.config["METRICS_ROLLUP_RETENTION_DAYS"],
+    )
+    logstore.configure(
+        app.config["LOG_DIR"] or None,
+        segment_bytes=app.config["LOG_SEGMENT_BYTES"],
+        max_segments=app.config["LOG_MAX_SEGMENTS"],
+    )
+    state.configure_limits(
+        idle_compact_seconds=app.config["STATE_IDLE_COMPACT_MINUTES"] * 60,
+        memory_budget_bytes=app.config["STATE_MEMORY_BUDGET_MB"] * 1024 * 1024,
+    )
+    if app.config["SIMULATOR_CLOCK"] == "warp":
+        clock.set_clock(clock.VirtualClock())
+    app.cli.add_command(engine_command)
+    app.cli.add_command(runtime_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(archive_command)
+    mode = app.config["ENGINE_MODE"]
+    # with a state service, runtime generation belongs to `flask runtime`
+    runtime = not app.config["STATE_SOCKET"]
+    if not runtime:
+        stateservice.connect(app.config["STATE_SOCKET"])
+    if mode == "inline" or (mode == "runtime" and runtime):
+        engine = SimulationEngine(app, lifecycle=(mode == "inline"), runtime=runtime)
+        app.extensions["samosval_engine"] = engine
+        engine.start()
 
     return app
 
@@ -0,0 +1,134 @@
+"""
+App database read/write throughput with concurrent readers and writers.
+
+"before" opens a plain connection per operation on a rollback-journal
+database, like get_db() used to per request; "after" uses the pooled WAL
+connections of samosval.db. Readers run list-page queries, writers the
+engine's kind of transaction (status updates plus audit rows).
+
+Usage: python benchmarks/db_concurrency.py [readers] [writers] [seconds]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from samosval import db as dbm  # noqa: E402
+
+DEPLOYMENTS = 2000
+AUDIT_ROWS = 20000
+NOW = "2024-01-01T00:00:00"
+
+
+def _create(path: str, wal: bool) -> None:
+    db = dbm.connect(path)
+    if not wal:
+        db.execute("PRAGMA journal_mode=DELETE")
+    with open(os.path.join(ROOT, "schema.sql")) as f:
+        db.executescript(f.read())
+    dbm.migrate(db)
+    db.close()
+    db = dbm.connect(path)
+    db.execute(
+        "INSERT INTO users (username, password_hash, role, is_active, created_at)"
+        " VALUES ('root', 'x', 'admin', 1, ?)",
+        (NOW,),
+    )
+    db.executemany(
+        "INSERT INTO deployments (image_id, name, environment, status, replicas, ports,"
+        " stopped_by_operator, needs_restart, created_at, updated_at)"
+        " VALUES (1, ?, 'dev', ?, 1, '', 0, 0, ?, ?)",
+        [(f"d{i}", "running" if i % 4 else "deploying", NOW, NOW) for i in range(DEPLOYMENTS)],
+    )
+    db.executemany(
+        dbm.AUDIT_INSERT_SQL,
+        [(1, f"action_{i % 20}", i, "details", NOW) for i in range(AUDIT_ROWS)],
+    )
+    db.commit()
+    db.close()
+
+
+def _plain(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    return db
+
+
+def _read(db: sqlite3.Connection) -> None:
+    db.execute("SELECT * FROM audit_log ORDER BY created_at DESC LIMIT 200").fetchall()
+    db.execute("SELECT id, name FROM deployments WHERE status = 'running' ORDER BY id").fetchall()
+
+
+def _write(db: sqlite3.Connection, n: int) -> None:
+    db.execute(
+        "UPDATE deployments SET updated_at = ? WHERE id = ?", (NOW, n % DEPLOYMENTS + 1)
+    )
+    dbm.insert_audit_rows(db, [(None, "bench", n, "tick", NOW)] * 5)
+    db.commit()
+
+
+def run(path: str, pooled: bool, readers: int, writers: int, seconds: float) -> dict:
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def worker(write: bool) -> None:
+        done = errors = 0
+        while time.perf_counter() < stop:
+            db = dbm.thread_connection(path) if pooled else _plain(path)
+            try:
+                if write:
+                    if pooled:
+                        dbm.retry_on_busy(_write)(db, done)
+                    else:
+                        _write(db, done)
+                else:
+                    _read(db)
+                done += 1
+            except sqlite3.OperationalError:
+                errors += 1
+                if db.in_transaction:
+                    db.rollback()
+            finally:
+                if not pooled:
+                    db.close()
+        with lock:
+            counts["writes" if write else "reads"] += done
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=worker, args=(False,)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=(True,)) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {k: v / seconds if k != "errors" else v for k, v in counts.items()}
+
+
+def main(argv: list[str]) -> None:
+    readers = int(argv[0]) if len(argv) > 0 else 8
+    writers = int(argv[1]) if len(argv) > 1 else 2
+    seconds = float(argv[2]) if len(argv) > 2 else 5.0
+    print(f"{readers} readers, {writers} writers, {seconds:g}s each")
+    print(f"{'mode':>8} {'reads/s':>10} {'writes/s':>10} {'errors':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, wal in (("before", False), ("after", True)):
+            path = os.path.join(tmp, f"{mode}.sqlite3")
+            _create(path, wal)
+            result = run(path, wal, readers, writers, seconds)
+            print(
+                f"{mode:>8} {result['reads']:>10.0f} {result['writes']:>10.0f}"
+                f" {result['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+
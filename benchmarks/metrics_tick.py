@@ -0,0 +1,40 @@
+"""
+Runtime metrics tick time vs. number of running deployments.
+
+Usage: python benchmarks/metrics_tick.py [count ...]
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from samosval.simulator import state  # noqa: E402
+from samosval.simulator.metrics_gen import BatchedMetricsGenerator  # noqa: E402
+
+
+def bench(count: int, ticks: int = 20) -> float:
+    """Return mean milliseconds per tick for `count` deployments."""
+    gen = BatchedMetricsGenerator()
+    ids = list(range(1, count + 1))
+    gen.step(ids, datetime.utcnow())  # warm-up: allocates buffers
+    started = time.perf_counter()
+    for _ in range(ticks):
+        gen.step(ids, datetime.utcnow())
+    return (time.perf_counter() - started) * 1000.0 / ticks
+
+
+def main(argv: list[str]) -> None:
+    counts = [int(a) for a in argv] or [100, 1000, 5000, 10000, 20000]
+    print(f"{'deployments':>12} {'ms/tick':>10}")
+    for count in counts:
+        print(f"{count:>12} {bench(count):>10.2f}")
+        state._deployment_metrics.clear()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+
@@ -0,0 +1,163 @@
+"""
+Load test for the deployment log stream: open many concurrent SSE
+connections, keep them idle, and report how many the server held, how fast
+they connected and whether live lines kept flowing to all of them.
+
+Start the server first, e.g.
+
+    uvicorn --factory samosval.asgi:create_asgi_app --port 8000 --no-access-log
+
+then
+
+    python benchmarks/sse_load.py --connections 10000 --deployment 1 --duration 60
+
+Use --server-pid to also report the server's resident memory.
+"""
+
+import argparse
+import asyncio
+import http.cookiejar
+import resource
+import statistics
+import time
+import urllib.parse
+import urllib.request
+
+
+def login(base_url: str, username: str, password: str) -> str:
+    """Log in through the HTML form and return the Cookie header value."""
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    opener.open(base_url + "/login", data=data).read()
+    cookies = "; ".join(f"{c.name}={c.value}" for c in jar)
+    if not cookies:
+        raise SystemExit("login failed: no session cookie")
+    return cookies
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.open = 0
+        self.failed = 0
+        self.connect_ms: list[float] = []
+        self.events = 0
+        self.keepalives = 0
+        # connections that received at least one live line after connecting
+        self.live: set[int] = set()
+
+
+async def client(i: int, host: str, port: int, path: str, cookie: str, stats: Stats, stop: asyncio.Event) -> None:
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\n"
+                "Accept: text/event-stream\r\n\r\n"
+            ).encode()
+        )
+        status = await reader.readline()
+        if b" 200 " not in status:
+            raise ConnectionError(status.decode().strip())
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+    except (OSError, ConnectionError, asyncio.IncompleteReadError):
+        stats.failed += 1
+        return
+    stats.connected += 1
+    stats.open += 1
+    stats.connect_ms.append((time.perf_counter() - started) * 1000.0)
+    backfilled = False
+    try:
+        while not stop.is_set():
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), timeout=1.0)
+            except asyncio.TimeoutError:
+                backfilled = True
+                continue
+            if not chunk:
+                break
+            stats.events += chunk.count(b"\ndata: ")
+            stats.keepalives += chunk.count(b": keep-alive")
+            if backfilled and b"\ndata: " in chunk:
+                stats.live.add(i)
+            backfilled = True
+    finally:
+        stats.open -= 1
+        writer.close()
+
+
+async def main(args: argparse.Namespace) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.connections + 100 > hard:
+        print(f"warning: RLIMIT_NOFILE hard limit is {hard}")
+
+    url = urllib.parse.urlsplit(args.url)
+    cookie = login(args.url, args.username, args.password)
+    path = f"/api/deployments/{args.deployment}/logs/stream"
+    if args.after is not None:
+        path += f"?after={args.after}"
+    stats = Stats()
+    stop = asyncio.Event()
+
+    tasks = []
+    t0 = time.perf_counter()
+    for i in range(args.connections):
+        tasks.append(asyncio.create_task(client(i, url.hostname, url.port or 80, path, cookie, stats, stop)))
+        if i % args.ramp == args.ramp - 1:
+            await asyncio.sleep(0.05)
+    while stats.connected + stats.failed < args.connections:
+        await asyncio.sleep(0.1)
+    ramp_s = time.perf_counter() - t0
+    print(f"connected {stats.connected}/{args.connections} in {ramp_s:.1f}s, failed {stats.failed}")
+    if stats.connect_ms:
+        ms = sorted(stats.connect_ms)
+        print(
+            f"connect ms: p50 {statistics.median(ms):.1f}  "
+            f"p99 {ms[int(len(ms) * 0.99) - 1]:.1f}  max {ms[-1]:.1f}"
+        )
+    if args.server_pid:
+        print(f"server RSS with {stats.open} open streams: {rss_mb(args.server_pid):.0f} MB")
+
+    events_before = stats.events
+    await asyncio.sleep(args.duration)
+    print(
+        f"after {args.duration}s: open {stats.open}, "
+        f"live lines {stats.events - events_before}, keep-alives {stats.keepalives}, "
+        f"streams that got live lines {len(stats.live)}"
+    )
+    if args.server_pid:
+        print(f"server RSS: {rss_mb(args.server_pid):.0f} MB")
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", default="root")
+    parser.add_argument("--password", default="root")
+    parser.add_argument("--deployment", type=int, default=1)
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument(
+        "--after",
+        type=int,
+        help="resume cursor sent as ?after= (default: backfill the whole buffer)",
+    )
+    parser.add_argument("--ramp", type=int, default=500, help="connections opened per 50 ms")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--server-pid", type=int)
+    asyncio.run(main(parser.parse_args()))
+
+
@@ -0,0 +1,293 @@
+"""
+ASGI serving path for the long-lived API endpoints.
+
+Run with:
+
+    uvicorn --factory samosval.asgi:create_asgi_app --port 8000
+
+The deployment log stream, deployment metrics and build log endpoints are
+served natively on asyncio: an open log stream is a coroutine waiting on
+the log hub, not a thread, so one process holds tens of thousands of idle
+viewers. Every other path goes to the regular Flask app through asgiref's
+WSGI adapter. Responses are built by `samosval.payloads`, the same helpers
+the Flask routes use.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+from http.cookies import SimpleCookie
+from typing import Any, Awaitable, Callable, Dict, List
+from urllib.parse import parse_qs, quote
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+
+from . import payloads
+from .db import thread_connection
+from .simulator import loghub
+
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_LOG_STREAM = re.compile(r"^/api/deployments/(\d+)/logs/stream$")
+_METRICS = re.compile(r"^/api/deployments/(\d+)/metrics$")
+_BUILD_LOG = re.compile(r"^/api/builds/(\d+)/log$")
+
+
+class _Wakeups:
+    """
+    Coalesces log hub wakeups from engine threads into the event loop.
+
+    A published line may wake thousands of subscriptions; instead of one
+    `call_soon_threadsafe` (a self-pipe write) per subscription, pending
+    events are collected and set in a single loop callback.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending: List[asyncio.Event] = []
+        self._scheduled = False
+
+    def waker_for(self, event: asyncio.Event) -> Callable[[], None]:
+        return lambda: self._wake(event)
+
+    def _wake(self, event: asyncio.Event) -> None:
+        with self._lock:
+            self._pending.append(event)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._loop.call_soon_threadsafe(self._flush)
+
+    def _flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._scheduled = False
+        for event in pending:
+            event.set()
+
+
+class SamosvalASGI:
+    def __init__(self, flask_app: Flask):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self._wakeups: _Wakeups | None = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.wsgi(scope, receive, send)
+            return
+
+        path = scope["path"]
+        for pattern, handler in (
+            (_LOG_STREAM, self._logs_stream),
+            (_METRICS, self._metrics),
+            (_BUILD_LOG, self._build_log),
+        ):
+            m = pattern.match(path)
+            if m:
+                break
+        else:
+            await self.wsgi(scope, receive, send)
+            return
+
+        headers = _headers(scope)
+        if not await self._run_db(self._is_logged_in, headers.get("cookie", "")):
+            # same as flask_login.login_required with login_view set
+            target = path + ("?" + scope["query_string"].decode("latin-1") if scope["query_string"] else "")
+            await _respond(send, 302, b"", [(b"location", f"/login?next={quote(target)}".encode())])
+            return
+        await handler(scope, receive, send, int(m.group(1)), headers)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # -- database -----------------------------------------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        """Per-thread connection for the executor threads."""
+        return thread_connection(self.flask_app.config["DATABASE"])
+
+    async def _run_db(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.to_thread(fn, *args)
+
+    def _is_logged_in(self, cookie_header: str) -> bool:
+        """Resolve the Flask-Login session cookie to an existing user."""
+        app = self.flask_app
+        cookie = SimpleCookie()
+        try:
+            cookie.load(cookie_header)
+        except Exception:
+            return False
+        morsel = cookie.get(app.config["SESSION_COOKIE_NAME"])
+        serializer = app.session_interface.get_signing_serializer(app)
+        if morsel is None or serializer is None:
+            return False
+        try:
+            session = serializer.loads(
+                morsel.value,
+                max_age=int(app.permanent_session_lifetime.total_seconds()),
+            )
+        except Exception:
+            return False
+        user_id = session.get("_user_id")
+        if user_id is None:
+            return False
+        row = self._db().execute("SELECT id FROM users WHERE id = ?", (user_id,)).fetchone()
+        return row is not None
+
+    def _deployment_exists(self, deployment_id: int) -> bool:
+        return payloads.deployment_exists(self._db(), deployment_id)
+
+    # -- endpoints ----------------------------------------------------------
+
+    async def _metrics(self, scope: Scope, receive: Receive, send: Send, deployment_id: int, headers) -> None:
+        if not await self._run_db(self._deployment_exists, deployment_id):
+            await _not_found(send)
+            return
+        try:
+            query = payloads.parse_metrics_query(_query(scope))
+        except ValueError as exc:
+            await _json(send, {"error": str(exc)}, status=400)
+            return
+        # both may be a round trip to the state service (or read tsstore
+        # files): off the event loop, which serves every open stream
+        etag = await asyncio.to_thread(payloads.metrics_etag, deployment_id, query)
+        if payloads.etag_matches(headers.get("if-none-match"), etag):
+            await _respond(send, 304, b"", _revalidate_headers(etag))
+            return
+        payload, etag = await asyncio.to_thread(payloads.metrics_payload, deployment_id, query)
+        await _json(send, payload, _revalidate_headers(etag))
+
+    async def _build_log(self, scope: Scope, receive: Receive, send: Send, build_id: int, headers) -> None:
+        after = payloads.parse_cursor(_query(scope).get("after"))
+        payload = await self._run_db(
+            lambda: payloads.build_log_payload(self._db(), build_id, after)
+        )
+        if payload is None:
+            await _not_found(send)
+            return
+        await _json(send, payload)
+
+    async def _logs_stream(self, scope: Scope, receive: Receive, send: Send, deployment_id: int, headers) -> None:
+        if not await self._run_db(self._deployment_exists, deployment_id):
+            await _not_found(send)
+            return
+        after = payloads.parse_cursor(headers.get("last-event-id"))
+        if after is None:
+            after = payloads.parse_cursor(_query(scope).get("after")) or 0
+        try:
+            min_level = payloads.parse_level(_query(scope).get("level"))
+        except ValueError as exc:
+            await _json(send, {"error": str(exc)}, status=400)
+            return
+
+        if self._wakeups is None:
+            self._wakeups = _Wakeups(asyncio.get_running_loop())
+        ready = asyncio.Event()
+        closed = False
+
+        async def watch_disconnect() -> None:
+            nonlocal closed
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            closed = True
+            ready.set()
+
+        sub = loghub.subscribe(deployment_id, self._wakeups.waker_for(ready), min_level)
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8")]
+                    + [(k.lower().encode(), v.encode()) for k, v in payloads.SSE_HEADERS.items()],
+                }
+            )
+            # may query the state service or read log segments from disk
+            events, cursor = await asyncio.to_thread(
+                payloads.sse_backfill, deployment_id, after, min_level
+            )
+            await _send_chunk(send, events)
+            while not closed:
+                try:
+                    async with asyncio.timeout(loghub.KEEPALIVE_SECONDS):
+                        await ready.wait()
+                except TimeoutError:
+                    await _send_chunk(send, [payloads.SSE_KEEPALIVE])
+                    continue
+                ready.clear()
+                if closed:
+                    break
+                items, missed = sub.drain()
+                events, cursor = payloads.sse_live(items, missed, cursor)
+                if events:
+                    await _send_chunk(send, events)
+        except OSError:
+            # server reports a write to a closed connection
+            pass
+        finally:
+            loghub.unsubscribe(sub)
+            watcher.cancel()
+
+
+def _headers(scope: Scope) -> Dict[str, str]:
+    return {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+
+
+def _query(scope: Scope) -> Dict[str, str]:
+    parsed = parse_qs(scope["query_string"].decode("latin-1"))
+    return {k: v[-1] for k, v in parsed.items()}
+
+
+async def _respond(send: Send, status: int, body: bytes, headers: list) -> None:
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _json(send: Send, data: Any, headers: list | None = None, status: int = 200) -> None:
+    body = json.dumps(data, separators=(",", ":")).encode()
+    await _respond(send, status, body, [(b"content-type", b"application/json")] + (headers or []))
+
+
+def _revalidate_headers(etag: str) -> list:
+    return [(b"etag", f'"{etag}"'.encode())] + [
+        (k.lower().encode(), v.encode()) for k, v in payloads.REVALIDATE_HEADERS.items()
+    ]
+
+
+async def _not_found(send: Send) -> None:
+    await _respond(send, 404, b"Not Found", [(b"content-type", b"text/plain")])
+
+
+async def _send_chunk(send: Send, events: List[str]) -> None:
+    await send({"type": "http.response.body", "body": "".join(events).encode(), "more_body": True})
+
+
+def create_asgi_app(flask_app: Flask | None = None) -> SamosvalASGI:
+    """ASGI application; builds the Flask app (and its engine) if not given."""
+    if flask_app is None:
+        from app import create_app
+
+        flask_app = create_app()
+    return SamosvalASGI(flask_app)
+
+
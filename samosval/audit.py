@@ -0,0 +1,316 @@
+"""
+Audit log queries for the admin audit page.
+
+Pages are read newest first with keyset pagination on (created_at, id):
+the cursor is the last row of the previous page, so every page costs the
+same however deep it is. Text search goes through the `audit_log_fts`
+full-text index (prefix match on each word) and the action filter list
+comes from `audit_actions`; triggers keep both in sync with inserts
+(db.MIGRATIONS, step 3). Databases whose SQLite lacks FTS5 fall back to
+LIKE.
+
+Rows older than AUDIT_RETENTION_DAYS are moved out of the table into
+append-only archives, one gzip'd NDJSON file per month
+(`audit-YYYY-MM.ndjson.gz`, one gzip member per archiving batch), so the
+table only holds recent history. Archived months are searched on demand
+by reading their files.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import gzip
+import itertools
+import json
+import os
+import re
+import sqlite3
+from datetime import timedelta
+from typing import Iterator
+
+import click
+from flask import current_app
+
+from .db import begin_write, get_db
+from .simulator import clock
+
+
+PAGE_SIZE = 200
+# Rows moved per archive transaction, and how often the engine archives.
+ARCHIVE_BATCH_ROWS = 5000
+ARCHIVE_INTERVAL_SECONDS = 3600
+# Batches the engine moves per pass; a longer backlog carries over to the
+# next passes instead of stalling the tick (`flask audit-archive` has no cap).
+ARCHIVE_ENGINE_BATCHES = 2
+
+_ARCHIVE_NAME = re.compile(r"audit-(\d{4}-\d{2})\.ndjson\.gz$")
+_last_archive: float | None = None
+
+_WORD = re.compile(r"\w+")
+
+
+def parse_cursor(value: str | None) -> tuple[str, int] | None:
+    """`<created_at>,<id>` from a previous page; ValueError if malformed."""
+    if not value:
+        return None
+    created_at, _, row_id = value.rpartition(",")
+    if not created_at:
+        raise ValueError("before must be <created_at>,<id>")
+    return created_at, int(row_id)
+
+
+def format_cursor(row) -> str:
+    return f"{row['created_at']},{row['id']}"
+
+
+def has_fts(db: sqlite3.Connection) -> bool:
+    return (
+        db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audit_log_fts'"
+        ).fetchone()
+        is not None
+    )
+
+
+def fts_query(text: str) -> str | None:
+    """FTS5 query matching rows containing every word of `text` as a prefix."""
+    words = _WORD.findall(text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search(
+    db: sqlite3.Connection,
+    user_login: str = "",
+    action: str = "",
+    text: str = "",
+    before: tuple[str, int] | None = None,
+    limit: int = PAGE_SIZE,
+) -> tuple[list[sqlite3.Row], str | None]:
+    """
+    One page of audit rows, newest first, and the cursor of the next
+    (older) page or None when this is the last one.
+    """
+    where = []
+    params: list = []
+    if user_login:
+        where.append("a.user_id = (SELECT id FROM users WHERE username = ?)")
+        params.append(user_login)
+    if action:
+        where.append("a.action = ?")
+        params.append(action)
+    if text:
+        match = fts_query(text) if has_fts(db) else None
+        if match is not None:
+            where.append(
+                "a.id IN (SELECT rowid FROM audit_log_fts WHERE audit_log_fts MATCH ?)"
+            )
+            params.append(match)
+        else:
+            where.append("(a.details LIKE ? OR a.action LIKE ?)")
+            like = f"%{text}%"
+            params.extend([like, like])
+    if before is not None:
+        where.append("(a.created_at, a.id) < (?, ?)")
+        params.extend(before)
+
+    rows = db.execute(
+        f"""
+        SELECT a.*, u.username
+          FROM audit_log a
+          LEFT JOIN users u ON a.user_id = u.id
+         WHERE {" AND ".join(where) or "1=1"}
+         ORDER BY a.created_at DESC, a.id DESC
+         LIMIT ?
+        """,
+        (*params, limit + 1),
+    ).fetchall()
+    if len(rows) > limit:
+        return rows[:limit], format_cursor(rows[limit - 1])
+    return rows, None
+
+
+def actions(db: sqlite3.Connection) -> list[str]:
+    """Every action ever recorded, for the filter list."""
+    return [r[0] for r in db.execute("SELECT action FROM audit_actions ORDER BY action")]
+
+
+# --- retention -------------------------------------------------------------
+
+
+def archive_path(archive_dir: str, month: str) -> str:
+    return os.path.join(archive_dir, f"audit-{month}.ndjson.gz")
+
+
+def archive_months(archive_dir: str | None) -> list[str]:
+    """Archived months ("YYYY-MM"), newest first."""
+    if not archive_dir or not os.path.isdir(archive_dir):
+        return []
+    names = (_ARCHIVE_NAME.match(name) for name in os.listdir(archive_dir))
+    return sorted((m.group(1) for m in names if m), reverse=True)
+
+
+def _append_archive(path: str, rows: list[dict]) -> None:
+    data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+    with open(path, "ab") as raw:
+        # appending adds a gzip member; readers see one continuous stream
+        with gzip.GzipFile(fileobj=raw, mode="ab") as f:
+            f.write(data.encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archive(
+    db: sqlite3.Connection, archive_dir: str, before: str, max_batches: int | None = None
+) -> int:
+    """
+    Move audit rows created before `before` (ISO timestamp) to the monthly
+    archives, at most `max_batches` batches of ARCHIVE_BATCH_ROWS when set;
+    return how many moved. Each batch is on disk before its rows are
+    deleted, so a crash in between only duplicates rows in the archive
+    (readers skip repeated ids). Returns 0 while another process archives.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(os.path.join(archive_dir, ".lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        moved = batches = 0
+        drained = False
+        while max_batches is None or batches < max_batches:
+            rows = db.execute(
+                """
+                SELECT a.id, a.user_id, u.username, a.action, a.target_id,
+                       a.details, a.created_at
+                  FROM audit_log a
+                  LEFT JOIN users u ON a.user_id = u.id
+                 WHERE a.created_at < ?
+                 ORDER BY a.created_at, a.id
+                 LIMIT ?
+                """,
+                (before, ARCHIVE_BATCH_ROWS),
+            ).fetchall()
+            if not rows:
+                drained = True
+                break
+            for month, group in itertools.groupby(rows, key=lambda r: r["created_at"][:7]):
+                _append_archive(archive_path(archive_dir, month), [dict(r) for r in group])
+            begin_write(db)
+            try:
+                db.executemany("DELETE FROM audit_log WHERE id = ?", [(r["id"],) for r in rows])
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+            moved += len(rows)
+            batches += 1
+        if moved and drained and has_fts(db):
+            # merge the index segments left behind by the deletes, once the
+            # backlog is gone
+            begin_write(db)
+            db.execute("INSERT INTO audit_log_fts (audit_log_fts) VALUES ('optimize')")
+            db.commit()
+    return moved
+
+
+def archive_if_due(db: sqlite3.Connection, archive_dir: str | None, retention_days: int) -> int:
+    """
+    archive() up to ARCHIVE_ENGINE_BATCHES batches of rows past the
+    retention age, every ARCHIVE_INTERVAL_SECONDS, or on every call while
+    the previous one left rows behind.
+    """
+    global _last_archive
+    now = clock.get_clock().monotonic()
+    if not archive_dir or (
+        _last_archive is not None and now - _last_archive < ARCHIVE_INTERVAL_SECONDS
+    ):
+        return 0
+    _last_archive = now
+    cutoff = (clock.now() - timedelta(days=retention_days)).isoformat(timespec="seconds")
+    moved = archive(db, archive_dir, cutoff, max_batches=ARCHIVE_ENGINE_BATCHES)
+    if moved >= ARCHIVE_ENGINE_BATCHES * ARCHIVE_BATCH_ROWS:
+        # backlog left: continue on the next call
+        _last_archive = None
+    return moved
+
+
+def _read_archive(path: str) -> Iterator[dict]:
+    seen = set()
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if row["id"] not in seen:
+                    seen.add(row["id"])
+                    yield row
+    except (EOFError, json.JSONDecodeError):
+        # a batch cut short by a crash; its rows are still in the table
+        return
+
+
+def search_archive(
+    archive_dir: str | None,
+    month: str,
+    user_login: str = "",
+    action: str = "",
+    text: str = "",
+    before: tuple[str, int] | None = None,
+    limit: int = PAGE_SIZE,
+) -> tuple[list[dict], str | None]:
+    """
+    Like search(), over the archived `month` ("YYYY-MM") or every archived
+    month ("all"). Text matches as a case-insensitive substring.
+    """
+    months = archive_months(archive_dir)
+    if month != "all":
+        months = [m for m in months if m == month]
+    needle = text.lower()
+    found: list[dict] = []
+    for m in months:
+        if before is not None and m > before[0][:7]:
+            continue
+        matches = [
+            row
+            for row in _read_archive(archive_path(archive_dir, m))
+            if (not user_login or row["username"] == user_login)
+            and (not action or row["action"] == action)
+            and (
+                not needle
+                or needle in (row["details"] or "").lower()
+                or needle in row["action"].lower()
+            )
+            and (before is None or (row["created_at"], row["id"]) < before)
+        ]
+        matches.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+        found += matches
+        if len(found) > limit:
+            return found[:limit], format_cursor(found[limit - 1])
+    return found, None
+
+
+@click.command("audit-archive")
+@click.option(
+    "--days",
+    type=int,
+    default=None,
+    help="Archive rows older than this many days [default: AUDIT_RETENTION_DAYS].",
+)
+@click.option("--vacuum", is_flag=True, help="VACUUM the database afterwards to return space.")
+def archive_command(days: int | None, vacuum: bool) -> None:
+    """Move old audit rows to the compressed monthly archives now."""
+    archive_dir = current_app.config["AUDIT_ARCHIVE_DIR"]
+    if not archive_dir:
+        raise click.UsageError("AUDIT_ARCHIVE_DIR is not set")
+    if days is None:
+        days = current_app.config["AUDIT_RETENTION_DAYS"]
+    cutoff = (clock.now() - timedelta(days=days)).isoformat(timespec="seconds")
+    db = get_db()
+    moved = archive(db, archive_dir, cutoff)
+    click.echo(f"Archived {moved} audit rows older than {cutoff} to {archive_dir}")
+    if vacuum:
+        db.execute("VACUUM")
+        click.echo("Database vacuumed")
+
+
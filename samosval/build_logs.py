@@ -0,0 +1,71 @@
+"""
+Append-only build log storage.
+
+Build output is kept in `build_log_chunks` as numbered chunks (one or more
+"\\n"-terminated lines each). Writers only insert new chunks; readers ask for
+everything after a chunk sequence number. `builds.build_log` is only read as
+a legacy prefix for builds created before chunked storage existed.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+
+from .simulator import clock
+
+
+_APPEND_SQL = """
+    INSERT INTO build_log_chunks (build_id, seq, content, created_at)
+    SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?
+      FROM build_log_chunks
+     WHERE build_id = ?
+"""
+
+
+def append_chunks(db: sqlite3.Connection, chunks: list[tuple[int, str]]) -> None:
+    """
+    Append (build_id, text) chunks without committing.
+
+    Sequence numbers are assigned per build in insertion order; the caller
+    owns the surrounding transaction.
+    """
+    if not chunks:
+        return
+    now = clock.isonow()
+    db.executemany(
+        _APPEND_SQL,
+        [(build_id, text, now, build_id) for build_id, text in chunks],
+    )
+
+
+def read_log(
+    db: sqlite3.Connection, build_id: int, after: int | None = None
+) -> tuple[str, int]:
+    """
+    Return (text, last_seq) for a build.
+
+    With `after=None` the full log is returned, legacy `builds.build_log`
+    prefix included. Otherwise only chunks with seq > after are returned.
+    `last_seq` is the cursor to pass as `after` on the next call.
+    """
+    parts: list[str] = []
+    if after is None:
+        legacy = db.execute(
+            "SELECT build_log FROM builds WHERE id = ?", (build_id,)
+        ).fetchone()
+        if legacy and legacy["build_log"]:
+            parts.append(legacy["build_log"])
+        after = 0
+
+    rows = db.execute(
+        """
+        SELECT seq, content
+          FROM build_log_chunks
+         WHERE build_id = ? AND seq > ?
+         ORDER BY seq ASC
+        """,
+        (build_id, after),
+    ).fetchall()
+    parts.extend(r["content"] for r in rows)
+    last_seq = rows[-1]["seq"] if rows else after
+    return "".join(parts), last_seq
@@ -1,37 +1,342 @@
+import atexit
+import functools
+import logging
 import os
 import sqlite3
-from datetime import datetime
+import threading
+import time
 
+import click
 from flask import current_app, g
 from werkzeug.security import generate_password_hash
 
+from .simulator import clock
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds a connection waits for another one's write lock before "database
+# is locked"; writes wrapped in retry_on_busy() then retry a few times.
+BUSY_TIMEOUT_SECONDS = 5.0
+BUSY_RETRIES = 3
+BUSY_RETRY_DELAY_SECONDS = 0.05
+# Per-connection page cache and memory-mapped I/O size.
+CACHE_SIZE_KIB = 16 * 1024
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+
+_local = threading.local()
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    New connection to the app database. WAL lets readers run while the
+    engine writes; synchronous=NORMAL is durable across app crashes and
+    only loses the last commits on power loss.
+    """
+    db = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_SECONDS,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,
+    )
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    db.execute(f"PRAGMA mmap_size={MMAP_SIZE_BYTES}")
+    db.execute("PRAGMA temp_store=MEMORY")
+    return db
+
+
+def thread_connection(path: str) -> sqlite3.Connection:
+    """This thread's connection to `path`, opened on first use and kept."""
+    pool = getattr(_local, "pool", None)
+    # a forked child must not share its parent's connections
+    if pool is None or _local.pid != os.getpid():
+        pool = _local.pool = {}
+        _local.pid = os.getpid()
+    db = pool.get(path)
+    if db is None:
+        db = pool[path] = connect(path)
+    return db
+
 
 def get_db() -> sqlite3.Connection:
-    """Return a SQLite connection stored in Flask's `g`."""
+    """Return this thread's SQLite connection, stored in Flask's `g`."""
     if "db" not in g:
-        db_path = current_app.config["DATABASE"]
-        g.db = sqlite3.connect(
-            db_path,
-            detect_types=sqlite3.PARSE_DECLTYPES,
-            check_same_thread=False,
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = thread_connection(current_app.config["DATABASE"])
     return g.db
 
 
 def close_db(e=None) -> None:  # pragma: no cover - simple resource cleanup
+    # the connection stays open for the thread's next request; only drop
+    # whatever the request left uncommitted
     db = g.pop("db", None)
-    if db is not None:
-        db.close()
+    if db is not None and db.in_transaction:
+        db.rollback()
+
+
+def _is_busy(exc: sqlite3.OperationalError) -> bool:
+    message = str(exc)
+    return "locked" in message or "busy" in message
+
+
+def retry_on_busy(fn):
+    """
+    Retry a write that failed because another connection held the write
+    lock past the busy timeout. `fn` must run its whole transaction: its
+    first argument is the connection, rolled back before each retry.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(db, *args, **kwargs):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return fn(db, *args, **kwargs)
+            except sqlite3.OperationalError as exc:
+                if attempt == BUSY_RETRIES or not _is_busy(exc):
+                    raise
+                if db.in_transaction:
+                    db.rollback()
+                time.sleep(BUSY_RETRY_DELAY_SECONDS * (attempt + 1))
+
+    return wrapper
+
+
+@retry_on_busy
+def begin_write(db: sqlite3.Connection) -> None:
+    """
+    Start a transaction holding the write lock (BEGIN IMMEDIATE), retried
+    while busy. Every write (engine, routes, CLI) starts with it, so the
+    statements that follow never wait for the lock themselves.
+    """
+    db.execute("BEGIN IMMEDIATE")
+
+
+# Columns added to existing tables after their first release. CREATE TABLE
+# IF NOT EXISTS does not touch old tables, so migration 1 adds them.
+_ADDED_COLUMNS = {
+    "builds": [
+        ("priority", "INTEGER NOT NULL DEFAULT 0"),
+        ("worker_slot", "INTEGER"),
+        ("started_at", "TEXT"),
+        ("finished_at", "TEXT"),
+        ("lease_owner", "TEXT"),
+        ("lease_expires_at", "TEXT"),
+    ],
+    "deployments": [
+        ("lease_owner", "TEXT"),
+        ("lease_expires_at", "TEXT"),
+    ],
+}
+
+
+def _ensure_columns(db: sqlite3.Connection) -> None:
+    for table, columns in _ADDED_COLUMNS.items():
+        existing = {r["name"] for r in db.execute(f"PRAGMA table_info({table})")}
+        for name, decl in columns:
+            if name not in existing:
+                db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+def _audit_search_schema(db: sqlite3.Connection) -> None:
+    """
+    Keyset indexes on (created_at, id) per audit filter, the distinct
+    action list and a full-text index over action/details, the last two
+    maintained by triggers on audit_log.
+    """
+    db.execute("DROP INDEX IF EXISTS idx_audit_log_created")
+    db.execute("DROP INDEX IF EXISTS idx_audit_log_action")
+    db.execute("CREATE INDEX idx_audit_log_keyset ON audit_log (created_at, id)")
+    db.execute("CREATE INDEX idx_audit_log_action ON audit_log (action, created_at, id)")
+    db.execute("CREATE INDEX idx_audit_log_user ON audit_log (user_id, created_at, id)")
+
+    db.execute("CREATE TABLE audit_actions (action TEXT PRIMARY KEY) WITHOUT ROWID")
+    db.execute("INSERT INTO audit_actions SELECT DISTINCT action FROM audit_log")
+    db.execute(
+        """
+        CREATE TRIGGER audit_log_actions AFTER INSERT ON audit_log BEGIN
+            INSERT OR IGNORE INTO audit_actions (action) VALUES (new.action);
+        END
+        """
+    )
+
+    try:
+        db.execute(
+            """
+            CREATE VIRTUAL TABLE audit_log_fts USING fts5(
+                action, details, content='audit_log', content_rowid='id'
+            )
+            """
+        )
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: audit search falls back to LIKE
+        logger.warning("SQLite has no FTS5; audit text search will scan")
+        return
+    db.execute(
+        """
+        CREATE TRIGGER audit_log_fts_insert AFTER INSERT ON audit_log BEGIN
+            INSERT INTO audit_log_fts (rowid, action, details)
+            VALUES (new.id, new.action, new.details);
+        END
+        """
+    )
+    db.execute(
+        """
+        CREATE TRIGGER audit_log_fts_delete AFTER DELETE ON audit_log BEGIN
+            INSERT INTO audit_log_fts (audit_log_fts, rowid, action, details)
+            VALUES ('delete', old.id, old.action, old.details);
+        END
+        """
+    )
+    db.execute(
+        """
+        CREATE TRIGGER audit_log_fts_update AFTER UPDATE ON audit_log BEGIN
+            INSERT INTO audit_log_fts (audit_log_fts, rowid, action, details)
+            VALUES ('delete', old.id, old.action, old.details);
+            INSERT INTO audit_log_fts (rowid, action, details)
+            VALUES (new.id, new.action, new.details);
+        END
+        """
+    )
+    db.execute("INSERT INTO audit_log_fts (audit_log_fts) VALUES ('rebuild')")
+
+
+# Schema changes after schema.sql, applied in order on startup. The number
+# of the last one applied is kept in PRAGMA user_version; append new steps,
+# never edit released ones. A step is a callable taking the connection or
+# a string of `;`-separated statements.
+MIGRATIONS = [
+    # 1: columns added before migrations were versioned
+    _ensure_columns,
+    # 2: indexes for the engine's status scans, the commit hook lookup and
+    # the created_at sorts of the list pages
+    """
+    CREATE INDEX IF NOT EXISTS idx_builds_status ON builds (status, priority DESC, id);
+    CREATE INDEX IF NOT EXISTS idx_builds_request ON builds (request_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_builds_created ON builds (created_at);
+    CREATE INDEX IF NOT EXISTS idx_deployments_status ON deployments (status);
+    CREATE INDEX IF NOT EXISTS idx_deployments_image ON deployments (image_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_deployments_created ON deployments (created_at);
+    CREATE INDEX IF NOT EXISTS idx_image_requests_repo
+        ON image_requests (repo_url, repo_branch, update_mode);
+    CREATE INDEX IF NOT EXISTS idx_image_requests_status ON image_requests (status, created_at);
+    CREATE INDEX IF NOT EXISTS idx_image_requests_created ON image_requests (created_at);
+    CREATE INDEX IF NOT EXISTS idx_images_request ON images (request_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_images_created ON images (created_at);
+    CREATE INDEX IF NOT EXISTS idx_audit_log_created ON audit_log (created_at);
+    CREATE INDEX IF NOT EXISTS idx_audit_log_action ON audit_log (action)
+    """,
+    # 3: audit page search (samosval/audit.py)
+    _audit_search_schema,
+]
+
+
+def migrate(db: sqlite3.Connection) -> int:
+    """Apply pending MIGRATIONS; returns the resulting schema version."""
+    while True:
+        # write lock first: processes starting together apply each step once
+        begin_write(db)
+        try:
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                db.rollback()
+                return version
+            step = MIGRATIONS[version]
+            if callable(step):
+                step(db)
+            else:
+                for statement in step.split(";"):
+                    if statement.strip():
+                        db.execute(statement)
+            db.execute(f"PRAGMA user_version = {version + 1}")
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+
+
+# Hot queries of the engine and the routes with the index each must use,
+# checked with EXPLAIN QUERY PLAN by `flask check-query-plans`.
+QUERY_PLAN_CHECKS = [
+    ("SELECT status, COUNT(*) FROM builds WHERE status IN ('queued', 'building') GROUP BY status",
+     "idx_builds_status"),
+    ("SELECT id FROM builds WHERE status = 'queued' ORDER BY priority DESC, id",
+     "idx_builds_status"),
+    ("SELECT id FROM deployments WHERE status = 'running' ORDER BY id",
+     "idx_deployments_status"),
+    ("SELECT id FROM deployments WHERE status = 'deploying' AND lease_owner = 'x' AND id > 0 ORDER BY id",
+     "idx_deployments_status"),
+    ("SELECT d.id FROM deployments d"
+     " JOIN images i ON d.image_id = i.id"
+     " JOIN image_requests r ON i.request_id = r.id"
+     " WHERE r.update_mode = 'continuous' AND r.repo_url = 'u' AND r.repo_branch = 'b'",
+     "idx_image_requests_repo"),
+    ("SELECT * FROM image_requests ORDER BY created_at DESC", "idx_image_requests_created"),
+    ("SELECT * FROM image_requests WHERE status = 'pending' ORDER BY created_at DESC",
+     "idx_image_requests_status"),
+    ("SELECT * FROM builds WHERE request_id = 1 ORDER BY created_at DESC", "idx_builds_request"),
+    ("SELECT * FROM images WHERE request_id = 1 ORDER BY created_at DESC", "idx_images_request"),
+    ("SELECT * FROM deployments WHERE image_id = 1 ORDER BY created_at DESC",
+     "idx_deployments_image"),
+    ("SELECT b.id FROM builds b JOIN image_requests r ON b.request_id = r.id"
+     " ORDER BY b.created_at DESC",
+     "idx_builds_created"),
+    ("SELECT i.id FROM images i JOIN image_requests r ON i.request_id = r.id"
+     " ORDER BY i.created_at DESC",
+     "idx_images_created"),
+    ("SELECT d.id FROM deployments d"
+     " JOIN images i ON d.image_id = i.id"
+     " JOIN image_requests r ON i.request_id = r.id"
+     " ORDER BY d.created_at DESC",
+     "idx_deployments_created"),
+    ("SELECT a.id FROM audit_log a LEFT JOIN users u ON a.user_id = u.id"
+     " ORDER BY a.created_at DESC, a.id DESC LIMIT 200",
+     "idx_audit_log_keyset"),
+    ("SELECT a.id FROM audit_log a WHERE (a.created_at, a.id) < ('2024', 1)"
+     " ORDER BY a.created_at DESC, a.id DESC LIMIT 200",
+     "idx_audit_log_keyset"),
+    ("SELECT a.id FROM audit_log a WHERE a.action = 'x'"
+     " ORDER BY a.created_at DESC, a.id DESC LIMIT 200",
+     "idx_audit_log_action"),
+    ("SELECT a.id FROM audit_log a WHERE a.user_id = (SELECT id FROM users WHERE username = 'x')"
+     " ORDER BY a.created_at DESC, a.id DESC LIMIT 200",
+     "idx_audit_log_user"),
+]
+
+
+def check_query_plans(db: sqlite3.Connection) -> list[tuple[str, str, str]]:
+    """(query, expected index, plan) for each hot query not using its index."""
+    failures = []
+    for sql, index in QUERY_PLAN_CHECKS:
+        plan = "; ".join(r["detail"] for r in db.execute(f"EXPLAIN QUERY PLAN {sql}"))
+        if f"INDEX {index}" not in plan:
+            failures.append((sql, index, plan))
+    return failures
+
+
+@click.command("check-query-plans")
+def check_query_plans_command() -> None:
+    """Fail if a hot query does not use the index meant for it."""
+    failures = check_query_plans(get_db())
+    for sql, index, plan in failures:
+        click.echo(f"{sql}\n  expected {index}, got: {plan}", err=True)
+    if failures:
+        raise SystemExit(1)
+    click.echo(f"{len(QUERY_PLAN_CHECKS)} query plans use their indexes")
 
 
 def init_db() -> None:
-    """Initialize database schema from schema.sql."""
-    db = get_db()
-    with current_app.open_resource("schema.sql") as f:
-        sql = f.read().decode("utf-8")
-        db.executescript(sql)
-    db.commit()
+    """Initialize database schema from schema.sql and apply migrations."""
+    # own connection: the script's PRAGMAs must not stick to a pooled one
+    db = connect(current_app.config["DATABASE"])
+    try:
+        with current_app.open_resource("schema.sql") as f:
+            sql = f.read().decode("utf-8")
+            db.executescript(sql)
+        migrate(db)
+    finally:
+        db.close()
 
 
 def ensure_root_user() -> None:
@@ -40,7 +345,7 @@ def ensure_root_user() -> None:
     cur = db.execute("SELECT id FROM users WHERE username = ?", ("root",))
     row = cur.fetchone()
     if row is None:
-        now = datetime.utcnow().isoformat(timespec="seconds")
+        now = clock.isonow()
         password_hash = generate_password_hash("root")
         db.execute(
             """
@@ -55,11 +360,12 @@ def ensure_root_user() -> None:
 def init_db_if_needed() -> None:
     """Create DB file and schema if needed, and ensure root user exists."""
     db_path = current_app.config["DATABASE"]
-    first_time = not os.path.exists(db_path)
-    if first_time:
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        init_db()
+    # Ensure directory exists
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    # schema.sql only uses CREATE ... IF NOT EXISTS, so re-applying it on an
+    # existing DB just adds tables introduced since it was created; migrate()
+    # then brings it to the current version.
+    init_db()
     # Always ensure root user
     ensure_root_user()
 
@@ -69,18 +375,141 @@ def init_app(app) -> None:
     app.teardown_appcontext(close_db)
 
 
-def write_audit(user_id, action: str, target_id: int | None, details: str | None) -> None:
-    """Append record to audit_log table."""
-    db = get_db()
-    now = datetime.utcnow().isoformat(timespec="seconds")
-    db.execute(
+AUDIT_INSERT_SQL = """
+    INSERT INTO audit_log (user_id, action, target_id, details, created_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+
+# write_audit() queues rows; a background thread writes them in one
+# transaction once this many are pending or the oldest is this old.
+AUDIT_FLUSH_ROWS = 200
+AUDIT_FLUSH_SECONDS = 0.5
+
+
+class _AuditWriter:
+    """Per-process queue of audit rows for one database, written in batches."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending: list[tuple] = []
+        self._cond = threading.Condition()
+        # held while a batch is written, so batches land in queue order
+        self._write_lock = threading.Lock()
+        self._pid: int | None = None
+
+    def add(self, row: tuple) -> None:
+        with self._cond:
+            self._pending.append(row)
+            if self._pid != os.getpid():
+                # first row in this process (or after a fork): start the thread
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="audit-writer", daemon=True).start()
+            if len(self._pending) >= AUDIT_FLUSH_ROWS:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                if len(self._pending) < AUDIT_FLUSH_ROWS:
+                    self._cond.wait(AUDIT_FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("writing audit records failed; retrying")
+                time.sleep(AUDIT_FLUSH_SECONDS)
+
+    def flush(self) -> int:
         """
-        INSERT INTO audit_log (user_id, action, target_id, details, created_at)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (user_id, action, target_id, details, now),
-    )
+        Write every queued row now; return how many were written. A batch
+        refused because the database is busy goes back on the queue and the
+        error is raised; a batch failing for any other reason is logged and
+        dropped.
+        """
+        with self._write_lock:
+            with self._cond:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            try:
+                _commit_audit_rows(thread_connection(self.path), rows)
+            except Exception as exc:
+                if isinstance(exc, sqlite3.OperationalError) and _is_busy(exc):
+                    self._requeue(rows)
+                    raise
+                # retrying cannot help and would block every later row
+                logger.exception("dropping %d audit records: %r", len(rows), rows)
+                return 0
+            except BaseException:
+                self._requeue(rows)
+                raise
+            return len(rows)
+
+    def _requeue(self, rows: list[tuple]) -> None:
+        with self._cond:
+            # keep them for the next attempt, ahead of newer rows
+            self._pending[:0] = rows
+
+
+_audit_writers: dict[str, _AuditWriter] = {}
+_audit_writers_lock = threading.Lock()
+
+
+@retry_on_busy
+def _commit_audit_rows(db: sqlite3.Connection, rows: list[tuple]) -> None:
+    insert_audit_rows(db, rows)
     db.commit()
 
 
+def _audit_writer(path: str) -> _AuditWriter:
+    with _audit_writers_lock:
+        writer = _audit_writers.get(path)
+        if writer is None:
+            writer = _audit_writers[path] = _AuditWriter(path)
+        return writer
+
+
+def write_audit(user_id, action: str, target_id: int | None, details: str | None) -> None:
+    """
+    Queue a record for audit_log. It is written within AUDIT_FLUSH_SECONDS,
+    off the request path; readers of audit_log call flush_audit() first.
+    """
+    now = clock.isonow()
+    _audit_writer(current_app.config["DATABASE"]).add((user_id, action, target_id, details, now))
+
+
+def flush_audit() -> int:
+    """
+    Write all queued audit records now (before reads, tests, shutdown).
+    Records the database is too busy to take stay queued for the writer
+    thread, so a page reading audit_log is never failed by them.
+    """
+    with _audit_writers_lock:
+        writers = list(_audit_writers.values())
+    written = 0
+    for writer in writers:
+        try:
+            written += writer.flush()
+        except sqlite3.OperationalError:
+            logger.warning("audit records left queued: database busy", exc_info=True)
+    return written
+
+
+# queued rows must not be lost on a clean exit
+atexit.register(flush_audit)
+
+
+def insert_audit_rows(db: sqlite3.Connection, rows: list[tuple]) -> None:
+    """
+    Insert several audit records in one statement without committing.
+
+    Each row is (user_id, action, target_id, details, created_at); the caller
+    owns the surrounding transaction.
+    """
+    if rows:
+        db.executemany(AUDIT_INSERT_SQL, rows)
+
+
 
@@ -0,0 +1,286 @@
+"""
+Response payloads shared by the Flask API routes and the ASGI serving path.
+
+Everything here takes plain arguments (a sqlite connection, ids, cursors)
+and returns plain data or SSE text, so `routes/api_routes.py` and
+`samosval/asgi.py` produce byte-identical responses.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Tuple
+
+from . import build_logs
+from .simulator import downsample, logfmt, state, tsstore
+
+
+SSE_RETRY_MS = 3000
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+SSE_KEEPALIVE = ": keep-alive\n\n"
+# polled JSON: let clients keep it but always revalidate
+REVALIDATE_HEADERS = {"Cache-Control": "no-cache"}
+
+
+def deployment_exists(db: sqlite3.Connection, deployment_id: int) -> bool:
+    return (
+        db.execute("SELECT 1 FROM deployments WHERE id = ?", (deployment_id,)).fetchone()
+        is not None
+    )
+
+
+def build_log_payload(
+    db: sqlite3.Connection, build_id: int, after: int | None
+) -> Dict[str, Any] | None:
+    """Build log JSON (whole log, or chunks after `after`); None if no such build."""
+    row = db.execute(
+        "SELECT id, status FROM builds WHERE id = ?",
+        (build_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    text, last_seq = build_logs.read_log(db, build_id, after=after)
+    return {
+        "id": row["id"],
+        "status": row["status"],
+        "log": text,
+        "next": last_seq,
+    }
+
+
+MAX_LOG_LINES = 5000
+
+
+def log_history_payload(
+    deployment_id: int,
+    after: int | None,
+    start: float | None,
+    end: float | None,
+    limit: int,
+    min_level: int = 0,
+) -> Dict[str, Any]:
+    """
+    Runtime log lines for incident review: after sequence number `after`,
+    or within [start, end] (epoch seconds) from the on-disk history, of at
+    least `min_level`. `seqs` numbers the lines; `next` is the sequence
+    number to continue from with `after`.
+    """
+    if start is None and end is None:
+        batch = state.read_logs_after(deployment_id, after or 0, limit, min_level)
+        return {
+            "lines": batch.lines,
+            "seqs": batch.seqs,
+            "next": batch.last_seq,
+            "missed": batch.missed,
+        }
+    rows = state.read_logs_between(deployment_id, start, end, limit, min_level)
+    return {
+        "lines": [text for _, _, text in rows],
+        "seqs": [seq for seq, _, _ in rows],
+        "ts": [ts for _, ts, _ in rows],
+        "next": rows[-1][0] if rows else after or 0,
+        "missed": 0,
+    }
+
+
+MAX_CHART_POINTS = 5000
+# resolution name -> bucket seconds; 0 is the raw per-second buffer
+RESOLUTIONS = {"raw": 0}
+RESOLUTIONS.update(
+    (f"{s // 3600}h" if s >= 3600 and s % 3600 == 0 else f"{s // 60}m", s)
+    for s, _ in state.ROLLUP_TIERS
+)
+
+
+@dataclass(frozen=True)
+class MetricsQuery:
+    """
+    Query string of the metrics endpoint. `since` asks for the points
+    appended after a previous `next` cursor; `from`/`to` (epoch seconds or
+    ISO datetimes, UTC) select a time range, and `max_points` downsamples
+    the result with `algo` (lttb or minmax). Ranges are served from the
+    finest resolution still holding `from` unless `res` names one.
+    """
+
+    since: int | None = None
+    start: float | None = None
+    end: float | None = None
+    max_points: int | None = None
+    algorithm: str = "lttb"
+    resolution: str | None = None
+
+    @property
+    def is_range(self) -> bool:
+        return (
+            self.start is not None
+            or self.end is not None
+            or self.max_points is not None
+            or self.resolution is not None
+        )
+
+    @property
+    def key(self) -> str:
+        """Range parameters, for the entity tag of a range response."""
+        return f"r{self.start}:{self.end}:{self.max_points}:{self.algorithm}:{self.resolution}"
+
+
+def parse_metrics_query(args: Mapping[str, str]) -> MetricsQuery:
+    """Build a MetricsQuery from request args; ValueError on bad input."""
+    algorithm = args.get("algo") or "lttb"
+    if algorithm not in downsample.ALGORITHMS:
+        raise ValueError(f"algo must be one of: {', '.join(downsample.ALGORITHMS)}")
+    resolution = args.get("res") or None
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise ValueError(f"res must be one of: {', '.join(RESOLUTIONS)}")
+    max_points = args.get("max_points")
+    if max_points is not None:
+        if not max_points.isdigit() or not 3 <= int(max_points) <= MAX_CHART_POINTS:
+            raise ValueError(f"max_points must be between 3 and {MAX_CHART_POINTS}")
+        max_points = int(max_points)
+    return MetricsQuery(
+        since=parse_cursor(args.get("since")),
+        start=parse_time(args.get("from")),
+        end=parse_time(args.get("to")),
+        max_points=max_points,
+        algorithm=algorithm,
+        resolution=resolution,
+    )
+
+
+def parse_time(value: str | None) -> float | None:
+    """Epoch seconds or an ISO datetime (naive means UTC); ValueError otherwise."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def metrics_etag(deployment_id: int, query: MetricsQuery) -> str:
+    """
+    Entity tag of the metrics response for `query`: it changes whenever a
+    point is appended. The prefix names the process owning the buffers, so
+    tags from before its restart (whose cursors began again at 0) do not
+    match.
+    """
+    return _metrics_etag(deployment_id, query, state.get_metrics_cursor(deployment_id))
+
+
+def _metrics_etag(deployment_id: int, query: MetricsQuery, cursor: int) -> str:
+    if not query.is_range:
+        # no `since`: pollers send the last tag along with its cursor as
+        # `since`, and the tag must match while no point was appended
+        return f"{state.instance_token()}-{deployment_id}-{cursor}"
+    return f"{state.instance_token()}-{deployment_id}-{query.key}-{cursor}"
+
+
+def _pick_resolution(deployment_id: int, query: MetricsQuery) -> int:
+    """Bucket seconds for a range query: finest tier whose data reaches `from`."""
+    if query.resolution is not None:
+        return RESOLUTIONS[query.resolution]
+    coverage = tsstore.coverage(deployment_id)
+    if query.start is None or not coverage:
+        return 0
+    for seconds, oldest in coverage:
+        if oldest <= (query.start - query.start % seconds if seconds else query.start):
+            return seconds
+    return coverage[-1][0]
+
+
+def metrics_payload(deployment_id: int, query: MetricsQuery) -> Tuple[Dict[str, Any], str]:
+    """
+    Metric points for `query` and the response ETag. Timestamps are epoch
+    seconds; clients format labels. Range queries may read the on-disk
+    store and should run off the event loop. Rollup resolutions add per-bucket
+    `cpu_min`/`cpu_max`/`ram_min`/`ram_max` next to the averages.
+    """
+    seconds = 0
+    if query.is_range:
+        # ranges reach back past the in-memory window into the disk store
+        seconds = _pick_resolution(deployment_id, query)
+        columns, cursor = tsstore.read_range(deployment_id, seconds, query.start, query.end)
+        payload = {"next": cursor, "reset": True}
+    else:
+        batch = state.read_metrics_after(deployment_id, query.since)
+        columns = {"ts": batch.ts, "cpu": batch.cpu, "ram": batch.ram}
+        payload = {"next": batch.next, "reset": batch.reset}
+
+    raw_points = len(columns["ts"])
+    if query.max_points is not None and raw_points > query.max_points:
+        keep = downsample.select(
+            columns["ts"], (columns["cpu"], columns["ram"]), query.max_points, query.algorithm
+        )
+        columns = {name: [col[i] for i in keep] for name, col in columns.items()}
+    payload.update(columns)
+    if query.is_range:
+        payload["resolution"] = next(k for k, v in RESOLUTIONS.items() if v == seconds)
+        payload["raw_points"] = raw_points
+        payload["downsampled"] = len(columns["ts"]) < raw_points
+    return payload, _metrics_etag(deployment_id, query, payload["next"])
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header value lists `etag` (or is `*`)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/").strip('"') == etag for t in tags)
+
+
+def sse_line(seq: int, line: str) -> str:
+    return f"id: {seq}\ndata: {line}\n\n"
+
+
+def sse_gap(missed: int) -> str:
+    return f"event: gap\ndata: {missed}\n\n"
+
+
+def sse_backfill(deployment_id: int, after: int, min_level: int = 0) -> Tuple[List[str], int]:
+    """
+    Opening events of a log stream: the retry hint plus buffered lines after
+    `after` (of at least `min_level`). Returns the events and the cursor to
+    continue from. Callers subscribe to the log hub first so no line falls
+    between the two; lines seen twice are skipped by sequence number.
+    """
+    events = [f"retry: {SSE_RETRY_MS}\n\n"]
+    batch = state.read_logs_after(deployment_id, after, min_level=min_level)
+    if batch.missed and after:
+        events.append(sse_gap(batch.missed))
+    for seq, line in zip(batch.seqs, batch.lines):
+        events.append(sse_line(seq, line))
+    return events, batch.last_seq
+
+
+def sse_live(
+    items: List[Tuple[int, str, int]], missed: int, cursor: int
+) -> Tuple[List[str], int]:
+    """Events for lines drained from a log hub subscription."""
+    events = [sse_gap(missed)] if missed else []
+    for seq, line, _ in items:
+        if seq <= cursor:
+            continue
+        cursor = seq
+        events.append(sse_line(seq, line))
+    return events, cursor
+
+
+def parse_level(value: str | None) -> int:
+    """Minimum level code from a `level` query value (all levels if empty)."""
+    return logfmt.level_code(value) if value else 0
+
+
+def parse_cursor(value: str | None) -> int | None:
+    """Non-negative integer cursor from a header/query value, else None."""
+    try:
+        return max(int(value), 0) if value is not None else None
+    except ValueError:
+        return None
+
+
@@ -1,11 +1,11 @@
-from datetime import datetime
-
-from flask import Blueprint, abort, redirect, render_template, request, url_for, flash
+from flask import Blueprint, abort, current_app, jsonify, redirect, render_template, request, url_for, flash
 from flask_login import current_user
 from werkzeug.security import generate_password_hash
 
+from .. import audit as audit_log
 from ..access import role_required
-from ..db import get_db, write_audit
+from ..db import begin_write, flush_audit, get_db, write_audit
+from ..simulator import clock, state
 
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
@@ -49,8 +49,9 @@ def create_user():
         flash("Пользователь с таким логином уже существует", "error")
         return redirect(url_for("admin.users"))
 
-    now = datetime.utcnow().isoformat(timespec="seconds")
+    now = clock.isonow()
     password_hash = generate_password_hash(password)
+    begin_write(db)
     cur = db.execute(
         """
         INSERT INTO users (username, password_hash, role, is_active, created_at)
@@ -82,6 +83,7 @@ def _change_user_active(user_id: int, active: int, action: str):
         flash("root нельзя блокировать или удалять", "error")
         return redirect(url_for("admin.users"))
 
+    begin_write(db)
     db.execute(
         "UPDATE users SET is_active = ? WHERE id = ?",
         (active, user_id),
@@ -112,47 +114,46 @@ def unblock_user(user_id: int):
 @admin_bp.get("/audit")
 @role_required("admin")
 def audit():
+    flush_audit()
     db = get_db()
 
     user_login = request.args.get("user", "").strip()
     action = request.args.get("action", "").strip()
     text = request.args.get("text", "").strip()
-
-    query = """
-        SELECT a.*, u.username
-          FROM audit_log a
-          LEFT JOIN users u ON a.user_id = u.id
-         WHERE 1=1
-    """
-    params = []
-
-    if user_login:
-        query += " AND u.username = ?"
-        params.append(user_login)
-    if action:
-        query += " AND a.action = ?"
-        params.append(action)
-    if text:
-        query += " AND (a.details LIKE ? OR a.action LIKE ?)"
-        like = f"%{text}%"
-        params.extend([like, like])
-
-    query += " ORDER BY a.created_at DESC LIMIT 200"
-
-    rows = db.execute(query, params).fetchall()
-
-    # For filter dropdowns
-    distinct_actions = db.execute(
-        "SELECT DISTINCT action FROM audit_log ORDER BY action ASC"
-    ).fetchall()
+    try:
+        before = audit_log.parse_cursor(request.args.get("before"))
+    except ValueError:
+        abort(400)
+
+    # "": the audit_log table; "YYYY-MM" or "all": archived months
+    archive = request.args.get("archive", "").strip()
+    archive_dir = current_app.config["AUDIT_ARCHIVE_DIR"]
+    if archive:
+        rows, next_cursor = audit_log.search_archive(
+            archive_dir, archive, user_login, action, text, before
+        )
+    else:
+        rows, next_cursor = audit_log.search(db, user_login, action, text, before)
 
     return render_template(
         "admin/audit.html",
         rows=rows,
-        distinct_actions=distinct_actions,
+        next_cursor=next_cursor,
+        # For filter dropdowns
+        distinct_actions=audit_log.actions(db),
+        archive_months=audit_log.archive_months(archive_dir),
+        archive=archive,
         user_login=user_login,
         action_filter=action,
         text_filter=text,
     )
 
 
+@admin_bp.get("/state/memory")
+@role_required("admin")
+def state_memory():
+    """Memory held by the simulator's log/metric buffers (JSON)."""
+    top = request.args.get("top", default=10, type=int)
+    return jsonify(state.memory_report(max(top, 0)))
+
+
@@ -1,20 +1,17 @@
 from __future__ import annotations
 
-import time
-from datetime import datetime
-
 from flask import (
     Blueprint,
     Response,
     abort,
     jsonify,
     request,
-    stream_with_context,
 )
 from flask_login import login_required, current_user
 
-from ..db import get_db, write_audit
-from ..simulator import state
+from .. import payloads
+from ..db import begin_write, get_db, write_audit
+from ..simulator import clock, logfmt, loghub, state, wakeup
 
 
 api_bp = Blueprint("api", __name__)
@@ -43,66 +40,113 @@ def users_search():
 @api_bp.get("/builds/<int:build_id>/log")
 @login_required
 def build_log(build_id: int):
-    db = get_db()
-    row = db.execute(
-        "SELECT id, status, build_log FROM builds WHERE id = ?",
-        (build_id,),
-    ).fetchone()
-    if not row:
+    """
+    Build log. Without `after` returns the whole log; with `after=<seq>`
+    returns only chunks appended since that cursor. `next` is the cursor
+    for the following request.
+    """
+    after = request.args.get("after", type=int)
+    payload = payloads.build_log_payload(get_db(), build_id, after)
+    if payload is None:
         abort(404)
-    return jsonify(
-        {
-            "id": row["id"],
-            "status": row["status"],
-            "log": row["build_log"] or "",
-        }
-    )
+    return jsonify(payload)
 
 
 @api_bp.get("/deployments/<int:deployment_id>/metrics")
 @login_required
 def deployment_metrics(deployment_id: int):
-    # Ensure deployment exists
-    db = get_db()
-    dep = db.execute(
-        "SELECT id FROM deployments WHERE id = ?",
-        (deployment_id,),
-    ).fetchone()
-    if not dep:
+    """
+    Buffered metric points. With `since=<next>` from a previous response
+    only newer points are returned; `from`/`to`/`max_points`/`algo` select
+    a downsampled time range (see payloads.MetricsQuery). An unchanged
+    series answers 304 to If-None-Match.
+    """
+    if not payloads.deployment_exists(get_db(), deployment_id):
         abort(404)
-
-    points = state.get_metrics(deployment_id)
-    labels = [p.ts.strftime("%H:%M:%S") for p in points]
-    cpu = [p.cpu for p in points]
-    ram = [p.ram for p in points]
-    return jsonify({"labels": labels, "cpu": cpu, "ram": ram})
+    try:
+        query = payloads.parse_metrics_query(request.args)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    etag = payloads.metrics_etag(deployment_id, query)
+    if payloads.etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"', **payloads.REVALIDATE_HEADERS})
+    payload, etag = payloads.metrics_payload(deployment_id, query)
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers.update(payloads.REVALIDATE_HEADERS)
+    return response
+
+
+@api_bp.get("/deployments/<int:deployment_id>/logs")
+@login_required
+def deployment_logs(deployment_id: int):
+    """
+    Runtime log history. `after=<seq>` pages forward through the lines
+    (older ones come from the on-disk segments); `from`/`to` (epoch seconds
+    or ISO datetimes, UTC) select a time window instead. `level=warn`
+    keeps WARN and ERROR lines only. At most `limit` lines per response.
+    """
+    if not payloads.deployment_exists(get_db(), deployment_id):
+        abort(404)
+    try:
+        start = payloads.parse_time(request.args.get("from"))
+        end = payloads.parse_time(request.args.get("to"))
+    except ValueError:
+        return jsonify({"error": "from/to must be epoch seconds or ISO datetimes"}), 400
+    try:
+        min_level = payloads.parse_level(request.args.get("level"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    limit = request.args.get("limit", default=1000, type=int)
+    if not 1 <= limit <= payloads.MAX_LOG_LINES:
+        return jsonify({"error": f"limit must be between 1 and {payloads.MAX_LOG_LINES}"}), 400
+    after = payloads.parse_cursor(request.args.get("after"))
+    return jsonify(
+        payloads.log_history_payload(deployment_id, after, start, end, limit, min_level)
+    )
 
 
 @api_bp.get("/deployments/<int:deployment_id>/logs/stream")
 @login_required
 def deployment_logs_stream(deployment_id: int):
-    # Ensure deployment exists
-    db = get_db()
-    dep = db.execute(
-        "SELECT id FROM deployments WHERE id = ?",
-        (deployment_id,),
-    ).fetchone()
-    if not dep:
+    if not payloads.deployment_exists(get_db(), deployment_id):
         abort(404)
 
-    @stream_with_context
+    # Sequence number of the last line the client already has: EventSource
+    # sends Last-Event-ID when it reconnects, our own JS passes ?after=.
+    after = payloads.parse_cursor(request.headers.get("Last-Event-ID"))
+    if after is None:
+        after = payloads.parse_cursor(request.args.get("after")) or 0
+    # ?level=warn: only WARN and above, filtered before anything is queued
+    try:
+        min_level = payloads.parse_level(request.args.get("level"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    # No stream_with_context: the generator needs neither the request nor
+    # the DB connection, so both are released as soon as the view returns.
     def event_stream():
-        last_len = 0
-        while True:
-            lines = state.get_log_buffer_snapshot(deployment_id)
-            if len(lines) > last_len:
-                new_lines = lines[last_len:]
-                last_len = len(lines)
-                for line in new_lines:
-                    yield f"data: {line}\n\n"
-            time.sleep(1.0)
-
-    return Response(event_stream(), mimetype="text/event-stream")
+        sub = loghub.subscribe(deployment_id, min_level=min_level)
+        try:
+            events, cursor = payloads.sse_backfill(deployment_id, after, min_level)
+            yield "".join(events)
+            while True:
+                if not sub.wait(loghub.KEEPALIVE_SECONDS):
+                    # also how a dropped client is noticed: the write fails
+                    yield payloads.SSE_KEEPALIVE
+                    continue
+                items, missed = sub.drain()
+                events, cursor = payloads.sse_live(items, missed, cursor)
+                if events:
+                    yield "".join(events)
+        finally:
+            loghub.unsubscribe(sub)
+
+    return Response(
+        event_stream(),
+        mimetype="text/event-stream",
+        headers=payloads.SSE_HEADERS,
+    )
 
 
 @api_bp.post("/hooks/commit")
@@ -138,8 +182,10 @@ def commit_hook():
 
     restarted = 0
     marked = 0
-    now = datetime.utcnow().isoformat(timespec="seconds")
+    now = clock.isonow()
 
+    if rows:
+        begin_write(db)
     for d in rows:
         # Respect operator stop: mark for restart but don't auto-restart
         if d["stopped_by_operator"]:
@@ -166,14 +212,17 @@ def commit_hook():
             )
             restarted += 1
         # Log event to deployment logs
-        state.append_log(
+        state.append_record(
             d["id"],
-            f"{now} [INFO] Commit {commit_sha} received for {repo_url}@{branch}, "
+            logfmt.INFO,
+            f"Commit {commit_sha} received for {repo_url}@{branch}, "
             f"{'marked for restart' if d['stopped_by_operator'] else 'auto-restart triggered'}",
         )
 
     if rows:
         db.commit()
+    if restarted:
+        wakeup.notify()
 
     # Audit: commit_hook_received + deployments_restarted
     write_audit(
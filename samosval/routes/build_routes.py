@@ -1,7 +1,9 @@
 from flask import Blueprint, abort, render_template
 from flask_login import login_required
 
+from .. import build_logs
 from ..db import get_db
+from ..simulator import scheduler
 
 
 builds_bp = Blueprint("builds", __name__, url_prefix="/builds")
@@ -19,7 +21,11 @@ def list_builds():
          ORDER BY b.created_at DESC
         """
     ).fetchall()
-    return render_template("builds/list.html", builds=rows)
+    return render_template(
+        "builds/list.html",
+        builds=rows,
+        queue=scheduler.queue_stats(db),
+    )
 
 
 @builds_bp.get("/<int:build_id>")
@@ -37,6 +43,13 @@ def view_build(build_id: int):
     ).fetchone()
     if not build:
         abort(404)
-    return render_template("builds/detail.html", build=build)
+    log_text, log_cursor = build_logs.read_log(db, build_id)
+    return render_template(
+        "builds/detail.html",
+        build=build,
+        log_text=log_text,
+        log_cursor=log_cursor,
+        queue=scheduler.queue_stats(db),
+    )
 
 
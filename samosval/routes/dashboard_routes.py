@@ -1,7 +1,7 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, current_app, render_template
 from flask_login import login_required, current_user
 
-from ..db import get_db
+from ..db import flush_audit, get_db
 
 
 dashboard_bp = Blueprint("dashboard", __name__)
@@ -30,7 +30,20 @@ def dashboard():
         """
     ).fetchall()
 
-    # Latest audit log
+    # Engine work in flight; the last tick report is only known when the
+    # engine runs inside this process.
+    engine_queue = db.execute(
+        """
+        SELECT (SELECT COUNT(*) FROM builds WHERE status = 'queued')      AS builds_queued,
+               (SELECT COUNT(*) FROM builds WHERE status = 'building')    AS builds_building,
+               (SELECT COUNT(*) FROM deployments WHERE status = 'deploying') AS deploying
+        """
+    ).fetchone()
+    engine = current_app.extensions.get("samosval_engine")
+    engine_report = engine.last_report if engine is not None else None
+
+    # Latest audit log, including records still queued in this process
+    flush_audit()
     audit_rows = db.execute(
         """
         SELECT a.*, u.username
@@ -47,6 +60,8 @@ def dashboard():
         req_stats=req_stats,
         dep_stats=dep_stats,
         audit_rows=audit_rows,
+        engine_queue=engine_queue,
+        engine_report=engine_report,
     )
 
 
@@ -1,11 +1,9 @@
-from datetime import datetime
-
 from flask import Blueprint, abort, redirect, render_template, request, url_for, flash
 from flask_login import current_user, login_required
 
 from ..access import can_manage_deployment
-from ..db import get_db, write_audit
-from ..simulator import state
+from ..db import begin_write, get_db, write_audit
+from ..simulator import clock, state, tsstore, wakeup
 
 
 deployments_bp = Blueprint("deployments", __name__, url_prefix="/deployments")
@@ -90,7 +88,9 @@ def view_deployment(deployment_id: int):
     if not allowed:
         abort(403)
 
-    recent_logs = state.get_recent_logs(deployment_id, limit=200)
+    # The live stream resumes after the last line rendered into the page.
+    last_seq = state.get_log_last_seq(deployment_id)
+    recent = state.read_logs_after(deployment_id, max(last_seq - 200, 0))
 
     can_control = can_manage_deployment(
         current_user,
@@ -101,7 +101,8 @@ def view_deployment(deployment_id: int):
     return render_template(
         "deployments/detail.html",
         deployment=row,
-        recent_logs=recent_logs,
+        recent_logs=recent.lines,
+        log_seq=recent.last_seq,
         can_control=can_control,
     )
 
@@ -137,7 +138,8 @@ def start_deployment(deployment_id: int):
     row = _ensure_can_manage(deployment_id)
     db = get_db()
 
-    now = datetime.utcnow().isoformat(timespec="seconds")
+    now = clock.isonow()
+    begin_write(db)
     db.execute(
         """
         UPDATE deployments
@@ -149,6 +151,7 @@ def start_deployment(deployment_id: int):
         (now, deployment_id),
     )
     db.commit()
+    wakeup.notify()
     write_audit(
         user_id=current_user.id,
         action="deployment_start",
@@ -165,8 +168,9 @@ def stop_deployment(deployment_id: int):
     row = _ensure_can_manage(deployment_id)
     db = get_db()
 
-    now = datetime.utcnow().isoformat(timespec="seconds")
+    now = clock.isonow()
     stopped_by_operator = 1 if getattr(current_user, "role", None) in {"admin", "operator"} else 0
+    begin_write(db)
     db.execute(
         """
         UPDATE deployments
@@ -194,7 +198,8 @@ def restart_deployment(deployment_id: int):
     row = _ensure_can_manage(deployment_id)
     db = get_db()
 
-    now = datetime.utcnow().isoformat(timespec="seconds")
+    now = clock.isonow()
+    begin_write(db)
     db.execute(
         """
         UPDATE deployments
@@ -206,6 +211,7 @@ def restart_deployment(deployment_id: int):
         (now, deployment_id),
     )
     db.commit()
+    wakeup.notify()
     write_audit(
         user_id=current_user.id,
         action="deployment_restart",
@@ -221,8 +227,12 @@ def restart_deployment(deployment_id: int):
 def delete_deployment(deployment_id: int):
     row = _ensure_can_manage(deployment_id)
     db = get_db()
+    begin_write(db)
     db.execute("DELETE FROM deployments WHERE id = ?", (deployment_id,))
     db.commit()
+    # buffered logs/metrics and their on-disk history go with it
+    state.drop_deployment(deployment_id)
+    tsstore.delete(deployment_id)
     write_audit(
         user_id=current_user.id,
         action="deployment_delete",
@@ -2,7 +2,8 @@ from flask import Blueprint, abort, redirect, render_template, request, url_for,
 from flask_login import login_required, current_user
 
 from ..access import role_required
-from ..db import get_db
+from ..db import begin_write, get_db
+from ..simulator import clock, wakeup
 
 
 images_bp = Blueprint("images", __name__, url_prefix="/images")
@@ -58,9 +59,8 @@ def create_deployment_from_image(image_id: int):
     replicas = int(request.form.get("replicas", "1") or 1)
     ports = request.form.get("ports", "").strip() or None
 
-    from datetime import datetime
-
-    now = datetime.utcnow().isoformat(timespec="seconds")
+    now = clock.isonow()
+    begin_write(db)
     db.execute(
         """
         INSERT INTO deployments (
@@ -72,6 +72,7 @@ def create_deployment_from_image(image_id: int):
         (image_id, name, environment, "deploying", replicas, ports, 0, 0, now, now),
     )
     db.commit()
+    wakeup.notify()
     flash("Развёртывание создаётся (deploying)", "success")
     return redirect(url_for("images.view_image", image_id=image_id))
 
@@ -1,10 +1,10 @@
-from datetime import datetime
-
 from flask import Blueprint, abort, redirect, render_template, request, url_for, flash
 from flask_login import current_user, login_required
 
+from .. import build_logs
 from ..access import can_edit_request, can_view_request, role_required
-from ..db import get_db
+from ..db import begin_write, get_db
+from ..simulator import clock, scheduler, wakeup
 
 
 requests_bp = Blueprint("requests", __name__, url_prefix="/requests")
@@ -117,7 +117,8 @@ def create_request():
             flash(e, "error")
         return render_template("requests/form.html", req=form_data)
 
-    now = datetime.utcnow().isoformat(timespec="seconds")
+    now = clock.isonow()
+    begin_write(db)
     cur = db.execute(
         """
         INSERT INTO image_requests (
@@ -200,9 +201,10 @@ def submit_request(request_id: int):
         flash("Можно отправить только draft заявку", "error")
         return redirect(url_for("requests.view_request", request_id=request_id))
 
+    begin_write(db)
     db.execute(
         "UPDATE image_requests SET status = ?, updated_at = ? WHERE id = ?",
-        ("submitted", datetime.utcnow().isoformat(timespec="seconds"), request_id),
+        ("submitted", clock.isonow(), request_id),
     )
     db.commit()
     flash("Заявка отправлена оператору", "success")
@@ -235,7 +237,8 @@ def edit_request(request_id: int):
         # Reopen detail page with form data
         return render_template("requests/form.html", req=form_data, request_id=request_id)
 
-    now = datetime.utcnow().isoformat(timespec="seconds")
+    now = clock.isonow()
+    begin_write(db)
     db.execute(
         """
         UPDATE image_requests
@@ -283,9 +286,10 @@ def change_status(request_id: int):
         flash("Недопустимый статус", "error")
         return redirect(url_for("requests.view_request", request_id=request_id))
 
+    begin_write(db)
     db.execute(
         "UPDATE image_requests SET status = ?, updated_at = ? WHERE id = ?",
-        (new_status, datetime.utcnow().isoformat(timespec="seconds"), request_id),
+        (new_status, clock.isonow(), request_id),
     )
     db.commit()
     flash(f"Статус заявки изменён на {new_status}", "success")
@@ -302,23 +306,30 @@ def trigger_build(request_id: int):
     if not req:
         abort(404)
 
-    now = datetime.utcnow().isoformat(timespec="seconds")
+    priority = request.form.get("priority", 0, type=int)
+    if priority not in scheduler.PRIORITY_CHOICES:
+        priority = 0
+
+    now = clock.isonow()
+    begin_write(db)
     cur = db.execute(
         """
         INSERT INTO builds (request_id, image_id, status, build_log, error_message,
-                            built_by, created_at)
-        VALUES (?, NULL, ?, ?, NULL, ?, ?)
+                            built_by, created_at, priority)
+        VALUES (?, NULL, ?, NULL, NULL, ?, ?, ?)
         """,
         (
             request_id,
             "queued",
-            "[ui] Build requested by operator\n",
             current_user.id,
             now,
+            priority,
         ),
     )
-    db.commit()
     build_id = cur.lastrowid
+    build_logs.append_chunks(db, [(build_id, "[ui] Build requested by operator\n")])
+    db.commit()
+    wakeup.notify()
     flash(f"Сборка #{build_id} поставлена в очередь", "success")
     return redirect(url_for("requests.view_request", request_id=request_id))
 
@@ -0,0 +1,82 @@
+"""
+Pluggable clock for the simulator.
+
+The engine, metric timestamps and runtime log lines read time through
+`now()` / `get_clock()` instead of `datetime.utcnow()` and `time.sleep()`.
+`WallClock` is the default. `VirtualClock` backs time-warp mode: the engine
+does not sleep but advances the clock straight to its next timer, so an hour
+of simulated fleet behaviour takes as long as its ticks take to compute.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+
+class WallClock:
+    warp = False
+
+    def now(self) -> datetime:
+        """Naive UTC datetime, like `datetime.utcnow()`."""
+        return datetime.utcnow()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def advance(self, seconds: float) -> None:  # pragma: no cover - no-op
+        pass
+
+
+class VirtualClock:
+    """Clock that only moves when `advance()` is called."""
+
+    warp = True
+
+    def __init__(self, start: datetime | None = None):
+        self._start = start or datetime.utcnow()
+        self._elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime:
+        with self._lock:
+            return self._start + timedelta(seconds=self._elapsed)
+
+    def monotonic(self) -> float:
+        with self._lock:
+            return self._elapsed
+
+    def advance(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._elapsed += seconds
+
+
+_clock: WallClock | VirtualClock = WallClock()
+
+
+def get_clock() -> WallClock | VirtualClock:
+    return _clock
+
+
+def set_clock(clock: WallClock | VirtualClock) -> None:
+    global _clock
+    _clock = clock
+
+
+def now() -> datetime:
+    return _clock.now()
+
+
+def timestamp() -> float:
+    """Current clock time as epoch seconds."""
+    return _clock.now().replace(tzinfo=timezone.utc).timestamp()
+
+
+def isonow() -> str:
+    """Current clock time as the ISO string used for DB timestamps."""
+    return _clock.now().isoformat(timespec="seconds")
+
+
@@ -0,0 +1,95 @@
+"""
+Downsampling of metric series for charts.
+
+Both algorithms return sorted indices into the input, so one selection can
+be applied to the shared timestamp column and to every value column:
+
+* `lttb` — largest-triangle-three-buckets, picking in each bucket the
+  point with the largest summed triangle area over all value series. Keeps
+  the visual shape of a line chart with exactly `threshold` points.
+* `minmax` — per bucket, the positions of the minimum and maximum of each
+  series. Never hides a spike, at up to 2 points per series per bucket,
+  unless `max_points` is below 2 per series (see `select`).
+"""
+
+from __future__ import annotations
+
+from typing import List, Sequence
+
+import numpy as np
+
+
+ALGORITHMS = ("lttb", "minmax")
+
+
+def lttb(xs: Sequence[float], ys: Sequence[Sequence[float]], threshold: int) -> List[int]:
+    n = len(xs)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        return [0, n - 1][: max(threshold, 0)]
+    x = np.asarray(xs, dtype=np.float64)
+    y = np.asarray(ys, dtype=np.float64).reshape(len(ys), n)
+
+    # first and last points are always kept; the rest is split into
+    # threshold - 2 buckets over indices 1 .. n-2
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    picked = [0]
+    a = 0
+    for b in range(threshold - 2):
+        lo, hi = int(edges[b]), int(edges[b + 1])
+        # average of the next bucket (or the last point for the final one)
+        if b + 2 < len(edges):
+            nlo, nhi = edges[b + 1], edges[b + 2]
+            avg_x = x[nlo:nhi].mean()
+            avg_y = y[:, nlo:nhi].mean(axis=1)
+        else:
+            avg_x = x[n - 1]
+            avg_y = y[:, n - 1]
+        ax, ay = x[a], y[:, a]
+        area = np.abs(
+            (ax - avg_x) * (y[:, lo:hi] - ay[:, None])
+            - (ax - x[lo:hi]) * (avg_y - ay)[:, None]
+        ).sum(axis=0)
+        a = lo + int(area.argmax())
+        picked.append(a)
+    picked.append(n - 1)
+    return picked
+
+
+def minmax(ys: Sequence[Sequence[float]], buckets: int) -> List[int]:
+    n = len(ys[0]) if ys else 0
+    if buckets <= 0 or n <= buckets * 2 * len(ys):
+        return list(range(n))
+    y = np.asarray(ys, dtype=np.float64).reshape(len(ys), n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    picked: set[int] = set()
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi <= lo:
+            continue
+        chunk = y[:, lo:hi]
+        picked.update((lo + chunk.argmin(axis=1)).tolist())
+        picked.update((lo + chunk.argmax(axis=1)).tolist())
+    return sorted(picked)
+
+
+def select(
+    xs: Sequence[float],
+    ys: Sequence[Sequence[float]],
+    max_points: int,
+    algorithm: str = "lttb",
+) -> List[int]:
+    """Indices of at most `max_points` points to draw."""
+    if len(xs) <= max_points:
+        return list(range(len(xs)))
+    if algorithm == "minmax":
+        picked = minmax(ys, max(max_points // (2 * len(ys)), 1))
+        if len(picked) > max_points:
+            # too few points for a min and max of every series: keep an
+            # evenly spread subset of the extremes
+            spread = np.linspace(0, len(picked) - 1, max_points).round().astype(np.int64)
+            picked = [picked[i] for i in spread]
+        return picked
+    return lttb(xs, ys, max_points)
+
+
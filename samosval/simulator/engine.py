@@ -1,149 +1,548 @@
 from __future__ import annotations
 
+import os
 import random
+import socket
 import threading
 import time
-from datetime import datetime
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import numpy as np
 
 from flask import current_app
 
-from ..db import get_db, write_audit
-from . import state
+from .. import audit, build_logs
+from ..db import begin_write, get_db, insert_audit_rows
+from . import clock, logfmt, logstore, scheduler, state, tsstore, wakeup
+from .metrics_gen import BatchedMetricsGenerator
+
+
+# Seconds between lifecycle steps while builds/deployments are in flight.
+LIFECYCLE_STEP_SECONDS = 1.0
+# Seconds between runtime log/metrics generation while something is running.
+RUNTIME_INTERVAL_SECONDS = 1.0
+# Safety-net rescan period when idle and no notification arrives.
+IDLE_RESCAN_SECONDS = 30.0
+# Minimum gap between notification-driven lifecycle steps, so a burst of
+# notifications does not fast-forward builds that are already in flight.
+NOTIFY_MIN_GAP_SECONDS = 0.2
+# Seconds a claimed build/deployment stays leased without renewal; after that
+# another engine process may take it over (e.g. after a crash).
+DEFAULT_LEASE_SECONDS = 15
+# Wall-clock budget for one tick (lifecycle + runtime) and per-phase caps;
+# work beyond them is carried over to the next tick via round-robin cursors.
+# An engine leases up to one tick's cap of in-flight builds/deployments.
+DEFAULT_TICK_BUDGET_MS = 500
+DEFAULT_MAX_BUILDS_PER_TICK = 200
+DEFAULT_MAX_DEPLOYMENTS_PER_TICK = 200
+DEFAULT_MAX_RUNTIME_LOGS_PER_TICK = 2000
+# Min seconds between "falling behind" warnings.
+BACKLOG_WARN_INTERVAL_SECONDS = 30.0
+
+# Simulated runtime log messages per level, and how often each level occurs.
+RUNTIME_LOG_MESSAGES = {
+    logfmt.INFO: (
+        "Handling request",
+        "Background job executed",
+        "Health check OK",
+    ),
+    logfmt.WARN: (
+        "Slow response detected",
+        "Retrying external call",
+    ),
+    logfmt.ERROR: (
+        "Unhandled exception in worker",
+        "Database connection timeout",
+    ),
+}
+RUNTIME_LOG_LEVEL_WEIGHTS = (80, 15, 5)
+
+
+def _config_int(name: str, default: int) -> int:
+    return int(current_app.config.get(name, default))
+
+
+def _phase_cap(table: str) -> int:
+    """Max in-flight builds/deployments handled (and leased) per tick."""
+    if table == "builds":
+        return _config_int("ENGINE_MAX_BUILDS_PER_TICK", DEFAULT_MAX_BUILDS_PER_TICK)
+    return _config_int("ENGINE_MAX_DEPLOYMENTS_PER_TICK", DEFAULT_MAX_DEPLOYMENTS_PER_TICK)
+
+
+class _Budget:
+    """Deadline shared by the phases of one tick."""
+
+    def __init__(self, budget_ms: int):
+        self.deadline = time.perf_counter() + budget_ms / 1000.0
+
+    def exhausted(self) -> bool:
+        return time.perf_counter() >= self.deadline
+
+
+@dataclass
+class TickReport:
+    """Per-tick counters: how many rows changed and how many statements it took."""
+
+    builds_changed: int = 0
+    deployments_changed: int = 0
+    images_created: int = 0
+    log_chunks: int = 0
+    audit_rows: int = 0
+    statements: int = 0
+    commits: int = 0
+    duration_ms: float = 0.0
+    # Work this engine could have done but left for later ticks: leased or
+    # claimable in-flight rows it did not advance, and runtime log generation
+    # it skipped. Builds waiting for a worker slot are queue, not backlog.
+    backlog_builds: int = 0
+    backlog_deployments: int = 0
+    backlog_runtime: int = 0
+    deferred_phases: list[str] = field(default_factory=list)
+
+    @property
+    def backlog(self) -> int:
+        return self.backlog_builds + self.backlog_deployments + self.backlog_runtime
+
+    @property
+    def rows_written(self) -> int:
+        return (
+            self.builds_changed
+            + self.deployments_changed
+            + self.images_created
+            + self.log_chunks
+            + self.audit_rows
+        )
+
+
+@dataclass
+class _TickPlan:
+    """Transitions computed during a tick, applied later in one transaction."""
+
+    # (status, error_message, worker_slot, lease_owner, lease_expires_at, build_id)
+    # for builds that change status
+    build_updates: list[tuple] = field(default_factory=list)
+    # (build_id, text) appended to build_log_chunks
+    log_chunks: list[tuple] = field(default_factory=list)
+    # build_id -> (request_id, image_name, version)
+    new_images: dict[int, tuple] = field(default_factory=dict)
+    # (build_id, built_by) for successful builds, audited once image ids are known
+    succeeded: list[tuple] = field(default_factory=list)
+    # (status, updated_at, deployment_id); finished deployments drop their lease
+    deployment_updates: list[tuple] = field(default_factory=list)
+    # (alert_type, target_id, message, resolved, created_at)
+    alerts: list[tuple] = field(default_factory=list)
+    # (user_id, action, target_id, details, created_at)
+    audit: list[tuple] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not (self.build_updates or self.log_chunks or self.deployment_updates)
 
 
 class SimulationEngine(threading.Thread):
     """
     Background daemon thread that simulates:
-    - builds lifecycle and logs
-    - deployments lifecycle
-    - runtime logs & metrics for running deployments
+    - builds lifecycle and logs (`lifecycle=True`)
+    - deployments lifecycle (`lifecycle=True`)
+    - runtime logs & metrics for running deployments (`runtime=True`)
+
+    Lifecycle work is claimed through lease columns on builds/deployments,
+    so any number of engines (threads or processes) can share one database.
     """
 
-    def __init__(self, app):
+    def __init__(self, app, lifecycle: bool = True, runtime: bool = True):
         super().__init__(daemon=True)
         self.app = app
+        self.lifecycle = lifecycle
+        self.runtime = runtime
+        self.worker_id = ""
         self._stop_event = threading.Event()
+        self.last_report = TickReport()
+        self.last_runtime_backlog = 0
+        # Seeded RNGs make load scenarios replay identically (SIMULATOR_SEED).
+        seed = app.config.get("SIMULATOR_SEED")
+        self.rng = random.Random(seed)
+        self._metrics = BatchedMetricsGenerator(np.random.default_rng(seed))
+        if runtime and tsstore.enabled():
+            # this engine produces metrics: queue closed buckets for disk
+            state.keep_closed_buckets()
+        # last id handled per phase, for round-robin over capped work
+        self._cursors = {"builds": 0, "deployments": 0, "runtime": 0}
+        self._last_backlog_warning = 0.0
+        # deployment id -> (name, image tag, "name (image:tag)"), the string
+        # shared by all of its log records; only running deployments are kept
+        self._log_contexts: dict[int, tuple[str, str, str]] = {}
 
     def stop(self) -> None:
         self._stop_event.set()
+        wakeup.notify()
 
     def run(self) -> None:  # pragma: no cover - background loop
+        """
+        Event-driven loop: lifecycle steps run on notification or every
+        LIFECYCLE_STEP_SECONDS while work is in flight; runtime generation
+        keeps its own timer and backs off when nothing is running.
+
+        With a virtual clock (time-warp mode) the loop never sleeps: it
+        advances the clock to the next due timer and runs ticks back-to-back.
+        """
+        clk = clock.get_clock()
+        if self.runtime:
+            # the first running engine per LOG_DIR writes the runtime log
+            # segments, others (more web workers) leave them alone
+            logstore.enable_writes()
         with self.app.app_context():
+            last_lifecycle = 0.0
+            next_lifecycle = 0.0 if self.lifecycle else float("inf")
+            next_runtime = 0.0 if self.runtime else float("inf")
             while not self._stop_event.is_set():
-                try:
-                    self._tick()
-                except Exception:  # log but never crash the thread
-                    current_app.logger.exception("SimulationEngine tick failed")
-                time.sleep(1.0)
+                now = clk.monotonic()
+                budget = _Budget(_config_int("ENGINE_TICK_BUDGET_MS", DEFAULT_TICK_BUDGET_MS))
+                if now >= next_lifecycle:
+                    last_lifecycle = now
+                    in_flight = self._guarded(self._step_lifecycle, budget)
+                    self._guarded(self._archive_audit)
+                    next_lifecycle = now + (
+                        LIFECYCLE_STEP_SECONDS if in_flight else IDLE_RESCAN_SECONDS
+                    )
+                    if self.runtime and self.last_report.deployments_changed:
+                        # something may have become running
+                        next_runtime = now
+                if now >= next_runtime:
+                    if budget.exhausted():
+                        # lifecycle used the whole budget; run as soon as possible
+                        next_runtime = now + NOTIFY_MIN_GAP_SECONDS
+                    else:
+                        running = self._guarded(self._generate_runtime, budget)
+                        next_runtime = now + (
+                            RUNTIME_INTERVAL_SECONDS if running else IDLE_RESCAN_SECONDS
+                        )
+                        if self.last_runtime_backlog:
+                            # carry leftover log generation into the next tick
+                            next_runtime = now + NOTIFY_MIN_GAP_SECONDS
+
+                timeout = max(0.0, min(next_lifecycle, next_runtime) - clk.monotonic())
+                if clk.warp:
+                    woken = wakeup.wait(0)
+                    clk.advance(timeout)
+                else:
+                    woken = wakeup.wait(timeout)
+                if woken and self.lifecycle:
+                    next_lifecycle = min(
+                        next_lifecycle, last_lifecycle + NOTIFY_MIN_GAP_SECONDS
+                    )
+            if self.lifecycle:
+                self._guarded(self._release_leases)
+            if self.runtime:
+                self._guarded(tsstore.flush, True)
+                self._guarded(logstore.close)
+                # let another process's engine take over the segment files
+                logstore.enable_writes(False)
 
     # --- internals -----------------------------------------------------
 
-    def _tick(self) -> None:
-        self._process_builds()
-        self._process_deployments()
-        self._generate_runtime()
+    def _guarded(self, step, *args):
+        try:
+            return step(*args)
+        except Exception:  # log but never crash the thread
+            current_app.logger.exception("SimulationEngine %s failed", step.__name__)
+            return True
+
+    def _archive_audit(self) -> None:
+        """Move audit rows past AUDIT_RETENTION_DAYS to the archives, a few batches a pass."""
+        moved = audit.archive_if_due(
+            get_db(),
+            current_app.config.get("AUDIT_ARCHIVE_DIR"),
+            _config_int("AUDIT_RETENTION_DAYS", 90),
+        )
+        if moved:
+            current_app.logger.info("SimulationEngine archived %d audit rows", moved)
 
-    def _process_builds(self) -> None:
+    def _round_robin(self, db, phase: str, sql: str, params: tuple, cap: int) -> list:
         """
-        builds.status: queued -> building -> success/failed
-        During building we enrich build_log.
+        Run `sql` (which must end with `AND <id> > ? ORDER BY <id> LIMIT ?`)
+        starting after the phase cursor and wrapping around once, so capped
+        phases visit every row over consecutive ticks.
+        """
+        cursor = self._cursors[phase]
+        rows = db.execute(sql, params + (cursor, cap)).fetchall()
+        if len(rows) < cap and cursor:
+            wrapped = db.execute(sql, params + (0, cap - len(rows))).fetchall()
+            rows += [r for r in wrapped if r["id"] <= cursor]
+        self._cursors[phase] = rows[-1]["id"] if len(rows) >= cap else 0
+        return rows
+
+    def _report_backlog(self, report: TickReport) -> None:
+        if not (report.deferred_phases or report.backlog):
+            return
+        now = time.monotonic()
+        if now - self._last_backlog_warning < BACKLOG_WARN_INTERVAL_SECONDS:
+            return
+        self._last_backlog_warning = now
+        current_app.logger.warning(
+            "SimulationEngine is falling behind: backlog builds=%d deployments=%d "
+            "runtime=%d, deferred phases=%s, tick took %.1f ms",
+            report.backlog_builds,
+            report.backlog_deployments,
+            report.backlog_runtime,
+            ",".join(report.deferred_phases) or "-",
+            report.duration_ms,
+        )
+
+    def _lease_owner(self) -> str:
+        # Computed lazily: the pid changes if the engine is created before a fork.
+        pid = os.getpid()
+        if not self.worker_id.endswith(f":{pid}:{id(self):x}"):
+            self.worker_id = f"{socket.gethostname()}:{pid}:{id(self):x}"
+        return self.worker_id
+
+    def _lease_expiry(self) -> str:
+        seconds = int(current_app.config.get("ENGINE_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+        return (clock.now() + timedelta(seconds=seconds)).isoformat(timespec="seconds")
+
+    def _claim_leases(self, db) -> None:
         """
+        Renew leases this engine holds and claim unleased or expired in-flight
+        rows up to the per-tick cap of their phase, so that cap (not the
+        leases) bounds a tick. Queued builds are not leased: the scheduler
+        starts them, and the engine that does so leases them.
+        """
+        me = self._lease_owner()
+        now = clock.isonow()
+        expires = self._lease_expiry()
+        for table, status in (("builds", "building"), ("deployments", "deploying")):
+            batch = _phase_cap(table)
+            held = db.execute(
+                f"""
+                UPDATE {table}
+                   SET lease_expires_at = ?
+                 WHERE lease_owner = ? AND status = ?
+                """,
+                (expires, me, status),
+            ).rowcount
+            if held >= batch:
+                continue
+            db.execute(
+                f"""
+                UPDATE {table}
+                   SET lease_owner = ?, lease_expires_at = ?
+                 WHERE id IN (
+                        SELECT id
+                          FROM {table}
+                         WHERE status = ?
+                           AND (lease_owner IS NULL OR lease_expires_at < ?)
+                         ORDER BY id
+                         LIMIT ?
+                       )
+                """,
+                (me, expires, status, now, batch - held),
+            )
+
+    def _release_leases(self) -> None:
+        """Hand back leases on shutdown so other engines need not wait for expiry."""
         db = get_db()
-        rows = db.execute(
-            "SELECT * FROM builds WHERE status IN ('queued', 'building')"
-        ).fetchall()
-        for row in rows:
-            status = row["status"]
-            log_text = row["build_log"] or ""
-
-            if status == "queued":
-                # Move to building
-                log_text += "[engine] Build queued, starting...\n"
-                db.execute(
-                    "UPDATE builds SET status = ?, build_log = ? WHERE id = ?",
-                    ("building", log_text, row["id"]),
-                )
-                self._audit(
-                    user_id=row["built_by"],
-                    action="build_start",
-                    target_id=row["id"],
-                    details=f"Build {row['id']} started by simulation engine",
-                )
-            elif status == "building":
-                # Add random log lines
-                for _ in range(random.randint(1, 3)):
-                    log_text += self._random_build_log_line(row)
-
-                # Randomly finish
-                if random.random() < 0.3:
-                    if random.random() < 0.85:
-                        # success -> create image
-                        image_id = self._create_image_for_build(db, row)
-                        db.execute(
-                            """
-                            UPDATE builds
-                               SET status = ?, image_id = ?, build_log = ?
-                             WHERE id = ?
-                            """,
-                            ("success", image_id, log_text + "[engine] Build SUCCESS\n", row["id"]),
-                        )
-                        self._audit(
-                            user_id=row["built_by"],
-                            action="build_finish",
-                            target_id=row["id"],
-                            details=f"Build {row['id']} finished successfully (image_id={image_id})",
-                        )
-                    else:
-                        error_message = "Simulated build failure"
-                        db.execute(
-                            """
-                            UPDATE builds
-                               SET status = ?, error_message = ?, build_log = ?
-                             WHERE id = ?
-                            """,
-                            (
-                                "failed",
-                                error_message,
-                                log_text + "[engine] Build FAILED\n",
-                                row["id"],
-                            ),
-                        )
-                        self._audit(
-                            user_id=row["built_by"],
-                            action="build_finish",
-                            target_id=row["id"],
-                            details=f"Build {row['id']} failed",
-                        )
-                else:
-                    db.execute(
-                        "UPDATE builds SET build_log = ? WHERE id = ?",
-                        (log_text, row["id"]),
-                    )
+        me = self._lease_owner()
+        begin_write(db)
+        for table in ("builds", "deployments"):
+            db.execute(
+                f"""
+                UPDATE {table}
+                   SET lease_owner = NULL, lease_expires_at = NULL
+                 WHERE lease_owner = ?
+                """,
+                (me,),
+            )
+        db.commit()
+
+    def _claimable_count(self, db, table: str, status: str) -> int:
+        """Rows in `status` that are leased to this engine or free to claim."""
+        return db.execute(
+            f"""
+            SELECT COUNT(*)
+              FROM {table}
+             WHERE status = ?
+               AND (lease_owner = ? OR lease_owner IS NULL OR lease_expires_at < ?)
+            """,
+            (status, self._lease_owner(), clock.isonow()),
+        ).fetchone()[0]
 
-        if rows:
+    def _step_lifecycle(self, budget: _Budget | None = None) -> bool:
+        """Advance builds and deployments; return True if any are still in flight."""
+        started = time.perf_counter()
+        if budget is None:
+            budget = _Budget(_config_int("ENGINE_TICK_BUDGET_MS", DEFAULT_TICK_BUDGET_MS))
+        db = get_db()
+        report = TickReport()
+        plan = _TickPlan()
+
+        # Claim, plan and apply inside one IMMEDIATE transaction: the write
+        # lock is taken once per tick, and engines in other processes see
+        # either none or all of this tick's claims and transitions.
+        if db.in_transaction:
+            db.commit()
+        begin_write(db)
+        try:
+            self._claim_leases(db)
+            in_flight = self._plan_builds(db, plan, report)
+            if budget.exhausted():
+                report.deferred_phases.append("deployments")
+                report.backlog_deployments = self._claimable_count(db, "deployments", "deploying")
+                in_flight += report.backlog_deployments
+            else:
+                in_flight += self._plan_deployments(db, plan, report)
+            if not plan.is_empty():
+                self._apply_plan(db, plan, report)
             db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        report.commits += 1
+
+        report.duration_ms = (time.perf_counter() - started) * 1000.0
+        report.backlog_runtime = self.last_runtime_backlog
+        self.last_report = report
+        self._report_backlog(report)
+        if report.rows_written:
+            current_app.logger.debug(
+                "SimulationEngine tick: rows=%d (builds=%d deployments=%d images=%d "
+                "log_chunks=%d audit=%d) statements=%d commits=%d in %.1f ms",
+                report.rows_written,
+                report.builds_changed,
+                report.deployments_changed,
+                report.images_created,
+                report.log_chunks,
+                report.audit_rows,
+                report.statements,
+                report.commits,
+                report.duration_ms,
+            )
+        return in_flight > 0
 
-    def _create_image_for_build(self, db, build_row):
-        """Create image from build's request if not already linked."""
-        req = db.execute(
-            "SELECT * FROM image_requests WHERE id = ?", (build_row["request_id"],)
-        ).fetchone()
-        if not req:
-            return None
-        image_name = req["image_name"]
-        version = req["version_tag"]
-        image_tag = f"{image_name}:{version}"
-        now = datetime.utcnow().isoformat(timespec="seconds")
-        cur = db.execute(
+    def _plan_builds(self, db, plan: _TickPlan, report: TickReport) -> int:
+        """
+        builds.status: queued -> building -> success/failed
+        During building we append chunks to the build log.
+        Queued builds only start when the scheduler gives them a free worker;
+        building ones are advanced only by the engine holding their lease, at
+        most ENGINE_MAX_BUILDS_PER_TICK of them per tick.
+        Returns the number of builds in flight before this tick.
+        """
+        counts = dict(
+            db.execute(
+                """
+                SELECT status, COUNT(*)
+                  FROM builds
+                 WHERE status IN ('queued', 'building')
+                 GROUP BY status
+                """
+            ).fetchall()
+        )
+        n_queued = counts.get("queued", 0)
+        n_building = counts.get("building", 0)
+        now = clock.isonow()
+        me = self._lease_owner()
+        expires = self._lease_expiry()
+
+        # Slot occupancy is global; the queue is read only when a slot is free,
+        # and only the first few builds of each owner/operator bucket matter.
+        building_slots = db.execute(
+            """
+            SELECT b.id, b.built_by, b.worker_slot, r.owner_id
+              FROM builds b
+              LEFT JOIN image_requests r ON b.request_id = r.id
+             WHERE b.status = 'building'
             """
-            INSERT INTO images (request_id, name, version, image_tag, created_at)
-            VALUES (?, ?, ?, ?, ?)
+        ).fetchall()
+        workers = scheduler.max_workers()
+        free = workers - len(building_slots)
+        queued: dict[int, object] = {}
+        if n_queued and free > 0:
+            queued = {
+                r["id"]: r
+                for r in db.execute(
+                    """
+                    SELECT id, built_by, priority, owner_id
+                      FROM (
+                            SELECT b.id, b.built_by, b.priority, r.owner_id,
+                                   ROW_NUMBER() OVER (
+                                       PARTITION BY r.owner_id, b.built_by
+                                       ORDER BY b.priority DESC, b.id
+                                   ) AS rn
+                              FROM builds b
+                              LEFT JOIN image_requests r ON b.request_id = r.id
+                             WHERE b.status = 'queued'
+                           )
+                     WHERE rn <= ?
+                    """,
+                    (free,),
+                ).fetchall()
+            }
+        started = scheduler.pick_builds_to_start(list(queued.values()), building_slots, workers)
+
+        for build_id, slot in started:
+            plan.log_chunks.append(
+                (build_id, f"[engine] Build picked by worker #{slot}, starting...\n")
+            )
+            plan.build_updates.append(("building", None, slot, me, expires, build_id))
+            plan.audit.append(
+                (
+                    queued[build_id]["built_by"],
+                    "build_start",
+                    build_id,
+                    f"Build {build_id} started by simulation engine (worker #{slot})",
+                    now,
+                )
+            )
+
+        cap = _phase_cap("builds")
+        building = self._round_robin(
+            db,
+            "builds",
+            """
+            SELECT b.id, b.request_id, b.built_by, r.image_name, r.version_tag
+              FROM builds b
+              LEFT JOIN image_requests r ON b.request_id = r.id
+             WHERE b.status = 'building' AND b.lease_owner = ?
+               AND b.id > ?
+             ORDER BY b.id
+             LIMIT ?
             """,
-            (req["id"], image_name, version, image_tag, now),
+            (me,),
+            cap,
         )
-        image_id = cur.lastrowid
-        db.commit()
-        return image_id
+        report.backlog_builds = max(
+            self._claimable_count(db, "builds", "building") - len(building), 0
+        )
+
+        for row in building:
+            # Add random log lines
+            log_text = "".join(
+                self._random_build_log_line(row) for _ in range(self.rng.randint(1, 3))
+            )
+
+            # Randomly finish
+            if self.rng.random() < 0.3:
+                if self.rng.random() < 0.85:
+                    # success -> image is created when the plan is applied
+                    if row["image_name"] is not None:
+                        plan.new_images[row["id"]] = (
+                            row["request_id"],
+                            row["image_name"],
+                            row["version_tag"],
+                        )
+                    log_text += "[engine] Build SUCCESS\n"
+                    plan.build_updates.append(("success", None, None, None, None, row["id"]))
+                    plan.succeeded.append((row["id"], row["built_by"]))
+                else:
+                    log_text += "[engine] Build FAILED\n"
+                    plan.build_updates.append(
+                        ("failed", "Simulated build failure", None, None, None, row["id"])
+                    )
+                    plan.audit.append(
+                        (row["built_by"], "build_finish", row["id"], f"Build {row['id']} failed", now)
+                    )
+            plan.log_chunks.append((row["id"], log_text))
+        return n_queued + n_building
 
     def _random_build_log_line(self, build_row) -> str:
         messages = [
@@ -154,63 +553,164 @@ class SimulationEngine(threading.Thread):
             "Optimizing layers...",
             "Pushing image to registry (simulated)...",
         ]
-        msg = random.choice(messages)
+        msg = self.rng.choice(messages)
         return f"[engine] {msg}\n"
 
-    def _process_deployments(self) -> None:
+    def _plan_deployments(self, db, plan: _TickPlan, report: TickReport) -> int:
         """
         deployments.status: deploying -> running/failed (with alerts on fail)
+        At most ENGINE_MAX_DEPLOYMENTS_PER_TICK leased rows are handled per tick.
+        Returns the number of deployments in flight before this tick.
         """
-        db = get_db()
-        rows = db.execute(
-            "SELECT * FROM deployments WHERE status = 'deploying'"
-        ).fetchall()
+        total = db.execute(
+            "SELECT COUNT(*) FROM deployments WHERE status = 'deploying'"
+        ).fetchone()[0]
+        cap = _phase_cap("deployments")
+        rows = self._round_robin(
+            db,
+            "deployments",
+            """
+            SELECT id
+              FROM deployments
+             WHERE status = 'deploying' AND lease_owner = ?
+               AND id > ?
+             ORDER BY id
+             LIMIT ?
+            """,
+            (self._lease_owner(),),
+            cap,
+        )
+        report.backlog_deployments = max(
+            self._claimable_count(db, "deployments", "deploying") - len(rows), 0
+        )
+        now = clock.isonow()
         for row in rows:
             # Randomly decide final status
-            if random.random() < 0.4:
-                if random.random() < 0.85:
-                    new_status = "running"
-                    alert = None
-                else:
-                    new_status = "failed"
-                    alert = "Deployment failed during startup (simulated)"
+            if self.rng.random() >= 0.4:
+                continue
+            if self.rng.random() < 0.85:
+                plan.deployment_updates.append(("running", now, row["id"]))
+                plan.audit.append(
+                    (None, "deployment_running", row["id"], "Deployment is now running", now)
+                )
+            else:
+                alert = "Deployment failed during startup (simulated)"
+                plan.deployment_updates.append(("failed", now, row["id"]))
+                plan.alerts.append(("deployment", row["id"], alert, 0, now))
+                plan.audit.append((None, "deployment_failed", row["id"], alert, now))
+        return total
 
-                now = datetime.utcnow().isoformat(timespec="seconds")
-                db.execute(
-                    """
-                    UPDATE deployments
-                       SET status = ?, updated_at = ?
-                     WHERE id = ?
-                    """,
-                    (new_status, now, row["id"]),
+    def _apply_plan(self, db, plan: _TickPlan, report: TickReport) -> None:
+        """Write all planned transitions, alerts and audit rows; caller commits."""
+        now = clock.isonow()
+        # Images need their ids for the build rows, so they are the only
+        # per-row inserts; everything else goes through executemany.
+        image_ids: dict[int, int] = {}
+        for build_id, (request_id, name, version) in plan.new_images.items():
+            cur = db.execute(
+                """
+                INSERT INTO images (request_id, name, version, image_tag, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (request_id, name, version, f"{name}:{version}", now),
+            )
+            image_ids[build_id] = cur.lastrowid
+            report.statements += 1
+        report.images_created = len(image_ids)
+
+        build_rows = [
+            (
+                status,
+                image_ids.get(build_id),
+                error_message,
+                worker_slot,
+                now if status == "building" else None,
+                now if status in {"success", "failed"} else None,
+                lease_owner,
+                lease_expires_at,
+                build_id,
+            )
+            for (
+                status,
+                error_message,
+                worker_slot,
+                lease_owner,
+                lease_expires_at,
+                build_id,
+            ) in plan.build_updates
+        ]
+        for build_id, built_by in plan.succeeded:
+            plan.audit.append(
+                (
+                    built_by,
+                    "build_finish",
+                    build_id,
+                    f"Build {build_id} finished successfully (image_id={image_ids.get(build_id)})",
+                    now,
                 )
+            )
+        if build_rows:
+            db.executemany(
+                """
+                UPDATE builds
+                   SET status = ?,
+                       image_id = COALESCE(?, image_id),
+                       error_message = COALESCE(?, error_message),
+                       worker_slot = COALESCE(?, worker_slot),
+                       started_at = COALESCE(?, started_at),
+                       finished_at = COALESCE(?, finished_at),
+                       lease_owner = ?,
+                       lease_expires_at = ?
+                 WHERE id = ?
+                """,
+                build_rows,
+            )
+            report.statements += 1
+        report.builds_changed = len(build_rows)
 
-                if alert:
-                    db.execute(
-                        """
-                        INSERT INTO alerts (alert_type, target_id, message, resolved, created_at)
-                        VALUES (?, ?, ?, ?, ?)
-                        """,
-                        ("deployment", row["id"], alert, 0, now),
-                    )
-                    self._audit(
-                        user_id=None,
-                        action="deployment_failed",
-                        target_id=row["id"],
-                        details=alert,
-                    )
-                else:
-                    self._audit(
-                        user_id=None,
-                        action="deployment_running",
-                        target_id=row["id"],
-                        details="Deployment is now running",
-                    )
-        if rows:
-            db.commit()
+        if plan.log_chunks:
+            build_logs.append_chunks(db, plan.log_chunks)
+            report.statements += 1
+        report.log_chunks = len(plan.log_chunks)
+
+        if plan.deployment_updates:
+            db.executemany(
+                """
+                UPDATE deployments
+                   SET status = ?, updated_at = ?,
+                       lease_owner = NULL, lease_expires_at = NULL
+                 WHERE id = ?
+                """,
+                plan.deployment_updates,
+            )
+            report.statements += 1
+        report.deployments_changed = len(plan.deployment_updates)
+
+        if plan.alerts:
+            db.executemany(
+                """
+                INSERT INTO alerts (alert_type, target_id, message, resolved, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                plan.alerts,
+            )
+            report.statements += 1
+
+        if plan.audit:
+            insert_audit_rows(db, plan.audit)
+            report.statements += 1
+        report.audit_rows = len(plan.audit)
 
-    def _generate_runtime(self) -> None:
-        """Generate runtime logs and metrics for running deployments."""
+    def _generate_runtime(self, budget: _Budget | None = None) -> int:
+        """
+        Generate runtime logs and metrics for running deployments; return their count.
+
+        Metrics are one vectorized step for everyone. Log generation is capped
+        per tick and stops early when the budget runs out, continuing from a
+        round-robin cursor next time.
+        """
+        if budget is None:
+            budget = _Budget(_config_int("ENGINE_TICK_BUDGET_MS", DEFAULT_TICK_BUDGET_MS))
         db = get_db()
         deployments = db.execute(
             """
@@ -218,58 +718,46 @@ class SimulationEngine(threading.Thread):
               FROM deployments d
               JOIN images i ON d.image_id = i.id
              WHERE d.status = 'running'
+             ORDER BY d.id
             """
         ).fetchall()
 
-        for d in deployments:
-            # Logs
-            for _ in range(random.randint(1, 3)):
-                line = self._random_runtime_log_line(d)
-                state.append_log(d["id"], line)
-            # Metrics
-            self._generate_metrics_for_deployment(d["id"])
-
-    def _random_runtime_log_line(self, d_row) -> str:
-        level = random.choices(
-            population=["INFO", "WARN", "ERROR"],
-            weights=[80, 15, 5],
+        # Metrics for all running deployments in one vectorized step
+        self._metrics.step([d["id"] for d in deployments], clock.now())
+        for gone in self._log_contexts.keys() - {d["id"] for d in deployments}:
+            del self._log_contexts[gone]
+        tsstore.flush_if_due()
+        state.maintain_if_due()
+
+        cap = _config_int("ENGINE_MAX_RUNTIME_LOGS_PER_TICK", DEFAULT_MAX_RUNTIME_LOGS_PER_TICK)
+        cursor = self._cursors["runtime"]
+        start = next((i for i, d in enumerate(deployments) if d["id"] > cursor), 0)
+        order = deployments[start:] + deployments[:start]
+        done = 0
+        for d in order[:cap]:
+            if done % 100 == 0 and done and budget.exhausted():
+                break
+            for _ in range(self.rng.randint(1, 3)):
+                level, message = self._random_runtime_log_record()
+                state.append_record(d["id"], level, message, self._log_context(d))
+            done += 1
+        logstore.flush_if_due()
+        self.last_runtime_backlog = len(deployments) - done
+        self._cursors["runtime"] = order[done - 1]["id"] if done and self.last_runtime_backlog else 0
+        return len(deployments)
+
+    def _random_runtime_log_record(self) -> tuple[int, str]:
+        level = self.rng.choices(
+            population=tuple(RUNTIME_LOG_MESSAGES),
+            weights=RUNTIME_LOG_LEVEL_WEIGHTS,
         )[0]
-        messages = {
-            "INFO": [
-                "Handling request",
-                "Background job executed",
-                "Health check OK",
-            ],
-            "WARN": [
-                "Slow response detected",
-                "Retrying external call",
-            ],
-            "ERROR": [
-                "Unhandled exception in worker",
-                "Database connection timeout",
-            ],
-        }
-        msg = random.choice(messages[level])
-        ts = datetime.utcnow().isoformat(timespec="seconds")
-        return f"{ts} [{level}] {d_row['name']} ({d_row['image_tag']}) - {msg}"
-
-    def _generate_metrics_for_deployment(self, deployment_id: int) -> None:
-        cpu, ram = state.get_or_create_metric_state(deployment_id)
-        # random walk
-        cpu += random.uniform(-5.0, 5.0)
-        ram += random.uniform(-5.0, 5.0)
-        cpu = max(0.0, min(100.0, cpu))
-        ram = max(0.0, min(100.0, ram))
-        state.update_metric_state(deployment_id, cpu, ram)
-
-        point = state.MetricPoint(
-            ts=datetime.utcnow(),
-            cpu=cpu,
-            ram=ram,
-        )
-        state.append_metric_point(deployment_id, point)
+        return level, self.rng.choice(RUNTIME_LOG_MESSAGES[level])
 
-    def _audit(self, user_id, action: str, target_id: int | None, details: str) -> None:
-        write_audit(user_id=user_id, action=action, target_id=target_id, details=details)
+    def _log_context(self, d_row) -> str:
+        name, tag = d_row["name"], d_row["image_tag"]
+        entry = self._log_contexts.get(d_row["id"])
+        if entry is None or entry[0] != name or entry[1] != tag:
+            entry = self._log_contexts[d_row["id"]] = (name, tag, f"{name} ({tag})")
+        return entry[2]
 
 
@@ -0,0 +1,72 @@
+"""
+Compact runtime log records and their text form.
+
+Runtime log lines are kept as records — epoch timestamp, level code,
+message and the deployment context ("name (image:tag)") — and rendered to
+
+    <ISO timestamp> [<LEVEL>] <context> - <message>
+
+only when read. Messages come from a small fixed set and the context
+string is shared by all records of a deployment, so a record costs a few
+pointers instead of a formatted string. Free-form lines passed to
+`state.append_log` are stored verbatim with the RAW flag; their level is
+taken from the `[LEVEL]` tag if they carry one.
+"""
+
+from __future__ import annotations
+
+import time
+
+
+LEVELS = ("DEBUG", "INFO", "WARN", "ERROR")
+DEBUG, INFO, WARN, ERROR = range(len(LEVELS))
+# flag: the message is the whole rendered line
+RAW = 0x80
+
+_CODES = {name: code for code, name in enumerate(LEVELS)}
+_CODES["WARNING"] = WARN
+
+# rendering walks records in time order: remember the last second formatted
+_last_iso = (-1, "")
+
+
+def level_code(name: str) -> int:
+    """Level code for a name like "warn" or "ERROR"; ValueError otherwise."""
+    try:
+        return _CODES[name.strip().upper()]
+    except KeyError:
+        raise ValueError(f"level must be one of: {', '.join(LEVELS)}") from None
+
+
+def level(code: int) -> int:
+    """Level of a record code, without flags."""
+    return code & ~RAW
+
+
+def raw_code(line: str) -> int:
+    """Code for a verbatim line: RAW plus the level named in it (INFO if none)."""
+    for code in (ERROR, WARN, DEBUG):
+        if f"[{LEVELS[code]}]" in line:
+            return RAW | code
+    return RAW | INFO
+
+
+def iso(ts: float) -> str:
+    """Epoch seconds -> naive-UTC ISO string, like `clock.isonow()`."""
+    global _last_iso
+    second = int(ts)
+    cached_second, text = _last_iso
+    if second != cached_second:
+        text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _last_iso = (second, text)
+    return text
+
+
+def render(ts: float, code: int, message: str, context: str | None) -> str:
+    if code & RAW:
+        return message
+    if context:
+        return f"{iso(ts)} [{LEVELS[code]}] {context} - {message}"
+    return f"{iso(ts)} [{LEVELS[code]}] {message}"
+
+
@@ -0,0 +1,148 @@
+"""
+Broadcast hub for live deployment logs.
+
+`state.append_record` publishes every new line here once, rendering it only
+if the deployment has subscribers; each open log stream
+holds a `Subscription` with its own bounded queue and blocks until lines
+arrive instead of polling the log buffer. A subscriber that falls more than
+`QUEUE_MAX_LINES` behind loses its oldest queued lines and is told how many
+it missed, so a stuck client never makes the engine wait or grow memory.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Set, Tuple
+
+
+QUEUE_MAX_LINES = 500
+KEEPALIVE_SECONDS = 15.0
+
+
+class Subscription:
+    """One live reader of a deployment's log."""
+
+    __slots__ = ("deployment_id", "min_level", "_queue", "_missed", "_closed", "_event", "_waker")
+
+    def __init__(
+        self, deployment_id: int, waker: Callable[[], None] | None = None, min_level: int = 0
+    ):
+        self.deployment_id = deployment_id
+        # lines below this level (see `logfmt`) are not queued at all
+        self.min_level = min_level
+        self._queue: Deque[Tuple[int, str, int]] = deque()
+        self._missed = 0
+        self._closed = False
+        # Blocking readers wait on an Event; async readers pass their own
+        # `waker`, called from the publishing thread when the queue goes
+        # from empty to non-empty (once per batch, not once per line).
+        self._event = threading.Event() if waker is None else None
+        self._waker = waker or self._event.set
+
+    def _push(self, seq: int, line: str, level: int) -> None:
+        # caller holds the hub lock
+        if level < self.min_level:
+            return
+        was_empty = not self._queue
+        if len(self._queue) >= QUEUE_MAX_LINES:
+            self._queue.popleft()
+            self._missed += 1
+        self._queue.append((seq, line, level))
+        if was_empty:
+            self._waker()
+
+    def drain(self) -> Tuple[List[Tuple[int, str, int]], int]:
+        """Take all queued (seq, line, level) items and the number of lines dropped."""
+        with _lock:
+            items = list(self._queue)
+            self._queue.clear()
+            missed, self._missed = self._missed, 0
+            if self._event is not None:
+                self._event.clear()
+        return items, missed
+
+    def wait(self, timeout: float | None = KEEPALIVE_SECONDS) -> bool:
+        """Block until lines are queued or `timeout` passes; True if woken."""
+        return self._event.wait(timeout)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+_lock = threading.Lock()
+_subscribers: Dict[int, Set[Subscription]] = {}
+# Called with (deployment_id, True) when a deployment gets its first
+# subscriber and (deployment_id, False) when its last one leaves; used by
+# `stateservice` to relay lines published in another process.
+_watcher: Callable[[int, bool], None] | None = None
+
+
+def set_watcher(watcher: Callable[[int, bool], None] | None) -> List[int]:
+    """Install the watcher; returns the deployments watched right now."""
+    global _watcher
+    with _lock:
+        _watcher = watcher
+        return list(_subscribers)
+
+
+def subscribe(
+    deployment_id: int, waker: Callable[[], None] | None = None, min_level: int = 0
+) -> Subscription:
+    sub = Subscription(deployment_id, waker, min_level)
+    with _lock:
+        subs = _subscribers.setdefault(deployment_id, set())
+        first = not subs
+        subs.add(sub)
+        watcher = _watcher
+    if first and watcher is not None:
+        watcher(deployment_id, True)
+    return sub
+
+
+def unsubscribe(sub: Subscription) -> None:
+    last = False
+    with _lock:
+        sub._closed = True
+        subs = _subscribers.get(sub.deployment_id)
+        if subs is not None and sub in subs:
+            subs.discard(sub)
+            if not subs:
+                del _subscribers[sub.deployment_id]
+                last = True
+        watcher = _watcher
+    if last and watcher is not None:
+        watcher(sub.deployment_id, False)
+
+
+def has_subscribers(deployment_id: int) -> bool:
+    """Unlocked check: no viewers is the common case for the engine."""
+    return deployment_id in _subscribers
+
+
+def publish(deployment_id: int, seq: int, line: str, level: int = 0) -> None:
+    """Fan a new log line out to every subscriber of the deployment."""
+    if deployment_id not in _subscribers:
+        return
+    with _lock:
+        for sub in _subscribers.get(deployment_id, ()):
+            sub._push(seq, line, level)
+
+
+def report_missed(deployment_id: int, missed: int) -> None:
+    """Tell every subscriber that `missed` lines were lost upstream."""
+    with _lock:
+        for sub in _subscribers.get(deployment_id, ()):
+            sub._missed += missed
+            if not sub._queue:
+                sub._waker()
+
+
+def subscriber_count(deployment_id: int | None = None) -> int:
+    with _lock:
+        if deployment_id is not None:
+            return len(_subscribers.get(deployment_id, ()))
+        return sum(len(s) for s in _subscribers.values())
+
+
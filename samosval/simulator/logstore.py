@@ -0,0 +1,482 @@
+"""
+Disk-backed runtime log history.
+
+The in-memory `state.LogRing` keeps the newest lines of each deployment;
+this module keeps hours of them on disk without growing process memory.
+Every deployment has a directory of append-only segment files
+
+    <LOG_DIR>/<deployment_id>/<first seq, 20 digits>.log
+
+holding one record per line: seq, epoch ts and level code separated by
+spaces, then context and message separated by \\x1f (see `logfmt`; text
+is rendered on read). Lines from before records were structured (`seq ts
+text`) read back as RAW records. A segment is closed once it reaches
+`segment_bytes` and the oldest segments are deleted beyond `max_segments`. Next to each
+segment a `.idx` file keeps a sparse index — (seq, ts, byte offset) for
+every INDEX_EVERY-th record — that is also held in memory, so a read by
+sequence number or time bisects the index, maps the segment with `mmap`
+and scans at most INDEX_EVERY records before it reaches the wanted lines.
+Nothing reads a whole file.
+
+One process writes a LOG_DIR: `enable_writes()` takes an exclusive lock
+on it, and processes that do not get it only read.
+
+Appends only queue encoded records; `flush()` (called by the engine every
+FLUSH_INTERVAL_SECONDS, and before any disk read) writes them out, keeping
+a bounded number of segment files open.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, Tuple
+
+from . import clock, logfmt
+
+
+DEFAULT_SEGMENT_BYTES = 1024 * 1024
+DEFAULT_MAX_SEGMENTS = 32
+INDEX_EVERY = 64
+FLUSH_INTERVAL_SECONDS = 2
+MAX_OPEN_FILES = 256
+
+_INDEX_ENTRY = struct.Struct("<qdq")  # seq, ts, offset
+
+# (seq, epoch ts, level code, message, context)
+Record = Tuple[int, float, int, str, str]
+
+_dir: str | None = None
+_segment_bytes = DEFAULT_SEGMENT_BYTES
+_max_segments = DEFAULT_MAX_SEGMENTS
+_writable = False
+_writer_lock: BinaryIO | None = None  # held open while this process writes
+_lock = threading.RLock()
+_logs: Dict[int, "_DeploymentLog"] = {}
+_open_files: "OrderedDict[Tuple[int, int], Tuple[BinaryIO, BinaryIO]]" = OrderedDict()
+_last_flush = 0.0
+
+
+class _Segment:
+    __slots__ = ("path", "first_seq", "size", "last_seq", "count", "index_seqs", "index")
+
+    def __init__(self, path: str, first_seq: int):
+        self.path = path
+        self.first_seq = first_seq
+        self.size = 0
+        self.last_seq = first_seq - 1
+        self.count = 0
+        # sparse index, kept sorted by seq (and so by ts)
+        self.index_seqs: List[int] = []
+        self.index: List[Tuple[int, float, int]] = []
+
+    @property
+    def index_path(self) -> str:
+        return self.path[:-4] + ".idx"
+
+    def add_index(self, seq: int, ts: float, offset: int) -> None:
+        self.index_seqs.append(seq)
+        self.index.append((seq, ts, offset))
+
+    def offset_for_seq(self, seq: int) -> int:
+        """Byte offset of an indexed record at or before `seq`."""
+        i = bisect_right(self.index_seqs, seq) - 1
+        return self.index[i][2] if i >= 0 else 0
+
+    def offset_for_ts(self, ts: float) -> int:
+        """Byte offset of an indexed record whose successor is not before `ts`."""
+        offset = 0
+        for _, entry_ts, entry_offset in self.index:
+            if entry_ts >= ts:
+                break
+            offset = entry_offset
+        return offset
+
+
+class _DeploymentLog:
+    __slots__ = ("directory", "segments", "pending")
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segments: List[_Segment] = []
+        # (seq, ts, encoded record) not yet written
+        self.pending: List[Tuple[int, float, bytes]] = []
+
+    @property
+    def last_seq(self) -> int:
+        if self.pending:
+            return self.pending[-1][0]
+        return self.segments[-1].last_seq if self.segments else 0
+
+
+def configure(
+    log_dir: str | None,
+    segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+    max_segments: int = DEFAULT_MAX_SEGMENTS,
+) -> None:
+    """Set the log directory (None disables disk history) and rotation limits."""
+    global _dir, _segment_bytes, _max_segments, _writable
+    with _lock:
+        _close_files()
+        _logs.clear()
+        if log_dir != _dir:
+            _release_writer_lock()
+            _writable = False
+        _dir = log_dir
+        _segment_bytes = segment_bytes
+        _max_segments = max_segments
+        _writable = _writable and log_dir is not None
+        if log_dir is not None:
+            os.makedirs(log_dir, exist_ok=True)
+
+
+def enable_writes(enabled: bool = True) -> bool:
+    """
+    Become the writer of LOG_DIR; returns whether this process writes.
+    Only one process may: another one holding the lock (e.g. a second web
+    worker with its own runtime engine) keeps this one read-only.
+    enable_writes(False) flushes queued records and gives the lock up.
+    """
+    global _writable, _writer_lock
+    with _lock:
+        if not enabled or _dir is None:
+            if _writable:
+                # write what is queued while still holding the lock
+                _writable = False
+                flush()
+                _close_files()
+            _release_writer_lock()
+            return False
+        if _writer_lock is None:
+            f = open(os.path.join(_dir, ".writer.lock"), "wb")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+            _writer_lock = f
+        _writable = True
+        return True
+
+
+def _release_writer_lock() -> None:
+    global _writer_lock
+    if _writer_lock is not None:
+        _writer_lock.close()
+        _writer_lock = None
+
+
+def enabled() -> bool:
+    return _dir is not None
+
+
+# --- loading -------------------------------------------------------------
+
+
+def _load(deployment_id: int) -> _DeploymentLog:
+    log = _logs.get(deployment_id)
+    if log is not None:
+        return log
+    log = _logs[deployment_id] = _DeploymentLog(os.path.join(_dir, str(deployment_id)))
+    if not os.path.isdir(log.directory):
+        return log
+    for name in sorted(os.listdir(log.directory)):
+        if not name.endswith(".log"):
+            continue
+        seg = _Segment(os.path.join(log.directory, name), int(name[:-4]))
+        seg.size = os.path.getsize(seg.path)
+        if os.path.exists(seg.index_path):
+            with open(seg.index_path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % _INDEX_ENTRY.size
+            for entry in _INDEX_ENTRY.iter_unpack(data[:usable]):
+                if entry[2] < seg.size:
+                    seg.add_index(*entry)
+        # find the last record (and count) by scanning after the last index entry
+        start = seg.index[-1][2] if seg.index else 0
+        seg.count = (len(seg.index) - 1) * INDEX_EVERY if seg.index else 0
+        for seq, *_ in _scan(seg, start):
+            seg.last_seq = seq
+            seg.count += 1
+        log.segments.append(seg)
+    return log
+
+
+def _scan(seg: _Segment, offset: int):
+    """Yield (seq, ts, code, message, context) for the records from `offset` on."""
+    if seg.size <= offset:
+        return
+    with open(seg.path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = offset
+            while pos < seg.size:
+                end = mm.find(b"\n", pos, seg.size)
+                if end < 0:
+                    break  # torn write at the end of a crashed segment
+                record = _parse(bytes(mm[pos:end]))
+                if record is not None:
+                    yield record
+                pos = end + 1
+
+
+def _parse(line: bytes) -> Record | None:
+    try:
+        seq, ts, rest = line.split(b" ", 2)
+        seq, ts = int(seq), float(ts)
+    except ValueError:
+        return None  # not a record: skip it rather than lose the segment
+    text = rest.decode("utf-8", "replace")
+    code, _, body = text.partition(" ")
+    if code.isdigit() and "\x1f" in body:
+        context, _, message = body.partition("\x1f")
+        return seq, ts, int(code), message, context
+    # written before records were structured: the rendered line itself
+    return seq, ts, logfmt.raw_code(text), text, ""
+
+
+# --- writing -------------------------------------------------------------
+
+
+def last_seq(deployment_id: int) -> int:
+    """Last sequence number stored (or queued) for the deployment."""
+    if _dir is None:
+        return 0
+    with _lock:
+        return _load(deployment_id).last_seq
+
+
+def append(
+    deployment_id: int, seq: int, ts: float, code: int, message: str, context: str | None
+) -> None:
+    """Queue a record for the next flush (no-op unless this process writes)."""
+    if not _writable:
+        return
+    text = _field(context or "") + "\x1f" + _field(message)
+    record = b"%d %d %d %s\n" % (seq, ts, code, text.encode("utf-8"))
+    with _lock:
+        _load(deployment_id).pending.append((seq, ts, record))
+
+
+def _field(value: str) -> str:
+    # newlines end a record and \x1f separates context from message
+    return value.replace("\n", " ").replace("\x1f", " ")
+
+
+def flush_if_due() -> None:
+    global _last_flush
+    now = clock.get_clock().monotonic()
+    if _writable and now - _last_flush >= FLUSH_INTERVAL_SECONDS:
+        _last_flush = now
+        flush()
+
+
+def flush(deployment_id: int | None = None) -> None:
+    """Write queued records of one or all deployments."""
+    with _lock:
+        if deployment_id is not None:
+            log = _logs.get(deployment_id)
+            targets = [(deployment_id, log)] if log is not None and log.pending else []
+        else:
+            targets = [(i, log) for i, log in _logs.items() if log.pending]
+        for dep_id, log in targets:
+            _write(dep_id, log)
+
+
+def close() -> None:
+    """Flush everything and close open segment files (engine shutdown)."""
+    with _lock:
+        flush()
+        _close_files()
+
+
+def _write(deployment_id: int, log: _DeploymentLog) -> None:
+    pending, log.pending = log.pending, []
+    os.makedirs(log.directory, exist_ok=True)
+    i = 0
+    while i < len(pending):
+        seg = log.segments[-1] if log.segments else None
+        if seg is None or seg.size >= _segment_bytes:
+            seg = _rotate(deployment_id, log, pending[i][0])
+        data, index_entries = [], []
+        while i < len(pending) and seg.size < _segment_bytes:
+            seq, ts, record = pending[i]
+            if seg.count % INDEX_EVERY == 0:
+                index_entries.append(_INDEX_ENTRY.pack(seq, ts, seg.size))
+                seg.add_index(seq, ts, seg.size)
+            data.append(record)
+            seg.size += len(record)
+            seg.count += 1
+            seg.last_seq = seq
+            i += 1
+        f, idx = _files(deployment_id, seg)
+        f.write(b"".join(data))
+        f.flush()
+        if index_entries:
+            idx.write(b"".join(index_entries))
+            idx.flush()
+
+
+def _rotate(deployment_id: int, log: _DeploymentLog, first_seq: int) -> _Segment:
+    seg = _Segment(os.path.join(log.directory, f"{first_seq:020d}.log"), first_seq)
+    log.segments.append(seg)
+    while len(log.segments) > _max_segments:
+        old = log.segments.pop(0)
+        handles = _open_files.pop((deployment_id, old.first_seq), None)
+        if handles is not None:
+            for h in handles:
+                h.close()
+        for path in (old.path, old.index_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+    return seg
+
+
+def _files(deployment_id: int, seg: _Segment) -> Tuple[BinaryIO, BinaryIO]:
+    key = (deployment_id, seg.first_seq)
+    handles = _open_files.get(key)
+    if handles is None:
+        handles = (open(seg.path, "ab"), open(seg.index_path, "ab"))
+        _open_files[key] = handles
+        while len(_open_files) > MAX_OPEN_FILES:
+            _, old = _open_files.popitem(last=False)
+            for h in old:
+                h.close()
+    else:
+        _open_files.move_to_end(key)
+    return handles
+
+
+def _close_files() -> None:
+    while _open_files:
+        _, handles = _open_files.popitem()
+        for h in handles:
+            h.close()
+
+
+def remove(deployment_id: int) -> None:
+    """Delete a deployment's log history."""
+    if _dir is None:
+        return
+    with _lock:
+        log = _load(deployment_id)
+        for seg in log.segments:
+            handles = _open_files.pop((deployment_id, seg.first_seq), None)
+            if handles is not None:
+                for h in handles:
+                    h.close()
+            for path in (seg.path, seg.index_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+        try:
+            os.rmdir(log.directory)
+        except OSError:
+            pass
+        del _logs[deployment_id]
+
+
+# --- reading -------------------------------------------------------------
+
+
+def read_after(
+    deployment_id: int, after: int, before: int, limit: int, min_level: int = 0
+) -> List[Record]:
+    """
+    Records with after < seq < before and at least `min_level`, oldest
+    first, at most `limit` of them.
+    """
+    if _dir is None or limit <= 0:
+        return []
+    with _lock:
+        flush(deployment_id)
+        segments = list(_load(deployment_id).segments)
+    out: List[Record] = []
+    for seg in segments:
+        if seg.last_seq <= after:
+            continue
+        if seg.first_seq >= before:
+            break
+        for record in _scan(seg, seg.offset_for_seq(after + 1)):
+            if record[0] <= after or logfmt.level(record[2]) < min_level:
+                continue
+            if record[0] >= before or len(out) >= limit:
+                return out
+            out.append(record)
+    return out
+
+
+def read_before(deployment_id: int, before: int, limit: int, min_level: int = 0) -> List[Record]:
+    """
+    The last `limit` records with seq < before and at least `min_level`,
+    oldest first. Segments are read newest first until enough are found.
+    """
+    if _dir is None or limit <= 0:
+        return []
+    with _lock:
+        flush(deployment_id)
+        segments = list(_load(deployment_id).segments)
+    out: List[Record] = []
+    for seg in reversed(segments):
+        if seg.first_seq >= before:
+            continue
+        wanted = limit - len(out)
+        # unfiltered, the wanted lines are the last ones: seek near them
+        end = min(before, seg.last_seq + 1)
+        offset = 0 if min_level else seg.offset_for_seq(end - wanted)
+        found = [
+            record
+            for record in _scan(seg, offset)
+            if record[0] < before and logfmt.level(record[2]) >= min_level
+        ]
+        out = found[-wanted:] + out
+        if len(out) >= limit:
+            break
+    return out
+
+
+def read_range(
+    deployment_id: int, start: float | None, end: float | None, limit: int, min_level: int = 0
+) -> List[Record]:
+    """Records with start <= ts <= end, oldest first, at most `limit`."""
+    if _dir is None or limit <= 0:
+        return []
+    with _lock:
+        flush(deployment_id)
+        segments = list(_load(deployment_id).segments)
+    out: List[Record] = []
+    for k, seg in enumerate(segments):
+        # skip segments that end before `start` (the next one starts later)
+        if start is not None and k + 1 < len(segments):
+            nxt = segments[k + 1]
+            if nxt.index and nxt.index[0][1] < start:
+                continue
+        offset = seg.offset_for_ts(start) if start is not None else 0
+        for record in _scan(seg, offset):
+            ts = record[1]
+            if (start is not None and ts < start) or logfmt.level(record[2]) < min_level:
+                continue
+            if (end is not None and ts > end) or len(out) >= limit:
+                return out
+            out.append(record)
+    return out
+
+
+def first_seq(deployment_id: int) -> int | None:
+    """Oldest sequence number still on disk."""
+    if _dir is None:
+        return None
+    with _lock:
+        log = _load(deployment_id)
+        if log.segments:
+            return log.segments[0].first_seq
+        return log.pending[0][0] if log.pending else None
+
+
@@ -0,0 +1,61 @@
+"""
+Batched CPU/RAM random-walk generator for running deployments.
+
+The walk state of every running deployment lives in contiguous NumPy arrays
+ordered by deployment id; one tick steps all of them at once and publishes
+the new points to `state` under a single lock.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Sequence
+
+import numpy as np
+
+from . import state
+
+
+INITIAL_LEVEL = 50.0
+STEP_MAX = 5.0
+
+
+class BatchedMetricsGenerator:
+    def __init__(self, rng: np.random.Generator | None = None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self._ids = np.empty(0, dtype=np.int64)
+        # row 0 = cpu, row 1 = ram
+        self._levels = np.empty((2, 0), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return int(self._ids.size)
+
+    def _sync(self, deployment_ids: Sequence[int]) -> None:
+        """Match walk state to the current set of running deployments."""
+        ids = np.asarray(sorted(deployment_ids), dtype=np.int64)
+        if ids.size == self._ids.size and np.array_equal(ids, self._ids):
+            return
+        levels = np.full((2, ids.size), INITIAL_LEVEL)
+        if self._ids.size and ids.size:
+            pos = np.searchsorted(self._ids, ids)
+            pos_clipped = np.minimum(pos, self._ids.size - 1)
+            known = self._ids[pos_clipped] == ids
+            levels[:, known] = self._levels[:, pos_clipped[known]]
+        self._ids = ids
+        self._levels = levels
+
+    def step(self, deployment_ids: Sequence[int], ts: datetime) -> None:
+        """Advance the walk for all given deployments and publish one point each."""
+        self._sync(deployment_ids)
+        if not self._ids.size:
+            return
+        self._levels += self.rng.uniform(-STEP_MAX, STEP_MAX, size=self._levels.shape)
+        np.clip(self._levels, 0.0, 100.0, out=self._levels)
+        state.append_metric_points(
+            self._ids.tolist(),
+            ts,
+            self._levels[0].tolist(),
+            self._levels[1].tolist(),
+        )
+
+
@@ -0,0 +1,144 @@
+"""
+Build scheduler: a fixed pool of build worker slots with fair-share queueing.
+
+Queued builds are ordered by priority first; within the same priority the
+next build goes to the owner (`image_requests.owner_id`) and then the
+operator (`builds.built_by`) with the fewest builds already running or
+picked, so one busy owner or operator cannot starve everyone else.
+"""
+
+from __future__ import annotations
+
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Iterable
+
+from flask import current_app
+
+from . import clock
+
+
+DEFAULT_BUILD_WORKERS = 4
+
+PRIORITY_CHOICES = {
+    -1: "low",
+    0: "normal",
+    1: "high",
+}
+
+
+@dataclass
+class QueueStats:
+    workers: int
+    busy: int
+    queued: int
+    # build_id -> 1-based position in the fair-share queue
+    positions: dict[int, int]
+    avg_wait_s: float | None
+    p95_wait_s: float | None
+
+
+def max_workers() -> int:
+    return max(1, int(current_app.config.get("BUILD_WORKERS", DEFAULT_BUILD_WORKERS)))
+
+
+def fair_order(
+    queued: Iterable,
+    running_owners: Counter | None = None,
+    running_operators: Counter | None = None,
+) -> list[int]:
+    """
+    Return ids of queued builds in the order they should get a worker.
+
+    `queued` rows need id, owner_id, built_by and priority. The running
+    counters describe builds already holding a worker slot.
+    """
+    owners = Counter(running_owners or {})
+    operators = Counter(running_operators or {})
+
+    buckets: dict[tuple, deque] = defaultdict(deque)
+    for row in sorted(queued, key=lambda r: (-(r["priority"] or 0), r["id"])):
+        buckets[(row["owner_id"], row["built_by"])].append(row)
+
+    order: list[int] = []
+    while buckets:
+        key = min(
+            buckets,
+            key=lambda k: (
+                -(buckets[k][0]["priority"] or 0),
+                owners[k[0]],
+                operators[k[1]],
+                buckets[k][0]["id"],
+            ),
+        )
+        row = buckets[key].popleft()
+        if not buckets[key]:
+            del buckets[key]
+        order.append(row["id"])
+        owners[key[0]] += 1
+        operators[key[1]] += 1
+    return order
+
+
+def _load(db) -> tuple[list, list]:
+    rows = db.execute(
+        """
+        SELECT b.id, b.status, b.built_by, b.priority, b.worker_slot, r.owner_id
+          FROM builds b
+          LEFT JOIN image_requests r ON b.request_id = r.id
+         WHERE b.status IN ('queued', 'building')
+        """
+    ).fetchall()
+    queued = [r for r in rows if r["status"] == "queued"]
+    building = [r for r in rows if r["status"] == "building"]
+    return queued, building
+
+
+def pick_builds_to_start(queued: list, building: list, workers: int) -> list[tuple[int, int]]:
+    """Return (build_id, worker_slot) pairs for queued builds that may start now."""
+    free_slots = sorted(
+        set(range(1, workers + 1)) - {r["worker_slot"] for r in building}
+    )[: max(0, workers - len(building))]
+    if not free_slots or not queued:
+        return []
+    order = fair_order(
+        queued,
+        Counter(r["owner_id"] for r in building),
+        Counter(r["built_by"] for r in building),
+    )
+    return list(zip(order, free_slots))
+
+
+def queue_stats(db, window_hours: int = 1) -> QueueStats:
+    """Queue positions and wait-time stats for the builds UI."""
+    queued, building = _load(db)
+    workers = max_workers()
+    order = fair_order(
+        queued,
+        Counter(r["owner_id"] for r in building),
+        Counter(r["built_by"] for r in building),
+    )
+    waits = [
+        r[0]
+        for r in db.execute(
+            """
+            SELECT (julianday(started_at) - julianday(created_at)) * 86400.0
+              FROM builds
+             WHERE started_at IS NOT NULL
+               AND started_at >= ?
+             ORDER BY 1
+            """,
+            ((clock.now() - timedelta(hours=window_hours)).isoformat(timespec="seconds"),),
+        ).fetchall()
+    ]
+    avg_wait = sum(waits) / len(waits) if waits else None
+    p95_wait = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None
+    return QueueStats(
+        workers=workers,
+        busy=len(building),
+        queued=len(queued),
+        positions={build_id: i + 1 for i, build_id in enumerate(order)},
+        avg_wait_s=avg_wait,
+        p95_wait_s=p95_wait,
+    )
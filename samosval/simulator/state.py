@@ -1,14 +1,33 @@
 from __future__ import annotations
 
+import functools
+import secrets
+import sys
 import threading
-from collections import deque
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Deque, Dict, List, Tuple
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+from . import clock, logfmt, loghub, logstore
 
 
 LOG_MAX_LINES = 1000
 METRICS_MAX_POINTS = 900
+# (bucket seconds, buckets kept): 1-minute buckets for a day, hourly for two weeks
+ROLLUP_TIERS = ((60, 24 * 60), (3600, 14 * 24))
+# what an idle deployment keeps in memory (see `compact_idle`)
+IDLE_LOG_LINES = 50
+IDLE_METRIC_POINTS = 60
+DEFAULT_IDLE_COMPACT_SECONDS = 15 * 60
+DEFAULT_MEMORY_BUDGET_BYTES = 256 * 1024 * 1024
+MAINTENANCE_INTERVAL_SECONDS = 30
+
+_STR_OVERHEAD = sys.getsizeof("")
+
+# (seq, epoch ts, level code, message, context); see `logfmt`
+LogRecord = Tuple[int, float, int, str, str | None]
 
 
 @dataclass
@@ -18,65 +37,916 @@ class MetricPoint:
     ram: float
 
 
+# Identifies this process's buffers; cursors handed out restart with it.
+INSTANCE_TOKEN = secrets.token_hex(4)
+
+# Set in processes that do not own the buffers (see `stateservice`): the
+# @_shared readers and writers below then forward each call to the owner.
+_remote: Callable[[str, tuple, dict], Any] | None = None
+_owner_token: str | None = None
+SHARED: Dict[str, Callable[..., Any]] = {}
+
+
+def _shared(fn):
+    name = fn.__name__
+    SHARED[name] = fn
+
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        if _remote is not None:
+            return _remote(name, args, kwargs)
+        return fn(*args, **kwargs)
+
+    return call
+
+
+def use_remote(call: Callable[[str, tuple, dict], Any] | None, token: str | None = None) -> None:
+    """Forward shared calls through `call` (None: serve them locally again)."""
+    global _remote, _owner_token
+    _remote = call
+    _owner_token = token if call is not None else None
+
+
+def instance_token() -> str:
+    """Token of the process whose buffers this process reads."""
+    return _owner_token or INSTANCE_TOKEN
+
+
 _logs_lock = threading.Lock()
 _metrics_lock = threading.Lock()
 
-_deployment_logs: Dict[int, Deque[str]] = {}
-_deployment_metrics: Dict[int, Deque[MetricPoint]] = {}
-# for random walk
-_metric_state: Dict[int, Tuple[float, float]] = {}
+_deployment_logs: Dict[int, "LogRing"] = {}
+_deployment_metrics: Dict[int, "MetricRing"] = {}
+# last log seq of deployments whose buffer was evicted, so numbering goes on
+_evicted_log_seq: Dict[int, int] = {}
+_idle_compact_seconds: float = DEFAULT_IDLE_COMPACT_SECONDS
+_memory_budget: int = DEFAULT_MEMORY_BUDGET_BYTES
+_last_maintenance = 0.0
+# closed base buckets awaiting persistence; None while nobody collects them
+_closed_buckets: List[Tuple[int, "ClosedBucket"]] | None = None
+
+
+@dataclass
+class LogBatch:
+    """Result of a cursor read from a deployment log buffer."""
+
+    lines: List[str]
+    # cursor for the next read: the last sequence number examined (the last
+    # line's, or the cursor itself if nothing newer was held)
+    last_seq: int
+    # lines after the cursor that were already overwritten before this read
+    missed: int = 0
+    # sequence numbers of `lines` (not contiguous when filtered by level)
+    seqs: List[int] = field(default_factory=list)
+
+
+class LogRing:
+    """
+    Fixed-capacity ring of log records with monotonically increasing
+    sequence numbers. The first record appended gets seq `start + 1`
+    (`start` carries the numbering on from the on-disk history); record
+    `seq` lives in slot `(seq - 1) % capacity` until it is overwritten.
+
+    A record is a timestamp, a level code, a message and the deployment
+    context (see `logfmt`), held in parallel columns; messages and contexts
+    are shared string objects, so a record costs about 25 bytes. Text is
+    rendered on read.
+    """
+
+    __slots__ = (
+        "capacity", "ts", "codes", "messages", "contexts",
+        "start", "last_seq", "text_bytes", "written", "used",
+    )
+
+    def __init__(self, capacity: int = LOG_MAX_LINES, start: int = 0):
+        self.capacity = capacity
+        self.ts = array("d", bytes(8 * capacity))
+        self.codes = bytearray(capacity)
+        self.messages: List[str | None] = [None] * capacity
+        self.contexts: List[str | None] = [None] * capacity
+        self.start = start
+        self.last_seq = start
+        # bytes of verbatim lines, the only per-record strings
+        self.text_bytes = 0
+        # clock.monotonic() of the last append and of the last append or read
+        self.written = self.used = _now()
+
+    def __len__(self) -> int:
+        return min(self.last_seq - self.start, self.capacity)
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number of the oldest record still held."""
+        return self.last_seq - len(self) + 1
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held: the columns plus verbatim lines."""
+        return 200 + 25 * self.capacity + self.text_bytes
+
+    def append(self, ts: float, code: int, message: str, context: str | None) -> int:
+        i = self.last_seq % self.capacity
+        if self.codes[i] & logfmt.RAW:
+            self.text_bytes -= _STR_OVERHEAD + len(self.messages[i])
+        if code & logfmt.RAW:
+            self.text_bytes += _STR_OVERHEAD + len(message)
+        self.ts[i] = ts
+        self.codes[i] = code
+        self.messages[i] = message
+        self.contexts[i] = context
+        self.last_seq += 1
+        return self.last_seq
+
+    def resized(self, capacity: int) -> "LogRing":
+        """A ring of `capacity` slots holding the newest records of this one."""
+        keep = min(len(self), capacity)
+        ring = LogRing(capacity, start=self.last_seq - keep)
+        for _, ts, code, message, context in self.records(self.last_seq - keep + 1, self.last_seq):
+            ring.append(ts, code, message, context)
+        ring.written, ring.used = self.written, self.used
+        return ring
+
+    def records(self, first: int, last: int, min_level: int = 0) -> List[LogRecord]:
+        """(seq, ts, code, message, context) for held seqs first..last."""
+        out = []
+        for seq in range(first, last + 1):
+            i = (seq - 1) % self.capacity
+            code = self.codes[i]
+            if logfmt.level(code) >= min_level:
+                out.append((seq, self.ts[i], code, self.messages[i], self.contexts[i]))
+        return out
+
+    def read_after(
+        self, after: int, limit: int | None = None, min_level: int = 0
+    ) -> Tuple[List[LogRecord], int, int]:
+        """
+        Records with seq > `after` and at least `min_level`, oldest first,
+        at most `limit` of them; also the next cursor and the number missed.
+        """
+        if after >= self.last_seq:
+            # also covers a cursor from before a process restart
+            return [], self.last_seq if after > self.last_seq else after, 0
+        first = self.first_seq
+        missed = max(0, first - after - 1)
+        start = max(after + 1, first)
+        if not min_level:
+            stop = self.last_seq
+            if limit:
+                stop = min(stop, start + limit - 1)
+            return self.records(start, stop), stop, missed
+        out = self.records(start, self.last_seq, min_level)
+        if limit and len(out) > limit:
+            out = out[:limit]
+            return out, out[-1][0], missed
+        return out, self.last_seq, missed
+
+    def tail(self, limit: int, min_level: int = 0) -> List[LogRecord]:
+        """The newest `limit` records of at least `min_level` (0: all held)."""
+        if not min_level:
+            n = len(self) if limit <= 0 else min(len(self), limit)
+            return self.records(self.last_seq - n + 1, self.last_seq)
+        out = self.records(self.first_seq, self.last_seq, min_level)
+        return out[-limit:] if limit > 0 else out
+
+
+def _render(records: Sequence[LogRecord]) -> List[str]:
+    return [logfmt.render(ts, code, message, context) for _, ts, code, message, context in records]
+
 
+@_shared
+def append_record(
+    deployment_id: int,
+    level: int,
+    message: str,
+    context: str | None = None,
+    ts: float | None = None,
+) -> int:
+    """
+    Append a structured record (see `logfmt`), queue it for the on-disk
+    history, push it to live subscribers and return its sequence number.
+    Pass the same `context` and `message` objects for every record where
+    possible: they are stored by reference.
+    """
+    if ts is None:
+        ts = clock.timestamp()
+    with _logs_lock:
+        ring = _deployment_logs.get(deployment_id)
+        if ring is None:
+            ring = _deployment_logs[deployment_id] = LogRing(start=_stored_log_seq(deployment_id))
+            _evicted_log_seq.pop(deployment_id, None)
+        elif ring.capacity < LOG_MAX_LINES:
+            # compacted while idle and active again
+            ring = _deployment_logs[deployment_id] = ring.resized(LOG_MAX_LINES)
+        seq = ring.append(ts, level, message, context)
+        ring.written = ring.used = _now()
+        logstore.append(deployment_id, seq, ts, level, message, context)
+        # still under the buffer lock so subscribers see lines in seq order;
+        # text is only rendered when somebody is watching
+        if loghub.has_subscribers(deployment_id):
+            line = logfmt.render(ts, level, message, context)
+            loghub.publish(deployment_id, seq, line, logfmt.level(level))
+    return seq
+
+
+def append_log(deployment_id: int, line: str) -> int:
+    """Append a preformatted line verbatim; returns its sequence number."""
+    return append_record(deployment_id, logfmt.raw_code(line), line)
 
-def append_log(deployment_id: int, line: str) -> None:
+
+@_shared
+def get_recent_logs(deployment_id: int, limit: int = 200, min_level: int = 0) -> List[str]:
+    """
+    The last `limit` lines (0: the whole buffer) of at least `min_level`.
+    When the buffer holds fewer, the rest come from the on-disk history.
+    """
     with _logs_lock:
-        buf = _deployment_logs.setdefault(deployment_id, deque(maxlen=LOG_MAX_LINES))
-        buf.append(line)
+        ring = _deployment_logs.get(deployment_id)
+        records = ring.tail(limit, min_level) if ring else []
+        first = ring.first_seq if ring else None
+        if ring:
+            ring.used = _now()
+    missing = limit - len(records)
+    if missing > 0 and logstore.enabled():
+        if first is None:
+            first = _stored_log_seq(deployment_id) + 1
+        records = logstore.read_before(deployment_id, first, missing, min_level) + records
+    return _render(records)
 
 
-def get_recent_logs(deployment_id: int, limit: int = 200) -> List[str]:
+@_shared
+def read_logs_after(
+    deployment_id: int, after: int = 0, limit: int | None = None, min_level: int = 0
+) -> LogBatch:
+    """
+    Lines appended after sequence number `after`, of at least `min_level`.
+    Lines the buffer no longer holds come from the on-disk history, read
+    from the nearest index entry on; `missed` tells a reader how many lines
+    are gone from both.
+    """
     with _logs_lock:
-        buf = _deployment_logs.get(deployment_id)
-        if not buf:
-            return []
-        if limit <= 0 or limit >= len(buf):
-            return list(buf)
-        return list(buf)[-limit:]
+        ring = _deployment_logs.get(deployment_id)
+        if ring is not None:
+            records, cursor, missed = ring.read_after(after, limit, min_level)
+            first = ring.first_seq
+            ring.used = _now()
+    if ring is None:
+        # nothing appended by this process yet (or evicted): all on disk
+        last = _stored_log_seq(deployment_id)
+        records, cursor, missed = [], min(after, last), max(last - after, 0)
+        first = last + 1
 
+    if missed and logstore.enabled():
+        older = logstore.read_after(deployment_id, after, first, limit or missed, min_level)
+        disk_first = logstore.first_seq(deployment_id)
+        if disk_first is not None:
+            missed = max(0, min(disk_first, first) - after - 1)
+        if limit and len(older) >= limit:
+            records, cursor = older, older[-1][0]
+        else:
+            room = limit - len(older) if limit else len(records)
+            if len(records) > room:
+                records = records[:room]
+                cursor = records[-1][0] if records else first - 1
+            records = older + records
+            cursor = max(cursor, first - 1)
+    return LogBatch(_render(records), cursor, missed, [r[0] for r in records])
 
-def get_log_buffer_snapshot(deployment_id: int) -> List[str]:
-    """Snapshot of full log buffer for SSE cursoring."""
+
+@_shared
+def get_log_last_seq(deployment_id: int) -> int:
     with _logs_lock:
-        buf = _deployment_logs.get(deployment_id)
-        if not buf:
+        ring = _deployment_logs.get(deployment_id)
+        if ring is not None:
+            return ring.last_seq
+    return _stored_log_seq(deployment_id)
+
+
+def _stored_log_seq(deployment_id: int) -> int:
+    """Last seq of a deployment without a buffer: from disk or its eviction."""
+    return max(logstore.last_seq(deployment_id), _evicted_log_seq.get(deployment_id, 0))
+
+
+def _now() -> float:
+    return clock.get_clock().monotonic()
+
+
+@_shared
+def read_logs_between(
+    deployment_id: int, start: float | None, end: float | None, limit: int, min_level: int = 0
+) -> List[Tuple[int, float, str]]:
+    """(seq, epoch ts, line) from the on-disk history with start <= ts <= end."""
+    records = logstore.read_range(deployment_id, start, end, limit, min_level)
+    return [(r[0], r[1], line) for r, line in zip(records, _render(records))]
+
+
+@_shared
+def get_log_buffer_snapshot(deployment_id: int) -> List[str]:
+    """Snapshot of the full log buffer."""
+    return get_recent_logs(deployment_id, limit=0)
+
+
+class ClosedBucket(NamedTuple):
+    """A finished base rollup bucket: its aggregate and its raw points."""
+
+    agg: Tuple[float, ...]
+    ts: List[float]
+    cpu: List[float]
+    ram: List[float]
+
+
+def _aggregate(ts: List[float], cpu: List[float], ram: List[float]) -> Tuple[float, ...]:
+    """(start, n, cpu_sum, cpu_min, cpu_max, ram_sum, ram_min, ram_max)"""
+    return (ts[0], float(len(ts)), sum(cpu), min(cpu), max(cpu), sum(ram), min(ram), max(ram))
+
+
+def _epoch(ts: datetime) -> float:
+    """Naive-UTC datetime -> epoch seconds."""
+    return ts.replace(tzinfo=timezone.utc).timestamp()
+
+
+class MetricRing:
+    """
+    Fixed-capacity ring buffer of metric points for one deployment.
+
+    Timestamps (epoch seconds), CPU and RAM live in three preallocated
+    `array('d')` columns, so a full buffer costs 24 bytes per point and no
+    per-point Python objects. `total` counts every point ever appended;
+    points before `start` are no longer held (see `resize`). Each point is
+    also folded into the `rollups` tiers (see `RollupRing`).
+    """
+
+    __slots__ = (
+        "capacity", "ts", "cpu", "ram", "total", "start", "rollups",
+        "_bucket_end", "_bucket_count", "written", "used",
+    )
+
+    def __init__(self, capacity: int = METRICS_MAX_POINTS):
+        self.capacity = capacity
+        self.ts = array("d", bytes(8 * capacity))
+        self.cpu = array("d", bytes(8 * capacity))
+        self.ram = array("d", bytes(8 * capacity))
+        self.total = 0
+        self.start = 0
+        self.rollups = tuple(RollupRing(seconds, buckets) for seconds, buckets in ROLLUP_TIERS)
+        # Raw points of the open base (finest tier) bucket are the newest
+        # `_bucket_count` points of the ring. They are aggregated once, when
+        # the bucket closes, rather than on every append.
+        self._bucket_end = float("-inf")
+        self._bucket_count = 0
+        self.written = self.used = _now()
+
+    def __len__(self) -> int:
+        return min(self.total - self.start, self.capacity)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the raw columns and the rollup tiers."""
+        raw = 3 * self.ts.itemsize * self.capacity
+        return raw + sum(len(t.ts) * t.ts.itemsize * len(t.COLUMNS) for t in self.rollups)
+
+    def resize(self, capacity: int) -> None:
+        """Reallocate the raw columns to `capacity`, keeping the newest points."""
+        n = min(len(self), capacity)
+        segs = self.segments(len(self) - n)
+        first = (self.total - n) % capacity
+        cols = []
+        for k in range(3):
+            col = array("d")
+            for seg in segs:
+                col.frombytes(seg[k].cast("B"))
+            col.frombytes(bytes(8 * (capacity - n)))
+            if first:
+                # logical position 0 must sit at slot (total - n) % capacity
+                col = col[capacity - first :] + col[: capacity - first]
+            cols.append(col)
+        self.ts, self.cpu, self.ram = cols
+        self.capacity = capacity
+        self.start = self.total - n
+
+    def append(self, ts: float, cpu: float, ram: float) -> ClosedBucket | None:
+        """Store a point; returns the base bucket it closed, if any."""
+        closed = None
+        if ts >= self._bucket_end and self.rollups:
+            closed = self.close_bucket()
+            base = self.rollups[0].seconds
+            self._bucket_end = ts - ts % base + base
+        i = self.total % self.capacity
+        self.ts[i] = ts
+        self.cpu[i] = cpu
+        self.ram[i] = ram
+        self.total += 1
+        self._bucket_count += 1
+        return closed
+
+    def _bucket_points(self) -> Tuple[List[float], List[float], List[float]]:
+        k = min(self._bucket_count, len(self))
+        segs = self.segments(len(self) - k) if k else []
+        return tuple([v for seg in segs for v in seg[col].tolist()] for col in range(3))
+
+    def open_bucket(self) -> Tuple[float, ...] | None:
+        """Aggregate of the raw points in the still-open base bucket."""
+        ts, cpu, ram = self._bucket_points()
+        return _aggregate(ts, cpu, ram) if ts else None
+
+    def close_bucket(self) -> ClosedBucket | None:
+        """Fold the open base bucket into the rollup tiers and return it."""
+        ts, cpu, ram = self._bucket_points()
+        self._bucket_count = 0
+        self._bucket_end = float("-inf")
+        if not ts:
+            return None
+        agg = _aggregate(ts, cpu, ram)
+        for tier in self.rollups:
+            tier.merge(agg)
+        return ClosedBucket(agg, ts, cpu, ram)
+
+    def position(self, ts: float, right: bool = False) -> int:
+        """
+        Logical position of the first point with timestamp >= `ts`
+        (> `ts` if `right`), like `bisect_left`/`bisect_right`.
+        """
+        lo, hi = 0, len(self)
+        first = (self.total - hi) % self.capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.ts[(first + mid) % self.capacity]
+            if value < ts or (right and value == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def segments(self, start: int = 0, stop: int | None = None) -> list[tuple[memoryview, ...]]:
+        """
+        Zero-copy (ts, cpu, ram) memoryview slices for logical positions
+        [start, stop), oldest point = 0. At most two segments are returned
+        (the ring may wrap). Views alias live storage: use them under
+        `_metrics_lock` only.
+        """
+        n = len(self)
+        stop = n if stop is None else max(0, min(stop, n))
+        start = max(0, min(start, stop))
+        if start == stop:
             return []
-        return list(buf)
+        first = (self.total - n) % self.capacity
+        lo = (first + start) % self.capacity
+        hi = lo + (stop - start)
+        cols = (memoryview(self.ts), memoryview(self.cpu), memoryview(self.ram))
+        if hi <= self.capacity:
+            return [tuple(c[lo:hi] for c in cols)]
+        hi -= self.capacity
+        return [tuple(c[lo:] for c in cols), tuple(c[:hi] for c in cols)]
+
+
+class RollupRing:
+    """
+    Fixed number of `seconds`-wide buckets with count, sum, min and max of
+    CPU and RAM. Closed base buckets are merged in with `merge`. Columns grow
+    up to `capacity` buckets and then wrap like `MetricRing`, so a
+    short-lived deployment only pays for the buckets it actually filled.
+    """
+
+    __slots__ = (
+        "seconds", "capacity", "total", "_open_start",
+        "ts", "n", "cpu_sum", "cpu_min", "cpu_max", "ram_sum", "ram_min", "ram_max",
+    )
+
+    COLUMNS = ("ts", "n", "cpu_sum", "cpu_min", "cpu_max", "ram_sum", "ram_min", "ram_max")
+
+    def __init__(self, seconds: int, capacity: int):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.total = 0
+        self._open_start = float("-inf")
+        for name in self.COLUMNS:
+            setattr(self, name, array("d"))
+
+    def __len__(self) -> int:
+        return min(self.total, self.capacity)
+
+    def merge(self, agg: Sequence[float]) -> None:
+        """
+        Fold an aggregate `(start, n, cpu_sum, cpu_min, cpu_max, ram_sum,
+        ram_min, ram_max)` into the bucket containing `start`.
+        """
+        start = agg[0] - agg[0] % self.seconds
+        if start <= self._open_start:
+            i = (self.total - 1) % self.capacity
+            self.n[i] += agg[1]
+            self.cpu_sum[i] += agg[2]
+            self.cpu_min[i] = min(self.cpu_min[i], agg[3])
+            self.cpu_max[i] = max(self.cpu_max[i], agg[4])
+            self.ram_sum[i] += agg[5]
+            self.ram_min[i] = min(self.ram_min[i], agg[6])
+            self.ram_max[i] = max(self.ram_max[i], agg[7])
+            return
+        i = self.total % self.capacity
+        values = (start,) + tuple(agg[1:])
+        if i == len(self.ts):
+            for name, value in zip(self.COLUMNS, values):
+                getattr(self, name).append(value)
+        else:
+            for name, value in zip(self.COLUMNS, values):
+                getattr(self, name)[i] = value
+        self.total += 1
+        self._open_start = start
+
+    def oldest(self) -> float | None:
+        if not self.total:
+            return None
+        return self.ts[(self.total - len(self)) % self.capacity]
+
+    def read(self, start: float | None = None, end: float | None = None) -> Dict[str, List[float]]:
+        """Columns of the buckets starting in [start, end], oldest first."""
+        n = len(self)
+        first = (self.total - n) % self.capacity
+        ordered = lambda col: col[first:] + col[:first] if first else col  # noqa: E731
+        ts = ordered(self.ts)
+        lo = 0 if start is None else bisect_left(ts, start - start % self.seconds)
+        hi = n if end is None else bisect_right(ts, end)
+        return {name: ordered(getattr(self, name))[lo:hi].tolist() for name in self.COLUMNS}
 
 
 def append_metric_point(deployment_id: int, point: MetricPoint) -> None:
     with _metrics_lock:
-        buf = _deployment_metrics.setdefault(
-            deployment_id, deque(maxlen=METRICS_MAX_POINTS)
-        )
-        buf.append(point)
+        ring = _deployment_metrics.get(deployment_id)
+        if ring is None:
+            ring = _deployment_metrics[deployment_id] = MetricRing()
+        ring.append(_epoch(point.ts), point.cpu, point.ram)
 
 
-def get_metrics(deployment_id: int) -> List[MetricPoint]:
+def append_metric_points(
+    deployment_ids: Sequence[int],
+    ts: datetime,
+    cpu: Sequence[float],
+    ram: Sequence[float],
+) -> None:
+    """Append one point per deployment for the same timestamp under one lock."""
+    epoch = _epoch(ts)
+    now = _now()
+    with _metrics_lock:
+        spill = _closed_buckets
+        for deployment_id, c, r in zip(deployment_ids, cpu, ram):
+            ring = _deployment_metrics.get(deployment_id)
+            if ring is None:
+                ring = _deployment_metrics[deployment_id] = MetricRing()
+            elif ring.capacity < METRICS_MAX_POINTS:
+                # compacted while idle and active again
+                ring.resize(METRICS_MAX_POINTS)
+            ring.written = ring.used = now
+            closed = ring.append(epoch, c, r)
+            if closed is not None and spill is not None:
+                spill.append((deployment_id, closed))
+
+
+def keep_closed_buckets(enabled: bool = True) -> None:
+    """Collect closed base buckets for `take_closed_buckets` (persistence)."""
+    global _closed_buckets
+    with _metrics_lock:
+        _closed_buckets = [] if enabled else None
+
+
+def take_closed_buckets(idle_before: float | None = None) -> List[Tuple[int, ClosedBucket]]:
+    """
+    Hand over the base buckets closed since the last call. Open buckets
+    that ended before `idle_before` (their deployment stopped reporting)
+    are closed first, so their points are not held back indefinitely.
+    """
+    global _closed_buckets
     with _metrics_lock:
-        buf = _deployment_metrics.get(deployment_id)
-        if not buf:
+        if _closed_buckets is None:
             return []
-        return list(buf)
+        if idle_before is not None:
+            for deployment_id, ring in _deployment_metrics.items():
+                if ring._bucket_count and ring._bucket_end <= idle_before:
+                    _closed_buckets.append((deployment_id, ring.close_bucket()))
+        taken, _closed_buckets = _closed_buckets, []
+    return taken
+
+
+@_shared
+def get_metric_series(
+    deployment_id: int, start: int = 0, stop: int | None = None
+) -> Tuple[List[float], List[float], List[float]]:
+    """
+    (ts, cpu, ram) lists for logical positions [start, stop) of the ring,
+    copied straight from the typed arrays into the output lists.
+    """
+    ts: List[float] = []
+    cpu: List[float] = []
+    ram: List[float] = []
+    with _metrics_lock:
+        ring = _deployment_metrics.get(deployment_id)
+        if ring is None:
+            return ts, cpu, ram
+        for ts_mv, cpu_mv, ram_mv in ring.segments(start, stop):
+            ts.extend(ts_mv.tolist())
+            cpu.extend(cpu_mv.tolist())
+            ram.extend(ram_mv.tolist())
+    return ts, cpu, ram
+
+
+@dataclass
+class MetricBatch:
+    """Metric points after a `since` cursor (see `read_metrics_after`)."""
+
+    ts: List[float]
+    cpu: List[float]
+    ram: List[float]
+    # cursor for the next read: number of points ever appended
+    next: int
+    # True when this is the whole buffer rather than a delta after `since`
+    reset: bool = False
 
 
-def get_or_create_metric_state(deployment_id: int) -> Tuple[float, float]:
+@_shared
+def read_metrics_after(deployment_id: int, since: int | None = None) -> MetricBatch:
+    """
+    Points appended after cursor `since` (a previous `next`). If `since` is
+    None, older than the buffer or ahead of it (the process restarted), the
+    whole buffer is returned with `reset` set.
+    """
     with _metrics_lock:
-        if deployment_id not in _metric_state:
-            _metric_state[deployment_id] = (50.0, 50.0)
-        return _metric_state[deployment_id]
+        ring = _deployment_metrics.get(deployment_id)
+        if ring is None:
+            return MetricBatch([], [], [], 0, reset=since != 0)
+        ring.used = _now()
+        oldest = ring.total - len(ring)
+        reset = since is None or not oldest <= since <= ring.total
+        start = 0 if reset else since - oldest
+        ts: List[float] = []
+        cpu: List[float] = []
+        ram: List[float] = []
+        for ts_mv, cpu_mv, ram_mv in ring.segments(start):
+            ts.extend(ts_mv.tolist())
+            cpu.extend(cpu_mv.tolist())
+            ram.extend(ram_mv.tolist())
+        return MetricBatch(ts, cpu, ram, ring.total, reset)
 
 
-def update_metric_state(deployment_id: int, cpu: float, ram: float) -> None:
+@_shared
+def read_metric_range(
+    deployment_id: int, start: float | None = None, end: float | None = None
+) -> MetricBatch:
+    """
+    Buffered points with `start <= ts <= end` (epoch seconds, either bound
+    optional). Timestamps are non-decreasing, so the bounds are found by
+    binary search and only the selected slice is copied.
+    """
     with _metrics_lock:
-        _metric_state[deployment_id] = (cpu, ram)
+        ring = _deployment_metrics.get(deployment_id)
+        if ring is None:
+            return MetricBatch([], [], [], 0, reset=True)
+        ring.used = _now()
+        lo = 0 if start is None else ring.position(start)
+        hi = len(ring) if end is None else ring.position(end, right=True)
+        ts: List[float] = []
+        cpu: List[float] = []
+        ram: List[float] = []
+        for ts_mv, cpu_mv, ram_mv in ring.segments(lo, hi):
+            ts.extend(ts_mv.tolist())
+            cpu.extend(cpu_mv.tolist())
+            ram.extend(ram_mv.tolist())
+        return MetricBatch(ts, cpu, ram, ring.total, reset=True)
+
+
+@dataclass
+class RollupBatch:
+    """Aggregated buckets of one rollup tier (see `read_metric_rollup`)."""
+
+    seconds: int
+    ts: List[float]
+    cpu: List[float]
+    cpu_min: List[float]
+    cpu_max: List[float]
+    ram: List[float]
+    ram_min: List[float]
+    ram_max: List[float]
+    next: int
+
+
+@_shared
+def metric_coverage(deployment_id: int) -> List[Tuple[int, float]]:
+    """
+    (bucket seconds, oldest timestamp held) per resolution, finest first;
+    the raw per-point buffer is reported with 0 seconds.
+    """
+    with _metrics_lock:
+        ring = _deployment_metrics.get(deployment_id)
+        if ring is None or not ring.total:
+            return []
+        raw_oldest = ring.ts[(ring.total - len(ring)) % ring.capacity]
+        tiers = [(0, raw_oldest)]
+        for tier in ring.rollups:
+            # a tier with no closed bucket yet still covers the open one
+            oldest = tier.oldest()
+            tiers.append((tier.seconds, raw_oldest - raw_oldest % tier.seconds if oldest is None else oldest))
+        return tiers
+
+
+@_shared
+def read_metric_rollup(
+    deployment_id: int, seconds: int, start: float | None = None, end: float | None = None
+) -> RollupBatch:
+    """
+    Averages, minimums and maximums per `seconds`-wide bucket starting in
+    [start, end], including the bucket still being filled.
+    """
+    with _metrics_lock:
+        ring = _deployment_metrics.get(deployment_id)
+        tier = next((t for t in ring.rollups if t.seconds == seconds), None) if ring else None
+        if tier is None:
+            return RollupBatch(seconds, [], [], [], [], [], [], [], ring.total if ring else 0)
+        ring.used = _now()
+        cols = tier.read(start, end)
+        pending = ring.open_bucket()
+        cursor = ring.total
+    if pending is not None:
+        bucket = pending[0] - pending[0] % seconds
+        if (start is None or bucket >= start - start % seconds) and (end is None or bucket <= end):
+            _merge_pending(cols, bucket, pending)
+    counts = cols["n"]
+    return RollupBatch(
+        seconds=seconds,
+        ts=cols["ts"],
+        cpu=[s / c for s, c in zip(cols["cpu_sum"], counts)],
+        cpu_min=cols["cpu_min"],
+        cpu_max=cols["cpu_max"],
+        ram=[s / c for s, c in zip(cols["ram_sum"], counts)],
+        ram_min=cols["ram_min"],
+        ram_max=cols["ram_max"],
+        next=cursor,
+    )
+
+
+def _merge_pending(cols: Dict[str, List[float]], bucket: float, agg: Tuple[float, ...]) -> None:
+    if cols["ts"] and cols["ts"][-1] == bucket:
+        cols["n"][-1] += agg[1]
+        cols["cpu_sum"][-1] += agg[2]
+        cols["cpu_min"][-1] = min(cols["cpu_min"][-1], agg[3])
+        cols["cpu_max"][-1] = max(cols["cpu_max"][-1], agg[4])
+        cols["ram_sum"][-1] += agg[5]
+        cols["ram_min"][-1] = min(cols["ram_min"][-1], agg[6])
+        cols["ram_max"][-1] = max(cols["ram_max"][-1], agg[7])
+    else:
+        for name, value in zip(RollupRing.COLUMNS, (bucket,) + agg[1:]):
+            cols[name].append(value)
+
+
+@_shared
+def get_metrics_cursor(deployment_id: int) -> int:
+    """Number of points ever appended for the deployment (its `next` cursor)."""
+    with _metrics_lock:
+        ring = _deployment_metrics.get(deployment_id)
+        return ring.total if ring is not None else 0
+
+
+def get_metrics(deployment_id: int) -> List[MetricPoint]:
+    """Metric points as objects; prefer `get_metric_series` on hot paths."""
+    ts, cpu, ram = get_metric_series(deployment_id)
+    return [
+        MetricPoint(ts=datetime.utcfromtimestamp(t), cpu=c, ram=r)
+        for t, c, r in zip(ts, cpu, ram)
+    ]
+
+
+# --- lifecycle and memory budget -------------------------------------------
+
+
+def configure_limits(
+    idle_compact_seconds: float = DEFAULT_IDLE_COMPACT_SECONDS,
+    memory_budget_bytes: int = DEFAULT_MEMORY_BUDGET_BYTES,
+) -> None:
+    """Set when idle buffers are compacted and the budget for all buffers."""
+    global _idle_compact_seconds, _memory_budget
+    _idle_compact_seconds = idle_compact_seconds
+    _memory_budget = memory_budget_bytes
+
+
+@_shared
+def drop_deployment(deployment_id: int) -> None:
+    """Release everything held for a deleted deployment, on disk too."""
+    with _logs_lock:
+        _deployment_logs.pop(deployment_id, None)
+        _evicted_log_seq.pop(deployment_id, None)
+    logstore.remove(deployment_id)
+    with _metrics_lock:
+        _deployment_metrics.pop(deployment_id, None)
+        if _closed_buckets:
+            _closed_buckets[:] = [b for b in _closed_buckets if b[0] != deployment_id]
+
+
+def _release_metrics(deployment_id: int, ring: MetricRing) -> None:
+    # caller holds _metrics_lock; the open bucket still goes to disk
+    if ring._bucket_count and _closed_buckets is not None:
+        closed = ring.close_bucket()
+        if closed is not None:
+            _closed_buckets.append((deployment_id, closed))
+
+
+def compact_idle(idle_seconds: float | None = None) -> int:
+    """
+    Shrink the buffers of deployments that got no new data for
+    `idle_seconds` (stopped or failed ones) to the newest IDLE_LOG_LINES
+    lines and IDLE_METRIC_POINTS points. Rollup tiers are dropped too when
+    they are persisted. Buffers grow back on the next append. Returns the
+    number of deployments compacted.
+    """
+    cutoff = _now() - (_idle_compact_seconds if idle_seconds is None else idle_seconds)
+    compacted = set()
+    with _logs_lock:
+        for deployment_id, ring in list(_deployment_logs.items()):
+            if ring.written <= cutoff and ring.capacity > IDLE_LOG_LINES:
+                _deployment_logs[deployment_id] = ring.resized(IDLE_LOG_LINES)
+                compacted.add(deployment_id)
+    with _metrics_lock:
+        for deployment_id, ring in _deployment_metrics.items():
+            if ring.written <= cutoff and ring.capacity > IDLE_METRIC_POINTS:
+                _release_metrics(deployment_id, ring)
+                ring.resize(IDLE_METRIC_POINTS)
+                if _closed_buckets is not None:
+                    ring.rollups = tuple(RollupRing(s, b) for s, b in ROLLUP_TIERS)
+                compacted.add(deployment_id)
+    return len(compacted)
+
+
+def _usage() -> Dict[int, List[float]]:
+    """deployment id -> [log bytes, metric bytes, last used]; caller holds both locks."""
+    usage: Dict[int, List[float]] = {}
+    for deployment_id, ring in _deployment_logs.items():
+        usage[deployment_id] = [ring.nbytes, 0, ring.used]
+    for deployment_id, ring in _deployment_metrics.items():
+        entry = usage.setdefault(deployment_id, [0, 0, ring.used])
+        entry[1] = ring.nbytes
+        entry[2] = max(entry[2], ring.used)
+    return usage
+
+
+def enforce_budget(budget_bytes: int | None = None) -> int:
+    """
+    Evict whole deployments, least recently used first, until all buffers
+    fit in `budget_bytes`. Their history stays on disk where persistence is
+    enabled; log numbering carries on. Returns the number evicted.
+    """
+    budget = _memory_budget if budget_bytes is None else budget_bytes
+    evicted = 0
+    with _logs_lock, _metrics_lock:
+        usage = _usage()
+        total = sum(e[0] + e[1] for e in usage.values())
+        if total <= budget:
+            return 0
+        for deployment_id, (log_bytes, metric_bytes, _) in sorted(
+            usage.items(), key=lambda item: item[1][2]
+        ):
+            if total <= budget:
+                break
+            ring = _deployment_logs.pop(deployment_id, None)
+            if ring is not None:
+                _evicted_log_seq[deployment_id] = ring.last_seq
+            metrics = _deployment_metrics.pop(deployment_id, None)
+            if metrics is not None:
+                _release_metrics(deployment_id, metrics)
+            total -= log_bytes + metric_bytes
+            evicted += 1
+    return evicted
+
+
+def maintain_if_due() -> None:
+    """Compact idle buffers and enforce the budget every few seconds (engine)."""
+    global _last_maintenance
+    now = _now()
+    if now - _last_maintenance < MAINTENANCE_INTERVAL_SECONDS:
+        return
+    _last_maintenance = now
+    compact_idle()
+    enforce_budget()
+
+
+@_shared
+def memory_report(top: int = 10) -> Dict[str, Any]:
+    """Approximate memory held by the buffers, with the largest deployments."""
+    now = _now()
+    with _logs_lock, _metrics_lock:
+        usage = _usage()
+    log_bytes = sum(int(e[0]) for e in usage.values())
+    metric_bytes = sum(int(e[1]) for e in usage.values())
+    largest = sorted(usage.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)
+    return {
+        "deployments": len(usage),
+        "log_bytes": log_bytes,
+        "metric_bytes": metric_bytes,
+        "total_bytes": log_bytes + metric_bytes,
+        "budget_bytes": _memory_budget,
+        "idle_compact_seconds": _idle_compact_seconds,
+        "largest": [
+            {
+                "deployment_id": deployment_id,
+                "log_bytes": int(e[0]),
+                "metric_bytes": int(e[1]),
+                "idle_seconds": round(now - e[2], 1),
+            }
+            for deployment_id, e in largest[:top]
+        ],
+    }
 
 
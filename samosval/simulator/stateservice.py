@@ -0,0 +1,268 @@
+"""
+Cross-process access to the simulator state.
+
+`state` keeps runtime logs and metrics in the memory of the process that
+generates them. With STATE_SOCKET configured that process is `flask
+runtime`, which calls `serve()`; every other process (web workers, `flask
+engine` workers) calls `connect()`, after which the @_shared functions of
+`state` forward each call over a Unix stream socket. Requests and replies
+are length-prefixed `marshal` frames carrying the arguments and the slice
+that was asked for, never whole buffers. Each thread keeps its own
+connection, so calls need no locking on the client side.
+
+Live log lines reach other processes over one relay connection per client
+process: `loghub` reports which deployments have local subscribers, the
+owner subscribes to those on its own hub and streams their lines back,
+where they are republished to the local hub.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import logging
+import marshal
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Any, BinaryIO, Dict, Set, Tuple
+
+from . import loghub, state
+
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_SECONDS = 1.0
+
+_HEADER = struct.Struct("!I")
+_RESULT_TYPES = {cls.__name__: cls for cls in (state.LogBatch, state.MetricBatch, state.RollupBatch)}
+
+_server: "_Server | None" = None
+_client: "_Client | None" = None
+
+
+class StateServiceError(RuntimeError):
+    """The state service is unreachable or failed a forwarded call."""
+
+
+def _send(sock: socket.socket, obj: Any) -> None:
+    data = marshal.dumps(obj)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv(rfile: BinaryIO) -> Any:
+    header = rfile.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ConnectionError("state service connection closed")
+    (size,) = _HEADER.unpack(header)
+    data = rfile.read(size)
+    if len(data) < size:
+        raise ConnectionError("state service connection closed")
+    return marshal.loads(data)
+
+
+# --- owner side ----------------------------------------------------------
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            _send(self.request, ("hello", state.INSTANCE_TOKEN))
+            while True:
+                frame = _recv(self.rfile)
+                if frame[0] == "relay":
+                    self._relay()
+                    return
+                _send(self.request, self._call(*frame[1:]))
+        except (ConnectionError, OSError):
+            pass
+
+    @staticmethod
+    def _call(name: str, args: tuple, kwargs: dict) -> Tuple[bool, str, Any]:
+        fn = state.SHARED.get(name)
+        if fn is None:
+            return False, "", f"unknown call {name!r}"
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            logger.exception("state call %s failed", name)
+            return False, "", f"{type(exc).__name__}: {exc}"
+        if dataclasses.is_dataclass(result):
+            fields = tuple(getattr(result, f.name) for f in dataclasses.fields(result))
+            return True, type(result).__name__, fields
+        return True, "", result
+
+    def _relay(self) -> None:
+        """Stream lines of the deployments the client watches until it leaves."""
+        wake = threading.Event()
+        done = threading.Event()
+        lock = threading.Lock()
+        subs: Dict[int, loghub.Subscription] = {}
+
+        def pump() -> None:
+            while not done.is_set():
+                wake.wait()
+                wake.clear()
+                with lock:
+                    current = list(subs.values())
+                frames = []
+                for sub in current:
+                    items, missed = sub.drain()
+                    if items or missed:
+                        frames.append((sub.deployment_id, missed, items))
+                if frames:
+                    try:
+                        _send(self.request, frames)
+                    except OSError:
+                        done.set()
+
+        sender = threading.Thread(target=pump, name="state-relay", daemon=True)
+        sender.start()
+        try:
+            while not done.is_set():
+                op, ids = _recv(self.rfile)
+                with lock:
+                    for deployment_id in ids:
+                        if op == "watch" and deployment_id not in subs:
+                            subs[deployment_id] = loghub.subscribe(deployment_id, waker=wake.set)
+                        elif op == "unwatch" and deployment_id in subs:
+                            loghub.unsubscribe(subs.pop(deployment_id))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            done.set()
+            wake.set()
+            sender.join()
+            with lock:
+                for sub in subs.values():
+                    loghub.unsubscribe(sub)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path: str) -> None:
+    """Own the buffers in this process and answer other processes at `path`."""
+    global _server, _client
+    _client = None
+    loghub.set_watcher(None)
+    state.use_remote(None)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+    _server = _Server(path, _Handler)
+    os.chmod(path, 0o600)
+    threading.Thread(target=_server.serve_forever, name="state-service", daemon=True).start()
+
+
+def close() -> None:
+    global _server
+    if _server is None:
+        return
+    path = _server.server_address
+    _server.shutdown()
+    _server.server_close()
+    _server = None
+    if path and os.path.exists(path):
+        os.unlink(path)
+
+
+# --- client side ---------------------------------------------------------
+
+
+class _Client:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._relay_lock = threading.Lock()
+        self._relay_sock: socket.socket | None = None
+        self._relay_pid: int | None = None
+        self._watched: Set[int] = set()
+
+    def _open(self) -> Tuple[socket.socket, BinaryIO]:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError as exc:
+            sock.close()
+            raise StateServiceError(f"state service at {self.path} is unavailable: {exc}") from exc
+        rfile = sock.makefile("rb")
+        _, token = _recv(rfile)
+        # cursors restart with the owner; ETags follow its token
+        state.use_remote(self.call, token)
+        return sock, rfile
+
+    def call(self, name: str, args: tuple, kwargs: dict) -> Any:
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            # a forked child must not share its parent's socket
+            if conn is None or conn[2] != os.getpid():
+                conn = self._local.conn = self._open() + (os.getpid(),)
+            sock, rfile, _ = conn
+            try:
+                _send(sock, ("call", name, args, kwargs))
+                ok, kind, value = _recv(rfile)
+                break
+            except (ConnectionError, OSError):
+                # the owner restarted: reconnect once
+                self._local.conn = None
+                sock.close()
+                if attempt:
+                    raise StateServiceError(f"state service at {self.path} went away")
+        if not ok:
+            raise StateServiceError(value)
+        return _RESULT_TYPES[kind](*value) if kind else value
+
+    def watch(self, deployment_id: int, on: bool) -> None:
+        """loghub watcher: (un)subscribe the relay for a deployment."""
+        with self._relay_lock:
+            if on:
+                self._watched.add(deployment_id)
+            else:
+                self._watched.discard(deployment_id)
+            if self._relay_pid != os.getpid():
+                self._relay_pid = os.getpid()
+                self._relay_sock = None
+                threading.Thread(target=self._run_relay, name="state-relay", daemon=True).start()
+            elif self._relay_sock is not None:
+                try:
+                    _send(self._relay_sock, ("watch" if on else "unwatch", [deployment_id]))
+                except OSError:
+                    pass  # the relay thread reconnects and resends the watch set
+
+    def _run_relay(self) -> None:
+        while True:
+            sock = None
+            try:
+                sock, rfile = self._open()
+                with self._relay_lock:
+                    _send(sock, ("relay",))
+                    _send(sock, ("watch", sorted(self._watched)))
+                    self._relay_sock = sock
+                while True:
+                    for deployment_id, missed, items in _recv(rfile):
+                        if missed:
+                            loghub.report_missed(deployment_id, missed)
+                        for seq, line, level in items:
+                            loghub.publish(deployment_id, seq, line, level)
+            except (ConnectionError, OSError, StateServiceError) as exc:
+                logger.warning("log relay from the state service lost: %s", exc)
+            with self._relay_lock:
+                self._relay_sock = None
+            if sock is not None:
+                sock.close()
+            time.sleep(RECONNECT_SECONDS)
+
+
+def connect(path: str) -> None:
+    """Read and write the state owned by the process serving `path`."""
+    global _client
+    _client = _Client(path)
+    state.use_remote(_client.call)
+    for deployment_id in loghub.set_watcher(_client.watch):
+        _client.watch(deployment_id, True)
+
+
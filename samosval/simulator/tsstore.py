@@ -0,0 +1,290 @@
+"""
+On-disk time-series store for deployment metrics.
+
+The in-memory rings in `state` keep the recent window. Whenever a
+one-minute base bucket closes, its raw points and its rollup row are queued
+there and written here by `flush()` in one transaction. The store is a
+separate SQLite file so its write volume never contends with the main
+database:
+
+* `metric_chunks` — one row per deployment and minute with the raw points
+  packed into float32 blobs (time offsets from the minute start, CPU, RAM);
+* `metric_rollups` — one row per deployment and minute with count, sum,
+  min and max; hourly rows are aggregated from these on read.
+
+`prune()` enforces the retention of both tables. Reads return the same
+column layout as the in-memory tiers so callers can splice both.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Tuple
+
+from . import clock, state
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_chunks (
+    deployment_id INTEGER NOT NULL,
+    start_ts INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    offsets BLOB NOT NULL,
+    cpu BLOB NOT NULL,
+    ram BLOB NOT NULL,
+    PRIMARY KEY (deployment_id, start_ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS metric_rollups (
+    deployment_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    cpu_sum REAL NOT NULL,
+    cpu_min REAL NOT NULL,
+    cpu_max REAL NOT NULL,
+    ram_sum REAL NOT NULL,
+    ram_min REAL NOT NULL,
+    ram_max REAL NOT NULL,
+    PRIMARY KEY (deployment_id, ts)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_metric_chunks_start ON metric_chunks(start_ts);
+CREATE INDEX IF NOT EXISTS idx_metric_rollups_ts ON metric_rollups(ts);
+"""
+
+DEFAULT_RAW_RETENTION_HOURS = 24
+DEFAULT_ROLLUP_RETENTION_DAYS = 30
+FLUSH_INTERVAL_SECONDS = 10
+PRUNE_INTERVAL_SECONDS = 600
+# payload columns of rollup resolutions (averages plus extremes)
+ROLLUP_COLUMNS = ("ts", "cpu", "cpu_min", "cpu_max", "ram", "ram_min", "ram_max")
+
+_path: str | None = None
+_raw_retention = DEFAULT_RAW_RETENTION_HOURS * 3600
+_rollup_retention = DEFAULT_ROLLUP_RETENTION_DAYS * 86400
+_local = threading.local()
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+_last_prune = 0.0
+
+
+def configure(
+    path: str | None,
+    raw_retention_hours: int = DEFAULT_RAW_RETENTION_HOURS,
+    rollup_retention_days: int = DEFAULT_ROLLUP_RETENTION_DAYS,
+) -> None:
+    """Set the store file (None disables persistence) and retention."""
+    global _path, _raw_retention, _rollup_retention
+    _path = path
+    _raw_retention = raw_retention_hours * 3600
+    _rollup_retention = rollup_retention_days * 86400
+    if path is not None:
+        _connect().executescript(SCHEMA)
+
+
+def enabled() -> bool:
+    return _path is not None
+
+
+def _connect() -> sqlite3.Connection:
+    db = getattr(_local, "db", None)
+    if db is None or getattr(_local, "path", None) != _path:
+        db = sqlite3.connect(_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        _local.db, _local.path = db, _path
+    return db
+
+
+def flush_if_due() -> int:
+    """Write closed buckets every FLUSH_INTERVAL_SECONDS; prune occasionally."""
+    global _last_flush, _last_prune
+    now = clock.get_clock().monotonic()
+    if not enabled() or now - _last_flush < FLUSH_INTERVAL_SECONDS:
+        return 0
+    _last_flush = now
+    written = flush()
+    if now - _last_prune >= PRUNE_INTERVAL_SECONDS:
+        _last_prune = now
+        prune()
+    return written
+
+
+def flush(close_open: bool = False) -> int:
+    """
+    Persist every closed bucket in one transaction; return the count. With
+    `close_open` (shutdown) the buckets still being filled are written too.
+    """
+    if not enabled():
+        return 0
+    with _flush_lock:
+        # otherwise only buckets whose deployment stopped reporting a minute ago
+        idle_before = float("inf") if close_open else clock.timestamp() - state.ROLLUP_TIERS[0][0]
+        buckets = state.take_closed_buckets(idle_before=idle_before)
+        if not buckets:
+            return 0
+        chunks = []
+        rollups = []
+        for deployment_id, b in buckets:
+            start = int(b.agg[0] - b.agg[0] % state.ROLLUP_TIERS[0][0])
+            chunks.append(
+                (
+                    deployment_id,
+                    start,
+                    len(b.ts),
+                    array("f", [t - start for t in b.ts]).tobytes(),
+                    array("f", b.cpu).tobytes(),
+                    array("f", b.ram).tobytes(),
+                )
+            )
+            rollups.append((deployment_id, start) + tuple(b.agg[1:]))
+        db = _connect()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO metric_chunks VALUES (?, ?, ?, ?, ?, ?)", chunks
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO metric_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rollups,
+            )
+        return len(buckets)
+
+
+def prune(now: float | None = None) -> None:
+    """Drop raw chunks and rollups older than their retention."""
+    if not enabled():
+        return
+    now = clock.timestamp() if now is None else now
+    db = _connect()
+    with db:
+        db.execute("DELETE FROM metric_chunks WHERE start_ts < ?", (int(now - _raw_retention),))
+        db.execute("DELETE FROM metric_rollups WHERE ts < ?", (int(now - _rollup_retention),))
+
+
+def delete(deployment_id: int) -> None:
+    """Drop all stored history of a deployment."""
+    if not enabled():
+        return
+    db = _connect()
+    with db:
+        db.execute("DELETE FROM metric_chunks WHERE deployment_id = ?", (deployment_id,))
+        db.execute("DELETE FROM metric_rollups WHERE deployment_id = ?", (deployment_id,))
+
+
+def oldest(deployment_id: int, seconds: int) -> float | None:
+    """Oldest timestamp stored for the deployment at a resolution (0 = raw)."""
+    if not enabled():
+        return None
+    if seconds:
+        sql = "SELECT MIN(ts) FROM metric_rollups WHERE deployment_id = ?"
+    else:
+        sql = "SELECT MIN(start_ts) FROM metric_chunks WHERE deployment_id = ?"
+    row = _connect().execute(sql, (deployment_id,)).fetchone()
+    return None if row[0] is None else float(row[0])
+
+
+def read_raw(deployment_id: int, start: float | None, end: float | None) -> Dict[str, List[float]]:
+    """Raw points with start <= ts < end."""
+    cols: Dict[str, List[float]] = {"ts": [], "cpu": [], "ram": []}
+    if not enabled():
+        return cols
+    lo = -1 if start is None else int(start - start % 60)
+    hi = float("inf") if end is None else end
+    rows = _connect().execute(
+        """
+        SELECT start_ts, offsets, cpu, ram
+          FROM metric_chunks
+         WHERE deployment_id = ? AND start_ts >= ? AND start_ts < ?
+         ORDER BY start_ts
+        """,
+        (deployment_id, lo, hi),
+    )
+    for start_ts, offsets, cpu, ram in rows:
+        ts = [start_ts + o for o in array("f", offsets)]
+        cpu_v = array("f", cpu).tolist()
+        ram_v = array("f", ram).tolist()
+        for t, c, r in zip(ts, cpu_v, ram_v):
+            if (start is None or t >= start) and t < hi:
+                cols["ts"].append(t)
+                cols["cpu"].append(c)
+                cols["ram"].append(r)
+    return cols
+
+
+def read_rollups(
+    deployment_id: int, seconds: int, start: float | None, end: float | None
+) -> Dict[str, List[float]]:
+    """
+    Per-bucket averages, minimums and maximums (the payload columns) for
+    `seconds`-wide buckets starting in [start, end), from the minute rows.
+    """
+    cols: Dict[str, List[float]] = {name: [] for name in ROLLUP_COLUMNS}
+    if not enabled():
+        return cols
+    lo = -1 if start is None else int(start - start % seconds)
+    hi = float("inf") if end is None else end
+    rows = _connect().execute(
+        """
+        SELECT ts - ts % :seconds AS bucket,
+               SUM(cpu_sum) / SUM(n), MIN(cpu_min), MAX(cpu_max),
+               SUM(ram_sum) / SUM(n), MIN(ram_min), MAX(ram_max)
+          FROM metric_rollups
+         WHERE deployment_id = :id AND ts >= :lo AND ts < :hi
+         GROUP BY bucket
+         ORDER BY bucket
+        """,
+        {"seconds": seconds, "id": deployment_id, "lo": lo, "hi": hi},
+    )
+    for row in rows:
+        for name, value in zip(ROLLUP_COLUMNS, row):
+            cols[name].append(float(value))
+    return cols
+
+
+def coverage(deployment_id: int) -> List[Tuple[int, float]]:
+    """
+    (bucket seconds, oldest timestamp) per resolution across memory and
+    disk, finest first; 0 seconds is the raw series.
+    """
+    memory = dict(state.metric_coverage(deployment_id))
+    result = []
+    for seconds in [0] + [s for s, _ in state.ROLLUP_TIERS]:
+        disk = oldest(deployment_id, seconds)
+        if disk is not None and seconds:
+            disk -= disk % seconds
+        known = [v for v in (memory.get(seconds), disk) if v is not None]
+        if known:
+            result.append((seconds, min(known)))
+    return result
+
+
+def read_range(
+    deployment_id: int, seconds: int, start: float | None, end: float | None
+) -> Tuple[Dict[str, List[float]], int]:
+    """
+    Payload columns for [start, end] at a resolution (0 = raw) and the
+    live `next` cursor. The part older than the in-memory window comes from
+    disk; the rest from the rings. Without `start` only memory is read.
+    """
+    if seconds:
+        batch = state.read_metric_rollup(deployment_id, seconds, start, end)
+        memory = {name: getattr(batch, name) for name in ROLLUP_COLUMNS}
+    else:
+        batch = state.read_metric_range(deployment_id, start, end)
+        memory = {"ts": batch.ts, "cpu": batch.cpu, "ram": batch.ram}
+    if start is None or not enabled():
+        return memory, batch.next
+
+    memory_oldest = dict(state.metric_coverage(deployment_id)).get(seconds)
+    if memory_oldest is not None and start >= memory_oldest:
+        return memory, batch.next
+    disk_end = memory_oldest if end is None else min(end, memory_oldest or end)
+    if seconds:
+        disk = read_rollups(deployment_id, seconds, start, disk_end)
+    else:
+        disk = read_raw(deployment_id, start, disk_end)
+    return {name: disk[name] + memory[name] for name in memory}, batch.next
+
+
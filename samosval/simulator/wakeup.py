@@ -0,0 +1,112 @@
+"""
+Wakeup channel for the simulation engine.
+
+Routes that queue work for the engine (new builds, deployments that start
+or restart, commit hooks) call `notify()` after committing, and the engine
+blocks in `wait()` instead of polling the database on a fixed interval.
+
+Within one process this is a plain `threading.Event`. Engines running as
+separate worker processes (`flask engine`) additionally `listen()` on a
+Unix datagram socket in the shared wakeup directory, and `notify()` sends
+a one-byte datagram to every such socket.
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+import select
+import socket
+import threading
+
+
+_event = threading.Event()
+_socket_dir: str | None = None
+_listen_sock: socket.socket | None = None
+
+
+def configure(socket_dir: str | None) -> None:
+    """Set the directory where engine worker processes listen for wakeups."""
+    global _socket_dir
+    _socket_dir = socket_dir
+
+
+def listen() -> None:
+    """Receive cross-process wakeups in this process (engine workers only)."""
+    global _listen_sock
+    if _socket_dir is None or not hasattr(socket, "AF_UNIX") or _listen_sock is not None:
+        return
+    os.makedirs(_socket_dir, exist_ok=True)
+    path = os.path.join(_socket_dir, f"engine-{os.getpid()}.sock")
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    sock.setblocking(False)
+    _listen_sock = sock
+
+
+def close() -> None:
+    global _listen_sock
+    if _listen_sock is None:
+        return
+    path = _listen_sock.getsockname()
+    _listen_sock.close()
+    _listen_sock = None
+    if path and os.path.exists(path):
+        os.unlink(path)
+
+
+def _notify_peers() -> None:
+    if _socket_dir is None or not hasattr(socket, "AF_UNIX"):
+        return
+    paths = glob.glob(os.path.join(_socket_dir, "engine-*.sock"))
+    if not paths:
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        for path in paths:
+            try:
+                sock.sendto(b"!", path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # worker is gone; drop its stale socket file
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                # receiver buffer full: it already has wakeups pending
+                pass
+
+
+def notify() -> None:
+    """Tell the engine there is new work to look at."""
+    _event.set()
+    _notify_peers()
+
+
+def _drain() -> None:
+    try:
+        while _listen_sock.recv(64):
+            pass
+    except (BlockingIOError, OSError):
+        pass
+
+
+def wait(timeout: float | None) -> bool:
+    """
+    Block until `notify()` is called or `timeout` seconds pass.
+
+    Returns True if woken by a notification. The pending flag is cleared, so
+    notifications posted while the engine was busy are not lost but are
+    coalesced into a single wakeup.
+    """
+    if _listen_sock is not None:
+        readable, _, _ = select.select([_listen_sock], [], [], timeout)
+        woken = bool(readable) or _event.is_set()
+        if readable:
+            _drain()
+    else:
+        woken = _event.wait(timeout)
+    _event.clear()
+    return woken
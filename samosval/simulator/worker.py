@@ -0,0 +1,109 @@
+"""
+`flask engine` command: run lifecycle engines as dedicated worker processes.
+
+Web processes started with SAMOSVAL_ENGINE=runtime then only generate
+runtime logs/metrics, while builds and deployments are advanced by these
+workers. Work is split between worker processes through row leases.
+
+`flask runtime` runs the one engine generating runtime logs/metrics and
+serves them over STATE_SOCKET, so any number of web workers (started with
+SAMOSVAL_ENGINE=off and the same socket) read the same buffers.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import signal
+
+import click
+from flask import current_app
+
+from . import logstore, stateservice, wakeup
+from .engine import SimulationEngine
+
+
+def _run_engine(app) -> None:
+    engine = SimulationEngine(app, lifecycle=True, runtime=False)
+    wakeup.listen()
+    # Let the loop finish its tick and release leases instead of dying mid-write.
+    signal.signal(signal.SIGTERM, lambda *_: engine.stop())
+    signal.signal(signal.SIGINT, lambda *_: engine.stop())
+    try:
+        engine.run()
+    finally:
+        wakeup.close()
+
+
+def _stop_inline(app) -> None:
+    # An engine started by create_app() in this CLI process would compete
+    # with the workers for no benefit.
+    inline = app.extensions.get("samosval_engine")
+    if inline is not None:
+        inline.stop()
+        inline.join(timeout=5)
+        if inline.runtime:
+            # even if it did not finish in time, stop writing runtime logs
+            logstore.enable_writes(False)
+
+
+@click.command("engine")
+@click.option(
+    "--processes",
+    "-p",
+    default=1,
+    show_default=True,
+    help="Number of engine worker processes.",
+)
+def engine_command(processes: int) -> None:
+    """Run the simulation engine in the foreground."""
+    app = current_app._get_current_object()
+    _stop_inline(app)
+
+    if processes <= 1:
+        _run_engine(app)
+        return
+
+    ctx = multiprocessing.get_context("fork")
+    procs = [
+        ctx.Process(target=_run_engine, args=(app,), name=f"samosval-engine-{i}")
+        for i in range(processes)
+    ]
+    for proc in procs:
+        proc.start()
+    click.echo(f"Started {processes} engine workers: {', '.join(str(p.pid) for p in procs)}")
+    # Children stop on SIGINT/SIGTERM themselves; the parent just waits for them.
+    signal.signal(signal.SIGINT, lambda *_: [p.terminate() for p in procs])
+    signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in procs])
+    for proc in procs:
+        proc.join()
+
+
+@click.command("runtime")
+@click.option(
+    "--lifecycle/--no-lifecycle",
+    default=False,
+    show_default=True,
+    help="Also advance builds and deployments in this process.",
+)
+def runtime_command(lifecycle: bool) -> None:
+    """Generate runtime logs/metrics and serve them to other processes."""
+    app = current_app._get_current_object()
+    path = app.config.get("STATE_SOCKET")
+    if not path:
+        raise click.UsageError("set SAMOSVAL_STATE_SOCKET to the socket path to serve")
+    _stop_inline(app)
+
+    stateservice.serve(path)
+    engine = SimulationEngine(app, lifecycle=lifecycle, runtime=True)
+    if lifecycle:
+        wakeup.listen()
+    signal.signal(signal.SIGTERM, lambda *_: engine.stop())
+    signal.signal(signal.SIGINT, lambda *_: engine.stop())
+    click.echo(f"Serving simulator state on {path}")
+    try:
+        engine.run()
+    finally:
+        stateservice.close()
+        wakeup.close()
+
+
@@ -1,6 +1,6 @@
 // SSE logs for deployment detail.
 // Exposes global function: window.initDeploymentLogsSSE(config)
-// config: { deploymentId, sseUrl, logElementId, toggleId }
+// config: { deploymentId, sseUrl, lastSeq, logElementId, toggleId }
 
 (function () {
     function initDeploymentLogsSSE(config) {
@@ -11,19 +11,32 @@
         }
 
         var es = null;
+        // sequence number of the last line shown; the stream resumes after it
+        var lastSeq = config.lastSeq || 0;
+
+        function appendLine(text) {
+            if (logEl.textContent && !logEl.textContent.endsWith('\n')) {
+                logEl.textContent += '\n';
+            }
+            logEl.textContent += text + '\n';
+            logEl.scrollTop = logEl.scrollHeight;
+        }
 
         function start() {
             if (es || !toggle.checked) return;
-            es = new EventSource(config.sseUrl);
+            var sep = config.sseUrl.indexOf('?') === -1 ? '?' : '&';
+            es = new EventSource(config.sseUrl + sep + 'after=' + lastSeq);
             es.onmessage = function (evt) {
+                if (evt.lastEventId) {
+                    lastSeq = parseInt(evt.lastEventId, 10) || lastSeq;
+                }
                 var text = evt.data || '';
                 if (!text) return;
-                if (logEl.textContent && !logEl.textContent.endsWith('\n')) {
-                    logEl.textContent += '\n';
-                }
-                logEl.textContent += text + '\n';
-                logEl.scrollTop = logEl.scrollHeight;
+                appendLine(text);
             };
+            es.addEventListener('gap', function (evt) {
+                appendLine('... пропущено строк: ' + evt.data + ' ...');
+            });
             es.onerror = function () {
                 // restart later
                 stop();
@@ -1,6 +1,6 @@
 // Графики метрик для страницы развёртывания (CPU/RAM)
 // Глобальная функция: window.initDeploymentMetrics(config)
-// config: { deploymentId, metricsUrl, cpuCanvasId, ramCanvasId, refreshIntervalMs }
+// config: { deploymentId, metricsUrl, cpuCanvasId, ramCanvasId, refreshIntervalMs, maxPoints }
 
 (function () {
     function createLineChart(ctx, label, color) {
@@ -49,16 +49,54 @@
         var cpuChart = createLineChart(cpuCtx, 'CPU, %', '#ff5252');
         var ramChart = createLineChart(ramCtx, 'RAM, %', '#64b5f6');
 
+        var maxPoints = config.maxPoints || 900;
+        var since = null;   // cursor: `next` from the last response
+        var etag = null;
+
+        function label(ts) {
+            // сервер отдаёт epoch-секунды (UTC)
+            return new Date(ts * 1000).toISOString().substring(11, 19);
+        }
+
+        function apply(chart, labels, values, reset) {
+            var data = chart.data;
+            if (reset) {
+                data.labels = labels.slice();
+                data.datasets[0].data = values.slice();
+            } else {
+                Array.prototype.push.apply(data.labels, labels);
+                Array.prototype.push.apply(data.datasets[0].data, values);
+            }
+            var extra = data.labels.length - maxPoints;
+            if (extra > 0) {
+                data.labels.splice(0, extra);
+                data.datasets[0].data.splice(0, extra);
+            }
+            chart.update('none');
+        }
+
         function refresh() {
-            fetch(config.metricsUrl)
-                .then(function (r) { return r.json(); })
+            var url = config.metricsUrl;
+            if (since !== null) {
+                url += (url.indexOf('?') === -1 ? '?' : '&') + 'since=' + since;
+            }
+            var headers = {};
+            if (etag) {
+                headers['If-None-Match'] = etag;
+            }
+            fetch(url, { headers: headers, cache: 'no-store' })
+                .then(function (r) {
+                    if (r.status === 304 || !r.ok) return null;
+                    etag = r.headers.get('ETag');
+                    return r.json();
+                })
                 .then(function (data) {
-                    cpuChart.data.labels = data.labels;
-                    cpuChart.data.datasets[0].data = data.cpu;
-                    ramChart.data.labels = data.labels;
-                    ramChart.data.datasets[0].data = data.ram;
-                    cpuChart.update('none');
-                    ramChart.update('none');
+                    if (!data) return;
+                    since = data.next;
+                    if (!data.reset && !data.ts.length) return;
+                    var labels = data.ts.map(label);
+                    apply(cpuChart, labels, data.cpu, data.reset);
+                    apply(ramChart, labels, data.ram, data.reset);
                 })
                 .catch(function () { /* ignore errors */ })
                 .finally(function () {
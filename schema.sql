@@ -1,5 +1,8 @@
 PRAGMA foreign_keys = ON;
 
+-- Indexes and later schema changes are versioned migrations in
+-- samosval/db.py (MIGRATIONS), applied on startup.
+
 -- Users
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -56,11 +59,27 @@ CREATE TABLE IF NOT EXISTS builds (
     error_message TEXT,
     built_by INTEGER NOT NULL,
     created_at TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    worker_slot INTEGER,
+    started_at TEXT,
+    finished_at TEXT,
+    lease_owner TEXT,
+    lease_expires_at TEXT,
     FOREIGN KEY (request_id) REFERENCES image_requests (id),
     FOREIGN KEY (image_id) REFERENCES images (id),
     FOREIGN KEY (built_by) REFERENCES users (id)
 );
 
+-- Build log chunks (append-only, ordered by seq within a build)
+CREATE TABLE IF NOT EXISTS build_log_chunks (
+    build_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (build_id, seq),
+    FOREIGN KEY (build_id) REFERENCES builds (id)
+);
+
 -- Deployments
 CREATE TABLE IF NOT EXISTS deployments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -74,6 +93,8 @@ CREATE TABLE IF NOT EXISTS deployments (
     needs_restart INTEGER NOT NULL,
     created_at TEXT NOT NULL,
     updated_at TEXT NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at TEXT,
     FOREIGN KEY (image_id) REFERENCES images (id)
 );
 
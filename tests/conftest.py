@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Bare app (no blueprints, no engine) whose DATABASE is a temp file."""
+    app = Flask(__name__, root_path=ROOT)
+    app.config["DATABASE"] = str(tmp_path / "samosval.sqlite3")
+    with app.app_context():
+        yield app
+
+
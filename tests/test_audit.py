@@ -0,0 +1,49 @@
+import os
+
+from samosval import audit
+from samosval import db as dbm
+
+
+def _fill(db, count):
+    dbm.insert_audit_rows(
+        db, [(None, "test", i, "details", "2020-01-01T00:00:00") for i in range(count)]
+    )
+    db.commit()
+
+
+def test_engine_archiving_is_capped_per_pass(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(audit, "ARCHIVE_BATCH_ROWS", 10)
+    monkeypatch.setattr(audit, "_last_archive", None)
+    dbm.init_db()
+    db = dbm.connect(app.config["DATABASE"])
+    _fill(db, 45)
+    archive_dir = str(tmp_path / "archive")
+    cap = audit.ARCHIVE_ENGINE_BATCHES * audit.ARCHIVE_BATCH_ROWS
+
+    moved = []
+    while True:
+        count = audit.archive_if_due(db, archive_dir, retention_days=1)
+        if not count:
+            break
+        assert count <= cap
+        moved.append(count)
+    assert sum(moved) == 45
+    assert db.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0] == 0
+    # the drained pass waits for the next interval
+    _fill(db, 1)
+    assert audit.archive_if_due(db, archive_dir, retention_days=1) == 0
+
+    rows, _ = audit.search_archive(archive_dir, "all", limit=100)
+    assert len(rows) == 45
+    assert audit.archive_months(archive_dir) == ["2020-01"]
+    assert os.path.exists(audit.archive_path(archive_dir, "2020-01"))
+
+
+def test_archive_command_path_is_unbounded(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(audit, "ARCHIVE_BATCH_ROWS", 10)
+    dbm.init_db()
+    db = dbm.connect(app.config["DATABASE"])
+    _fill(db, 45)
+    assert audit.archive(db, str(tmp_path / "archive"), "2021-01-01T00:00:00") == 45
+
+
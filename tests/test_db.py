@@ -0,0 +1,73 @@
+import os
+import sqlite3
+
+from samosval import db as dbm
+
+BASELINE_SCHEMA = os.path.join(os.path.dirname(__file__), "baseline_schema.sql")
+
+
+def _indexes(db):
+    return {r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_hot_queries_use_their_indexes(app):
+    dbm.init_db()
+    db = dbm.connect(app.config["DATABASE"])
+    assert db.execute("PRAGMA user_version").fetchone()[0] == len(dbm.MIGRATIONS)
+    assert dbm.check_query_plans(db) == []
+
+
+def test_migrates_baseline_schema(tmp_path):
+    path = str(tmp_path / "baseline.sqlite3")
+    db = sqlite3.connect(path)
+    with open(BASELINE_SCHEMA) as f:
+        db.executescript(f.read())
+    db.close()
+
+    db = dbm.connect(path)
+    assert db.execute("PRAGMA user_version").fetchone()[0] == 0
+    assert dbm.migrate(db) == len(dbm.MIGRATIONS)
+    assert db.execute("PRAGMA user_version").fetchone()[0] == len(dbm.MIGRATIONS)
+    for table, columns in dbm._ADDED_COLUMNS.items():
+        existing = {r["name"] for r in db.execute(f"PRAGMA table_info({table})")}
+        assert {name for name, _ in columns} <= existing
+    assert {index for _, index in dbm.QUERY_PLAN_CHECKS} <= _indexes(db)
+    assert dbm.check_query_plans(db) == []
+
+
+def test_migrate_is_idempotent(app):
+    dbm.init_db()
+    db = dbm.connect(app.config["DATABASE"])
+    schema = sorted(tuple(r) for r in db.execute("SELECT type, name, sql FROM sqlite_master"))
+    assert dbm.migrate(db) == len(dbm.MIGRATIONS)
+    dbm.init_db()
+    assert db.execute("PRAGMA user_version").fetchone()[0] == len(dbm.MIGRATIONS)
+    assert sorted(tuple(r) for r in db.execute("SELECT type, name, sql FROM sqlite_master")) == schema
+
+
+
+
+def test_audit_batch_with_permanent_error_is_dropped(tmp_path):
+    # no audit_log table: no retry can ever write these rows
+    writer = dbm._AuditWriter(str(tmp_path / "empty.sqlite3"))
+    writer._pending = [(None, "test", None, "details", "2024-01-01T00:00:00")]
+    assert writer.flush() == 0
+    assert writer._pending == []
+
+
+def test_flush_audit_keeps_busy_batch_queued(app, monkeypatch):
+    def locked(db, rows):
+        raise sqlite3.OperationalError("database is locked")
+
+    dbm.init_db()
+    writer = dbm._AuditWriter(app.config["DATABASE"])
+    rows = [(None, "test", None, "details", "2024-01-01T00:00:00")]
+    writer._pending = list(rows)
+    monkeypatch.setattr(dbm, "_commit_audit_rows", locked)
+    monkeypatch.setitem(dbm._audit_writers, writer.path, writer)
+    assert dbm.flush_audit() == 0
+    assert writer._pending == rows
+    monkeypatch.undo()
+    assert writer.flush() == 1
+
+
@@ -0,0 +1,15 @@
+import pytest
+
+from samosval.simulator import downsample
+
+
+@pytest.mark.parametrize("algorithm", downsample.ALGORITHMS)
+@pytest.mark.parametrize("max_points", [3, 4, 5, 10, 100])
+def test_select_returns_at_most_max_points(algorithm, max_points):
+    xs = list(range(1000))
+    ys = ([float(i % 7) for i in xs], [float(i % 13) for i in xs])
+    picked = downsample.select(xs, ys, max_points, algorithm)
+    assert len(picked) <= max_points
+    assert picked == sorted(set(picked))
+
+
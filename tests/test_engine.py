@@ -0,0 +1,30 @@
+from samosval import db as dbm
+from samosval.simulator.engine import DEFAULT_MAX_DEPLOYMENTS_PER_TICK, SimulationEngine
+
+NOW = "2024-01-01T00:00:00"
+
+
+def _deploying(db, count):
+    db.executemany(
+        "INSERT INTO deployments (image_id, name, environment, status, replicas, ports,"
+        " stopped_by_operator, needs_restart, created_at, updated_at)"
+        " VALUES (1, ?, 'dev', 'deploying', 1, '', 0, 0, ?, ?)",
+        [(f"d{i}", NOW, NOW) for i in range(count)],
+    )
+    db.commit()
+
+
+def test_tick_fills_its_cap_and_reports_the_rest_as_backlog(app):
+    dbm.init_db()
+    db = dbm.get_db()
+    _deploying(db, 1000)
+    engine = SimulationEngine(app, lifecycle=True, runtime=False)
+
+    engine._step_lifecycle()
+    # finished deployments drop their lease; the rest of the cap stays leased
+    handled = db.execute(
+        "SELECT COUNT(*) FROM deployments WHERE status != 'deploying' OR lease_owner = ?",
+        (engine._lease_owner(),),
+    ).fetchone()[0]
+    assert handled == DEFAULT_MAX_DEPLOYMENTS_PER_TICK
+    assert engine.last_report.backlog_deployments == 1000 - DEFAULT_MAX_DEPLOYMENTS_PER_TICK
@@ -0,0 +1,15 @@
+from samosval import payloads
+
+
+def test_poll_etag_ignores_since():
+    first = payloads._metrics_etag(1, payloads.MetricsQuery(), 5)
+    poll = payloads._metrics_etag(1, payloads.MetricsQuery(since=5), 5)
+    assert poll == first
+    assert payloads._metrics_etag(1, payloads.MetricsQuery(since=5), 6) != first
+
+
+def test_range_etag_depends_on_the_range():
+    a = payloads._metrics_etag(1, payloads.MetricsQuery(start=0.0, max_points=10), 5)
+    b = payloads._metrics_etag(1, payloads.MetricsQuery(start=0.0, max_points=20), 5)
+    assert a != b
+    assert a != payloads._metrics_etag(1, payloads.MetricsQuery(), 5)